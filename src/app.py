@@ -1,8 +1,10 @@
 import sys
+import multiprocessing
 from gui import crypto_disco
 from PySide6.QtWidgets import QApplication
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # ECC worker processes re-enter here in the compiled binary
     print("Starting Crypto Disco . . .")
     app = QApplication(sys.argv)
     window = crypto_disco(app)
@@ -1,7 +1,14 @@
-from PySide6.QtCore import QRunnable, Slot, QObject, Signal
+from PySide6.QtCore import QRunnable, Slot, QObject, Signal, QThread
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import json
+import time
 import os
 import ecc
+import ecc_cache
+import recovery
 import utils
+import config
 import traceback
 
 class EccWorker(QRunnable):
@@ -11,47 +18,171 @@ class EccWorker(QRunnable):
         self.signals = EccWorkerSignals()
         self.this_dir = os.path.dirname(__file__)
         self.working_dir = os.path.join(self.this_dir, "crypto-disco-ecc-files")
-        self.current_file = None
+        # ECC of the files of previous runs and of the split ZIP parts, see ecc_cache
+        self.cache = ecc_cache.EccCache()
+        self.current_files = [] # files being encoded
+        self.lock = threading.Lock()
         self.shutdown = False # change to True to shutdown at next opportunity
         if not os.path.exists(self.working_dir):
             os.makedirs(self.working_dir)
     @Slot()
     def run(self):
         '''
+        Several files are encoded at the same time (config.ecc_concurrent_files), their ranges of blocks are computed by
+        a pool of processes shared between them. With config.ecc_archive_name, all the files go into a single database.
         References
         ----------
         - https://github.com/hammad93/crypto-disco/issues/4
         - https://github.com/lrq3000/pyFileFixity/blob/496b0518ebd51cdcd594fcd63a85066a13d1921c/pyFileFixity/structural_adaptive_ecc.py#L335
         '''
-        # create current run dir path
-        run_dir = os.path.join(self.working_dir, utils.datetime_str())
+        # create current run dir path, or resume the previous run if it was interrupted
+        run_dir = self.resumable_run_dir() or os.path.join(self.working_dir, utils.datetime_str())
         if not os.path.exists(run_dir):
             os.makedirs(run_dir)
         self.signals.result.emit(run_dir)
-        # iterate and create ecc files
-        ecc_result = True
-        for file_metadata in self.file_list:
-            # skip if ECC is unchecked
-            if not file_metadata["ecc_checked"]:
-                continue
+        # skip if ECC is unchecked
+        files = [os.path.join(f['directory'], f['file_name']) for f in self.file_list if f["ecc_checked"]]
+        self.files_done = 0
+        self.start = time.time()
+        self.signals.progress.emit(0)
+        workers = config.ecc_workers or os.cpu_count() or 1
+        # a single core is better used by encoding the files one by one in this thread
+        executor = ecc.ecc_process_pool(workers) if workers > 1 else None
+        try:
             # main computation to generate ECC
-            try:
-                self.current_file = os.path.join(file_metadata['directory'], file_metadata['file_name'])
-                self.signals.progress.emit(0)
-                ecc_result = ecc.generate_ecc(input_path = self.current_file,
-                                 output_path = run_dir,
-                                 progress_function = self.update_progress)
-                self.signals.progress.emit(100)
-            except Exception as e:
-                msg = traceback.format_exc()
-                print(msg)
-                self.signals.error.emit({"exception": e, "msg": msg})
-                self.signals.cancel.emit()
-                return False
+            if config.ecc_archive_name and files:
+                ecc_result = self.generate_archive_ecc(files, run_dir, workers, executor)
+            else:
+                ecc_result = self.generate_files_ecc(files, run_dir, workers, executor)
+            if ecc_result and config.ecc_recovery_percent:
+                ecc_result = self.generate_recovery(run_dir, workers, executor)
+        except Exception as e:
+            msg = traceback.format_exc()
+            print(msg)
+            self.signals.error.emit({"exception": e, "msg": msg})
+            self.signals.cancel.emit()
+            return False
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
         if ecc_result: # needs to be True
+            self.signals.progress.emit(100)
             self.signals.finished.emit()
         return True
 
+    def generate_files_ecc(self, files, run_dir, workers, executor):
+        '''
+        Generate one ECC database per file, several files at a time, returns False when it was canceled
+        '''
+        # progress is the sum of the bytes written for every file
+        self.files_total = {file: ecc.estimate_total_size(file) for file in files}
+        self.files_progress = {file: 0 for file in files}
+        concurrent_files = config.ecc_concurrent_files if executor is not None else 1
+        ecc_result = True
+        with ThreadPoolExecutor(max_workers=concurrent_files) as files_executor:
+            futures = [files_executor.submit(self.generate_file_ecc, file, run_dir, workers, executor)
+                       for file in files]
+            for future in as_completed(futures):
+                try:
+                    ecc_result = future.result() and ecc_result
+                except Exception:
+                    self.shutdown = True # stop the other files
+                    raise
+        return ecc_result
+
+    def generate_archive_ecc(self, files, run_dir, workers, executor):
+        '''
+        Generate a single ECC database for all the files, named config.ecc_archive_name (see ecc.generate_archive_ecc),
+        returns False when it was canceled
+        '''
+        archive = config.ecc_archive_name
+        self.files_total = {archive: 1}
+        self.current_files = [archive + ".txt"]
+        result = ecc.generate_archive_ecc(files, run_dir, archive,
+                                          progress_function=self.update_progress,
+                                          workers=workers,
+                                          executor=executor)
+        self.current_files = []
+        return result
+
+    def generate_recovery(self, run_dir, workers, executor):
+        '''
+        Generate the recovery volumes of all the files of the disc (see recovery.generate_recovery), returns False when
+        it was canceled
+        '''
+        disc_files = [os.path.join(f['directory'], f['file_name']) for f in self.file_list]
+        self.files_total = {recovery.volume_name: 1}
+        self.current_files = ["recovery slices"]
+        result = recovery.generate_recovery(disc_files, run_dir,
+                                            progress_function=self.update_progress,
+                                            workers=workers,
+                                            executor=executor)
+        self.current_files = []
+        return result is not False
+
+    def resumable_run_dir(self):
+        '''
+        The latest run dir if the ECC generation of one of the files of the list was interrupted there (it has an
+        incomplete checkpoint, see ecc.write_checkpoint), else a new run dir is used so that an interrupted file that
+        isn't on the disc anymore is left behind. Files are checked against their checkpoint when generated again, so
+        those that changed start over while the others resume or are skipped.
+        '''
+        if not os.path.isdir(self.working_dir):
+            return None
+        runs = sorted(d for d in os.listdir(self.working_dir) if os.path.isdir(os.path.join(self.working_dir, d)))
+        if not runs:
+            return None
+        run_dir = os.path.join(self.working_dir, runs[-1])
+        # the checkpoints name the files by their base name, like the databases
+        file_names = {os.path.basename(f['file_name']) for f in self.file_list if f["ecc_checked"]}
+        for name in os.listdir(run_dir):
+            if name.endswith(".txt.ckpt"):
+                try:
+                    with open(os.path.join(run_dir, name)) as f:
+                        checkpoint = json.load(f)
+                    if not checkpoint["complete"] and checkpoint["fingerprint"]["relfilepath"] in file_names:
+                        print(f"Resuming the ECC generation in {run_dir}")
+                        return run_dir
+                except (OSError, ValueError, KeyError, TypeError):
+                    continue
+        return None
+
+    def generate_file_ecc(self, file, run_dir, workers, executor):
+        '''
+        Generate the ECC of one file of the list, returns False when it was canceled
+        '''
+        if self.shutdown:
+            return False
+        def file_progress(progress, total, elapsed):
+            with self.lock:
+                self.files_progress[file] = progress
+                total_progress = sum(self.files_progress.values())
+            return self.update_progress(total_progress, sum(self.files_total.values()), int(time.time() - self.start))
+        # unchanged files since a previous run are not encoded again
+        cache_key = self.cache.key(file)
+        if self.cache.fetch(file, run_dir, key=cache_key):
+            with self.lock:
+                self.files_done += 1
+            file_progress(self.files_total[file], None, None)
+            return True
+        with self.lock:
+            self.current_files.append(file)
+        try:
+            result = ecc.generate_ecc(input_path = file,
+                                      output_path = run_dir,
+                                      progress_function = file_progress,
+                                      workers = workers,
+                                      executor = executor)
+        finally:
+            with self.lock:
+                self.current_files.remove(file)
+        if result:
+            self.cache.store(file, run_dir, key=cache_key)
+            with self.lock:
+                self.files_done += 1
+            file_progress(self.files_total[file], None, None)
+        return result
+
     def update_progress(self, progress, total, elapsed):
         '''
         Parameters
@@ -64,11 +195,14 @@ class EccWorker(QRunnable):
             The elapsed time in seconds
         '''
         self.signals.progress.emit((progress / total) * 100)
-        filename = os.path.basename(self.current_file)
-        details = f"[{[f['file_name'] for f in self.file_list].index(filename) + 1}/{len(self.file_list)}] "
+        with self.lock:
+            filenames = [os.path.basename(file) for file in self.current_files]
+        details = f"[{self.files_done}/{len(self.files_total)} files] "
         details += f"[{(progress / (1024**2)):.2f} MB/{(total / (1024**2)):.2f} MB] "
-        details += f"[{((progress / (1024**2)) / elapsed):.2f} MB/s] "
-        self.signals.progress_text.emit(f"Processing Error Correcting Codes (ECC) for\n{filename}\n{details}")
+        if elapsed:
+            details += f"[{((progress / (1024**2)) / elapsed):.2f} MB/s] "
+        self.signals.progress_text.emit(f"Processing Error Correcting Codes (ECC) for\n{', '.join(filenames)}\n"
+                                        f"{details}")
         return self.shutdown
 
     def cancel_task(self):
@@ -76,6 +210,60 @@ class EccWorker(QRunnable):
         print("ECC task canceled.")
         return False
 
+class SpeculativeEccWorker(QRunnable):
+    def __init__(self, file, cache=None):
+        '''
+        Encodes the ECC of a file into the ECC cache in the background, as soon as it is added in the GUI, so that the
+        EccWorker of the disc reuses it instead of encoding the file. It is canceled when the file is removed or its
+        ECC unchecked, and nothing is stored unless the whole database was generated.
+
+        Parameters
+        ----------
+        file str
+            Path of the input file
+        cache ecc_cache.EccCache (optional)
+            Defaults to the cache of the EccWorker
+        '''
+        super().__init__()
+        self.setAutoDelete(False) # the GUI keeps it to cancel it
+        self.file = file
+        self.cache = cache or ecc_cache.EccCache()
+        self.signals = EccWorkerSignals()
+        self.done = False # True once the ECC of the file is in the cache
+        self.shutdown = False # change to True to shutdown at next opportunity
+    @Slot()
+    def run(self):
+        '''
+        Encodes serially in this thread with the lowest priority, to leave the cores to the GUI and to the EccWorker
+        '''
+        QThread.currentThread().setPriority(QThread.LowestPriority)
+        try:
+            if self.shutdown or not self.cache.enabled:
+                return False
+            cache_key = self.cache.key(self.file)
+            if not self.cache.contains(self.file, key=cache_key):
+                with self.cache.staging() as staging_dir:
+                    result = ecc.generate_ecc(input_path = self.file,
+                                              output_path = staging_dir,
+                                              progress_function = lambda progress, total, elapsed: self.shutdown,
+                                              workers = 1,
+                                              resume = False)
+                    # the file can change while it is encoded, it would then be a different entry
+                    if not result or self.cache.key(self.file) != cache_key:
+                        return False
+                    self.cache.store(self.file, staging_dir, key=cache_key)
+            self.done = True
+            self.signals.finished.emit()
+            return True
+        except Exception as e:
+            # the file is encoded again by the EccWorker, which reports its errors
+            print(f"Background ECC of {self.file} failed: {e}")
+            return False
+
+    def cancel_task(self):
+        self.shutdown = True
+        return False
+
 class EccWorkerSignals(QObject):
     finished = Signal()
     cancel = Signal()
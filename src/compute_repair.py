@@ -2,7 +2,9 @@ from PySide6.QtCore import QRunnable, Slot, QObject, Signal, Qt
 from PySide6.QtWidgets import (QWizardPage, QVBoxLayout, QLabel, QPushButton, QFileDialog, QPlainTextEdit,
                                QCheckBox, QLineEdit, QProgressBar)
 import traceback
+import recovery
 import repair
+import scrub
 import utils
 import os
 
@@ -26,7 +28,8 @@ class RepairWorker(QRunnable):
     @Slot()
     def run(self):
         try:
-            repair.correct_errors(
+            report = []
+            repaired = repair.correct_errors(
                 damaged=self.ecc_config['damaged'],
                 repair_dir=self.ecc_config['repair_dir'],
                 ecc_file=self.ecc_config['ecc_file'],
@@ -34,13 +37,37 @@ class RepairWorker(QRunnable):
                 enable_erasures=self.ecc_config['enable_erasures'],
                 erasure_symbol=self.ecc_config['erasure_symbol'],
                 fast_check=self.ecc_config['fast_check'],
-                callback=self.ecc_config['callback']
+                callback=self.ecc_config['callback'],
+                report=report
             )
+            # files left damaged, missing or that could not be checked are rebuilt from the recovery volumes
+            if not repaired or any(result["status"] not in scrub.correctable_status for result in report):
+                self.repair_from_recovery()
         except Exception as e:
             msg = traceback.format_exc()
             print(msg)
             self.signals.error.emit({"exception": e, "msg": msg})
 
+    def repair_from_recovery(self):
+        '''
+        Rebuild the damaged file from the recovery volumes next to its ECC file, in the ECC/ directory of its disc (see
+        recovery.repair_from_recovery). Returns whether it was rebuilt.
+        '''
+        ecc_dir = os.path.dirname(os.path.abspath(self.ecc_config['ecc_file']))
+        volumes = recovery.find_volumes(ecc_dir)
+        if not volumes:
+            return False
+        root = os.path.dirname(ecc_dir)
+        relpath = os.path.relpath(os.path.abspath(self.ecc_config['damaged']), root)
+        if relpath.startswith(os.pardir):
+            print(f"The recovery volumes of {root} don't include {self.ecc_config['damaged']}.")
+            return False
+        self.ecc_config['callback'](0, 100, "Rebuilding from the recovery volumes . . .")
+        if not recovery.repair_from_recovery(root, volumes, self.ecc_config['repair_dir'], entries=[relpath]):
+            return False
+        self.ecc_config['callback'](100, 100, "Rebuilt from the recovery volumes")
+        return True
+
     def select_file_page(self):
         self.select_corrupted_file_wizard = QWizardPage()
         self.select_corrupted_file_wizard.setTitle("Select File to Repair")
@@ -217,6 +244,42 @@ class RepairWorker(QRunnable):
         if path_name:
             getattr(self, f"select_{var_name}_text").setText(path_name)
 
+class ScrubWorker(QRunnable):
+    '''
+    Check every file of a disc or of a folder with its ECC databases without writing anything next to them, and save
+    the health report (see scrub.scrub_disc)
+    '''
+    def __init__(self, root, report_path):
+        super().__init__()
+        self.root = root
+        self.report_path = report_path
+        self.canceled = False
+        self.signals = utils.WorkerSignals()
+
+    @Slot()
+    def run(self):
+        try:
+            def progress_function(progress, total, elapsed):
+                self.signals.progress.emit((progress / total) * 100 if total else 100)
+                details = f"[{(progress / (1024**2)):.2f} MB/{(total / (1024**2)):.2f} MB] "
+                if elapsed:
+                    details += f"[{((progress / (1024**2)) / elapsed):.2f} MB/s] "
+                self.signals.progress_text.emit(f"Scrubbing {self.root}\n{details}")
+                return self.canceled
+            report = scrub.scrub_disc(self.root, self.report_path, progress_function=progress_function)
+            self.signals.cancel.emit()
+            if report:
+                self.signals.result.emit(report)
+        except Exception as e:
+            msg = traceback.format_exc()
+            print(msg)
+            self.signals.cancel.emit()
+            self.signals.error.emit({"exception": e, "msg": msg})
+
+    def cancel_task(self):
+        # set the class variable and exit when safe
+        self.canceled = True
+
 class RepairWorkerSignals(QObject):
     finished = Signal(str)
     cancel = Signal()
@@ -33,4 +33,26 @@ unzip_err = {
                          "files were missing from the directory:",
 }
 video_total_bytes_seconds = 2442000 # based on the ffmpeg command for bitrate of audio video in a video file
-checkbox_true_state = 2 # PySide checkboxes have integer values in some cases
\ No newline at end of file
+checkbox_true_state = 2 # PySide checkboxes have integer values in some cases
+ecc_workers = None # processes used to encode the ECC of a file, None uses every core
+ecc_parallel_min_size = 16 * (1024 ** 2) # bytes, smaller files are encoded serially to skip the process startup
+ecc_range_size = 4 * (1024 ** 2) # bytes of the input file encoded by a worker process at a time
+ecc_concurrent_files = 4 # files encoded at the same time by the ECC worker, they share its pool of processes
+ecc_hash_algo = "blake2b-8" # hash of each ECC block, "md5" writes the ECC databases version 3 of older releases
+ecc_checkpoint_interval = 30 # seconds between the checkpoints saved to resume an interrupted ECC generation
+ecc_cache_max_size = 20 * (1024 ** 3) # bytes of ECC files kept to reuse between runs, least recently used first out
+ecc_stream_split_parts = True # compute the ECC of split ZIP parts while writing them, reused from the ECC cache
+ecc_archive_name = None # when set, one ECC database with this name covers all the files of a disc (name.txt)
+ecc_field_bits = 8 # 16 encodes the ECC tracks with long Reed-Solomon codewords of GF(2^16), fewer but slower blocks
+ecc_long_block_size = 1023 # symbols in a codeword of GF(2^16), up to 65535, the encoding time grows with it
+ecc_recovery_percent = 0 # size of the recovery slices written in ECC/ in percent of the files of a disc, 0 is off
+ecc_recovery_slices = 1000 # data slices the files of a disc are cut into for the recovery slices, up to 32768
+ecc_recovery_volumes = 4 # files the recovery slices are spread into, each can find the slices lost on its own
+ecc_iso_sidecar = False # ECC of the whole .iso image written next to it (.iso.txt), to keep apart from the disc
+ecc_sector_size = 0 # 2048 interleaves the ECC tracks across the sectors of optical discs, a lost sector is erasures
+ecc_speculative = True # encode the ECC of the files into the ECC cache in the background as soon as they are added
+ecc_repair_window = 4096 # blocks read ahead by the repair, their corrupted blocks are decoded in batches of NumPy
+ecc_repair_workers = None # processes decoding the corrupted blocks of a repair one by one, None uses every core
+ecc_repair_parallel_min_blocks = 64 # corrupted blocks of a window from which they are decoded by the processes
+scrub_concurrent_files = 2 # ECC databases checked at the same time by a scrub, each one reads its files in order
+scrub_io_budget = 0 # bytes per second read by a scrub from the files of a disc, 0 is unlimited
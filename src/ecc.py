@@ -1,12 +1,24 @@
 from io import BytesIO
+from collections import deque
+from functools import lru_cache
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
 import struct
-import math
+import hashlib
+import platform
+import json
 import time
 import os
-from utils import feature_scaling, Hasher, _bytes, b
+import config
+from utils import feature_scaling, Hasher, _bytes, b, preallocate_file
 
+import numpy as np
 import creedsolo as reedsolo
 from unireedsolomon import rs as brownanrs
+import rs_batch
+import rs16
 
 parameters = {
     # main_parser.add_argument('--ecc_algo', type=int, default=3, required=False,
@@ -16,7 +28,12 @@ parameters = {
     #                         library which may not be correct ; 4 is the fastest implementation supporting
     #                         US FAA ADSB UAT RS FEC standard but is totally incompatible with the other three (a text
     #                         encoded with any of 1-3 modes will be decodable with any one of them).', **widget_text)
-    "ecc_algo": 3,
+    # 5 is the NumPy batch encoder of rs_batch, which encodes thousands of blocks at once and is compatible with 1-3
+    # (decoding and checking are done like 3)
+    # 6 is the GF(2^16) codec of rs16 for long codewords, it is only used for the ecc tracks when config.ecc_field_bits
+    # is 16 (see track_code)
+    # "auto" routes each operation to the fastest of 1-3 and 5 on this machine, see autotune_ecc_algo
+    "ecc_algo": "auto",
     # marker that will signal the beginning of an ecc entry - use an alternating pattern of several characters, this
     # avoids confusion (eg: if you use "AAA" as a pattern, if the ecc block of the previous file ends with "EGA" for
     # example, then the full string for example will be "EGAAAAC:\yourfolder\filea.jpg" and then the entry reader will
@@ -49,7 +66,8 @@ parameters = {
     "resilience_rates": [0.3, 0.2, 0.1]
 }
 
-def generate_ecc(input_path, output_path, progress_function=lambda x,y,z: False):
+def generate_ecc(input_path, output_path, progress_function=lambda x,y,z: False, workers=None, executor=None,
+                 resume=True):
     '''
     Credit to PyFileFixity
     Parameters
@@ -59,6 +77,17 @@ def generate_ecc(input_path, output_path, progress_function=lambda x,y,z: False)
     progress_function function (optional)
         There are 3 inputs: x, y, z . Progress in bytes is x, the total estimate is z, and elapse time in seconds is y
         Return True to shutdown gracefully
+    workers int (optional)
+        Number of processes encoding the file. Defaults to config.ecc_workers, or every core when that is None. Files
+        smaller than config.ecc_parallel_min_size are always encoded in this process. The output is byte-identical
+        whatever the number of workers.
+    executor ProcessPoolExecutor (optional)
+        Pool of processes shared with other files, see ecc_process_pool. When given, the file is encoded on it whatever
+        its size, with at most 2 ranges per worker in flight.
+    resume bool (optional)
+        A checkpoint (.txt.ckpt) is saved every config.ecc_checkpoint_interval seconds and when canceled. If a previous
+        run on the same input and parameters left one, continue from it, or skip the file when that run completed. The
+        database is identical to the one of an uninterrupted run.
     References
     ----------
     - https://github.com/lrq3000/pyFileFixity/blob/master/pyFileFixity/structural_adaptive_ecc.py
@@ -67,106 +96,437 @@ def generate_ecc(input_path, output_path, progress_function=lambda x,y,z: False)
     '''
     print("Generating ECC file. Credit to PyFileFixity.")
     base_path = os.path.join(output_path, os.path.basename(input_path)) + ".txt"
+    checkpoint_path = base_path + ".ckpt"
     total_estimate = estimate_total_size(input_path)
-    with open(base_path, 'wb') as db, open(base_path + ".idx", 'wb') as dbidx:
-        # Write ECC file header identifier (unique string + version)
-        # each character in the version will be repeated 3 times, so that in case of tampering, a majority vote can try
-        # to disambiguate
-        db.write(b("**PYSTRUCTADAPTECCv%s**\n" % (''.join([x * 3 for x in
-                                                           "3.1.4"]))))
-        # Write the parameters (they are NOT reloaded automatically! It's the user role to memorize those parameters
-        # (using any means: own brain memory, keep a copy on paper, on email, etc.), so that the parameters are NEVER
-        # tampered. The parameters MUST be ultra reliable so that errors in the ECC file can be more efficiently recovered.
-        for i in range(3): db.write(("** Parameters: " + " ".join(
-            parameters) + "\n").encode())  # copy them 3 times just to be redundant in case of ecc file corruption
-        db.write(b("** Generated under %s\n" % ecc_manager_variable.description()))
-        # Processing ecc on files
-        rootfolderpath = os.path.dirname(input_path)
-        dirpath = os.path.dirname(input_path)
-        filename = os.path.basename(input_path)
-        # Get full absolute filepath
-        filepath = os.path.join(dirpath, filename)
-        # Get database relative path (from scanning root folder)
-        relfilepath = os.path.relpath(filepath, rootfolderpath)
-        # Get file size
-        filesize = os.stat(filepath).st_size
-        # Opening the input file's to read its header and compute the ecc/hash blocks
-        print("\n- Processing file %s" % relfilepath)
-        with open(os.path.join(rootfolderpath, filepath), 'rb') as file:
-            entrymarker_pos = db.tell()  # backup the position of the start of this ecc entry
-            # -- Intra-ecc generation: Compute an ecc for the filepath, to avoid a critical spot here (so that we don't
-            # care that the filepath gets corrupted, we have an ecc to fix it!)
-            relfilepath_ecc = compute_ecc_hash_from_string(relfilepath, ecc_manager_intra, hasher_intra,
-                                                           parameters["max_block_size"],
-                                                           parameters["resilience_rate_intra"])
-            filesize_ecc = compute_ecc_hash_from_string(b(str(filesize)), ecc_manager_intra, hasher_intra,
-                                                        parameters["max_block_size"],
-                                                        parameters["resilience_rate_intra"])
-            # first save the file's metadata (filename, filesize, ecc for filename, ...), separated with field_delim
-            db.write(b''.join([b(parameters["entrymarker"]), b(relfilepath), b(parameters["field_delim"]),
-                               b(str(filesize)), b(parameters["field_delim"]), b(relfilepath_ecc),
-                               b(parameters["field_delim"]), b(filesize_ecc),
-                               b(parameters["field_delim"])]))
-            # -- External indexes backup: calculate the position of the entrymarker and of each field delimiter, and
-            # compute their ecc, and save into the index backup file. This will allow later to retrieve the position of
-            # each marker in the ecc file, and repair them if necessary, while just incurring a very cheap storage cost.
-            # Also, the index backup file is fixed delimited fields sizes, which means that each field has a very
-            # specifically delimited size, so that we don't need any marker: we can just compute the total size for each
-            # entry, and thus find all entries independently even if one or several are corrupted beyond repair, so that
-            # this won't affect other index entries.
-            # Make the list of all markers positions for this ecc entry. The first and last indexes are the most
-            # important (first is the entrymarker, the last is the field_delim just before the ecc track start)
-            markers_pos = [
-                entrymarker_pos,
-                entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath),
-                entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath) + len(parameters["field_delim"])
-                    + len(str(filesize)),
-                entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath) + len(parameters["field_delim"])
-                    + len(str(filesize)) + len(parameters["field_delim"]) + len(relfilepath_ecc),
-                db.tell() - len(parameters["field_delim"])
-            ]
-            # Convert to a binary representation in 8 bytes using unsigned long long (up to 16 EB, this should be more
-            # than sufficient)
-            markers_pos = [struct.pack('>Q', x) for x in markers_pos]
-            markers_types = [b'1', b'2', b'2', b'2', b'2']
-            # compute the ecc for each number
-            markers_pos_ecc = [ecc_manager_idx.encode(x + y) for x, y in zip(markers_types, markers_pos)]
-            # Couple each marker's position with its type and with its ecc, and write them all consecutively into the
-            # index backup file
-            for items in zip(markers_types, markers_pos, markers_pos_ecc):
-                for item in items:
-                    dbidx.write(b(item))
-            # -- Hash/Ecc encoding of file's content (everything is managed inside stream_compute_ecc_hash)
-            start = time.time()
-            # then compute the ecc/hash entry for this file's header (each value will be a block, a string of hash+ecc
-            # per block of data, because Reed-Solomon is limited to a maximum of 255 bytes, including the
-            # original_message+ecc! And in addition we want to use a variable rate for RS that is decreasing along the file)
+    # Processing ecc on files
+    rootfolderpath = os.path.dirname(input_path)
+    dirpath = os.path.dirname(input_path)
+    filename = os.path.basename(input_path)
+    # Get full absolute filepath
+    filepath = os.path.join(dirpath, filename)
+    # Get database relative path (from scanning root folder)
+    relfilepath = os.path.relpath(filepath, rootfolderpath)
+    # Get file size
+    filesize = os.stat(filepath).st_size
+    fingerprint = input_fingerprint(filepath, relfilepath)
+    checkpoint = read_checkpoint(checkpoint_path, fingerprint, base_path) if resume else None
+    if checkpoint and checkpoint["complete"]:
+        print("\n- Skipping file %s, its ECC was already generated" % relfilepath)
+        return True
+    if not checkpoint:
+        # the outputs of a previous run may be hardlinks to the ECC cache (see ecc_cache), replace them instead of
+        # writing through them
+        for path in (base_path, base_path + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+    with open(base_path, 'r+b' if checkpoint else 'wb') as db:
+        # The size of the database is known exactly from the block plan, reserve it before writing
+        preallocate_file(db, ecc_file_sizes(filesize, relfilepath)[0])
+        def save_checkpoint(input_offset, complete=False):
+            # the database must be on disk up to the checkpoint before the checkpoint itself
+            db.flush()
+            os.fsync(db.fileno())
+            write_checkpoint(checkpoint_path, {"input_offset": input_offset, "db_offset": db.tell(),
+                                               "fingerprint": fingerprint, "complete": complete})
+        if checkpoint:
+            print("\n- Resuming file %s at byte %i" % (relfilepath, checkpoint["input_offset"]))
+            db.seek(checkpoint["db_offset"])
+            input_offset = checkpoint["input_offset"]
+        else:
+            # Write ECC file header identifier (unique string + version), the parameters and the ecc description
+            db.write(database_header())
+            print("\n- Processing file %s" % relfilepath)
+            with open(base_path + ".idx", 'wb') as dbidx:
+                write_entry_metadata(db, dbidx, relfilepath, filesize)
+                dbidx.flush()
+                os.fsync(dbidx.fileno())
+            input_offset = 0
+            save_checkpoint(input_offset)
+        # -- Hash/Ecc encoding of file's content (everything is managed inside compute_ecc_hash_range)
+        start = time.time()
+        if workers is None:
+            workers = config.ecc_workers or os.cpu_count() or 1
+        if executor is not None or (workers > 1 and filesize >= config.ecc_parallel_min_size):
+            # large files are split into ranges of whole blocks that are encoded by a pool of processes
+            if not parallel_compute_ecc_hash(db, filepath, filesize, workers, progress_function, total_estimate,
+                                             start, executor=executor, input_offset=input_offset,
+                                             checkpoint_function=save_checkpoint):
+                db.truncate() # drop the space reserved for the rest of the database
+                return False
+        else:
+            # then compute the ecc/hash entry for this file's header (each value will be a block, a string of
+            # hash+ecc per block of data, because Reed-Solomon is limited to a maximum of 255 bytes, including the
+            # original_message+ecc! And in addition we want to use a variable rate for RS that is decreasing along
+            # the file). The blocks are encoded by ranges, so that blocks of the same size are encoded as a batch.
             progress = [0, False, 0] # byes processed, seconds buffer indicator, elapsed time
-            for ecc_entry in stream_compute_ecc_hash(
-                    ecc_manager_variable, hasher, file, parameters["max_block_size"], parameters["header_size"],
-                    parameters["resilience_rates"]):
-                # note that there's no separator between consecutive blocks, but by calculating the ecc parameters, we
-                # will know when decoding the size of each block!
-                db.write(b''.join([b(ecc_entry[0]), b(ecc_entry[1])]))
+            last_checkpoint = time.time()
+            plan = get_block_plan(filesize, track_block_size, parameters["header_size"],
+                                  parameters["resilience_rates"], hasher, symbol_size=symbol_size,
+                                  sector_size=sector_size)
+            records = bytearray() # records of a range, reused by the next ranges
+            for range_start, range_end in plan.ranges(config.ecc_range_size, start=input_offset):
+                if len(records) < plan.records_size(range_start, range_end):
+                    records = bytearray(plan.records_size(range_start, range_end))
+                # note that there's no separator between consecutive blocks, but by calculating the ecc
+                # parameters, we will know when decoding the size of each block!
+                db.write(compute_ecc_hash_range(filepath, range_start, range_end, filesize, track_block_size,
+                                                parameters["header_size"], parameters["resilience_rates"],
+                                                hasher.algo, symbol_size, sector_size, out=records))
+                if time.time() - last_checkpoint >= config.ecc_checkpoint_interval:
+                    save_checkpoint(range_end)
+                    last_checkpoint = time.time()
                 progress[1] = (int(time.time() - start) == progress[2])
                 progress[2] = int(time.time() - start)
                 if progress[2] and progress[1] % 2 == 0: # every 2 seconds, update progress
                     progress[0] = db.tell()
                     shutdown = progress_function(progress[0], total_estimate, progress[2])
                     if shutdown:
+                        save_checkpoint(range_end) # to resume from here
+                        db.truncate() # drop the space reserved for the rest of the database
                         return False
-
+        db.truncate() # the database is complete, this only matters if the input file changed while reading it
+        save_checkpoint(filesize, complete=True)
     print("All done! Total number of files processed: %i, skipped: %i" % (1, 0))
     return True
 
+def write_entry_metadata(db, dbidx, relfilepath, filesize):
+    '''
+    Write the start of the ecc entry of a file into the database, its metadata fields protected by the intra ecc, and
+    the positions of its markers into the index
+    '''
+    entrymarker_pos = db.tell()  # backup the position of the start of this ecc entry
+    # -- Intra-ecc generation: Compute an ecc for the filepath, to avoid a critical spot here (so that we don't
+    # care that the filepath gets corrupted, we have an ecc to fix it!)
+    relfilepath_ecc = compute_ecc_hash_from_string(relfilepath, ecc_manager_intra, hasher_intra,
+                                                   parameters["max_block_size"],
+                                                   parameters["resilience_rate_intra"])
+    filesize_ecc = compute_ecc_hash_from_string(b(str(filesize)), ecc_manager_intra, hasher_intra,
+                                                parameters["max_block_size"],
+                                                parameters["resilience_rate_intra"])
+    # first save the file's metadata (filename, filesize, ecc for filename, ...), separated with field_delim
+    db.write(b''.join([b(parameters["entrymarker"]), b(relfilepath), b(parameters["field_delim"]),
+                       b(str(filesize)), b(parameters["field_delim"]), b(relfilepath_ecc),
+                       b(parameters["field_delim"]), b(filesize_ecc),
+                       b(parameters["field_delim"])]))
+    # -- External indexes backup: calculate the position of the entrymarker and of each field delimiter, and
+    # compute their ecc, and save into the index backup file. This will allow later to retrieve the position of
+    # each marker in the ecc file, and repair them if necessary, while just incurring a very cheap storage cost.
+    # Also, the index backup file is fixed delimited fields sizes, which means that each field has a very
+    # specifically delimited size, so that we don't need any marker: we can just compute the total size for each
+    # entry, and thus find all entries independently even if one or several are corrupted beyond repair, so that
+    # this won't affect other index entries.
+    # Make the list of all markers positions for this ecc entry. The first and last indexes are the most
+    # important (first is the entrymarker, the last is the field_delim just before the ecc track start)
+    markers_pos = [
+        entrymarker_pos,
+        entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath),
+        entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath) + len(parameters["field_delim"])
+            + len(str(filesize)),
+        entrymarker_pos + len(parameters["entrymarker"]) + len(relfilepath) + len(parameters["field_delim"])
+            + len(str(filesize)) + len(parameters["field_delim"]) + len(relfilepath_ecc),
+        db.tell() - len(parameters["field_delim"])
+    ]
+    # Convert to a binary representation in 8 bytes using unsigned long long (up to 16 EB, this should be more
+    # than sufficient)
+    markers_pos = [struct.pack('>Q', x) for x in markers_pos]
+    markers_types = [b'1', b'2', b'2', b'2', b'2']
+    # compute the ecc for each number
+    markers_pos_ecc = [ecc_manager_idx.encode(x + y) for x, y in zip(markers_types, markers_pos)]
+    # Couple each marker's position with its type and with its ecc, and write them all consecutively into the
+    # index backup file
+    for items in zip(markers_types, markers_pos, markers_pos_ecc):
+        for item in items:
+            dbidx.write(b(item))
+
+class StreamEccEncoder(object):
+    '''
+    Generates the ecc database of a file while its content is produced, for data that can't be read again or seeked
+    like a pipe or a file being written. The rate of each block depends on the size of the whole file (see
+    compute_block_rate) and the size is stored before the ecc track, so it has to be given in advance. The database is
+    then identical to the one of generate_ecc on the complete file.
+    Write the content in order with write, then call close, or use it as a context manager.
+    '''
+    def __init__(self, output_path, filename, size):
+        '''
+        Parameters
+        ----------
+        output_path str
+            Directory of the database (filename.txt) and of its index (filename.txt.idx)
+        filename str
+            Name of the file stored in the database
+        size int
+            Exact number of bytes that will be written
+        '''
+        self.base_path = os.path.join(output_path, filename) + ".txt"
+        self.size = size
+        self.received = 0
+        self.plan = get_block_plan(size, track_block_size, parameters["header_size"], parameters["resilience_rates"],
+                                   hasher, symbol_size=symbol_size, sector_size=sector_size)
+        ranges = list(self.plan.ranges(config.ecc_range_size))
+        self.ranges = iter(ranges)
+        self.range = next(self.ranges, None) # range of blocks being received
+        # content received for the current range and records of a range, allocated once for the whole file
+        self.buffer = bytearray(max((end - start for start, end in ranges), default=0))
+        self.buffered = 0
+        self.records = bytearray(max((self.plan.records_size(*r) for r in ranges), default=0))
+        self.db = open(self.base_path, 'wb')
+        preallocate_file(self.db, ecc_file_sizes(size, filename)[0])
+        self.db.write(database_header())
+        with open(self.base_path + ".idx", 'wb') as dbidx:
+            write_entry_metadata(self.db, dbidx, filename, size)
+
+    def write(self, data):
+        '''
+        Encode the blocks completed by data, the next bytes of the file
+        '''
+        self.received += len(data)
+        if self.received > self.size:
+            raise ValueError(f"More than the {self.size} bytes announced for {self.base_path}")
+        view = memoryview(data).cast('B')
+        while len(view):
+            range_size = self.range[1] - self.range[0]
+            if not self.buffered and len(view) >= range_size:
+                # a whole range in data is encoded without copying it
+                self.db.write(encode_ecc_hash_blocks(view[:range_size], *self.range, self.plan, hasher,
+                                                     out=self.records))
+                view = view[range_size:]
+            else:
+                count = min(range_size - self.buffered, len(view))
+                self.buffer[self.buffered:self.buffered + count] = view[:count]
+                self.buffered += count
+                view = view[count:]
+                if self.buffered < range_size:
+                    break
+                self.db.write(encode_ecc_hash_blocks(memoryview(self.buffer)[:range_size], *self.range, self.plan,
+                                                     hasher, out=self.records))
+                self.buffered = 0
+            self.range = next(self.ranges, None)
+        return len(data)
+
+    def close(self):
+        '''
+        Finish the database, the whole content must have been written
+        '''
+        if self.db.closed:
+            return
+        self.db.close()
+        if self.received != self.size:
+            self.abort()
+            raise ValueError(f"{self.received} bytes received for {self.base_path}, {self.size} were announced")
+
+    def abort(self):
+        '''
+        Remove the database of an incomplete file
+        '''
+        self.db.close()
+        for path in (self.base_path, self.base_path + ".idx"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def stream_generate_ecc(stream, output_path, filename, size, chunk_size=None):
+    '''
+    Generate the ecc database of a readable byte stream (with a read method) or of an iterable of bytes, see
+    StreamEccEncoder. Returns the path of the database.
+    '''
+    chunk_size = chunk_size or config.ecc_range_size
+    chunks = iter(lambda: stream.read(chunk_size), b'') if hasattr(stream, "read") else stream
+    with StreamEccEncoder(output_path, filename, size) as encoder:
+        for chunk in chunks:
+            encoder.write(chunk)
+    return encoder.base_path
+
+def generate_archive_ecc(input_paths, output_path, name, root_path=None, progress_function=lambda x,y,z: False,
+                         workers=None, executor=None):
+    '''
+    Generate a single ecc database for many files, each file being an entry of the database like in PyFileFixity, so
+    that a disc with thousands of small files has one header and two files of ECC instead of two files per file. The
+    index holds the positions of the markers of every entry, which is the offset table used by repair.correct_errors to
+    read an entry without the others. Small files are grouped so that the work units of the processes are about
+    config.ecc_range_size bytes, and the ranges of several files are encoded at the same time.
+    Parameters
+    ----------
+    input_paths str or list
+        A directory, whose whole tree is covered with paths relative to it, or a list of files
+    output_path str
+    name str
+        The database is name.txt and its index name.txt.idx
+    root_path str (optional)
+        Paths of the list of files are stored relative to it, or as their base names when it is None
+    progress_function function (optional)
+        Same as generate_ecc
+    workers int (optional)
+        Same as generate_ecc, the files are encoded in this process when their total is below
+        config.ecc_parallel_min_size
+    executor ProcessPoolExecutor (optional)
+        Same as generate_ecc
+    '''
+    print("Generating ECC archive. Credit to PyFileFixity.")
+    if isinstance(input_paths, str):
+        root_path = input_paths
+        input_paths = sorted(os.path.join(dirpath, filename)
+                             for dirpath, _, filenames in os.walk(root_path) for filename in filenames)
+    # paths in the database use / whatever the system, like in ZIP files
+    relfilepaths = [os.path.relpath(path, root_path).replace(os.sep, "/") if root_path else os.path.basename(path)
+                    for path in input_paths]
+    filesizes = [os.stat(path).st_size for path in input_paths]
+    base_path = os.path.join(output_path, name) + ".txt"
+    sizes = archive_ecc_sizes(filesizes, relfilepaths)
+    total_estimate = sum(sizes)
+    if workers is None:
+        workers = config.ecc_workers or os.cpu_count() or 1
+    if executor is None and sum(filesizes) < config.ecc_parallel_min_size:
+        workers = 1
+    start = time.time()
+    last_update = 0
+    with open(base_path, 'wb') as db, open(base_path + ".idx", 'wb') as dbidx:
+        preallocate_file(db, sizes[0])
+        db.write(database_header())
+        results = compute_units_ecc_hash(input_paths, filesizes, workers, executor)
+        try:
+            for unit, records in results:
+                for (index, range_start, _), range_records in zip(unit, records):
+                    if range_start == 0:
+                        # the entry of a file starts with its first range
+                        print("\n- Processing file %s" % relfilepaths[index])
+                        write_entry_metadata(db, dbidx, relfilepaths[index], filesizes[index])
+                    db.write(range_records)
+                elapsed = int(time.time() - start)
+                if elapsed != last_update: # update the progress at most once per second
+                    last_update = elapsed
+                    if progress_function(db.tell(), total_estimate, elapsed):
+                        return False
+        finally:
+            results.close() # cancels the ranges in flight
+        db.truncate() # the database is complete, this only matters if an input file changed while reading it
+    print("All done! Total number of files processed: %i, skipped: %i" % (len(input_paths), 0))
+    return True
+
+def ecc_work_units(filesizes, range_size):
+    '''
+    Split files into units of work of about range_size bytes, made of ranges of whole blocks (see BlockPlan.ranges) of
+    consecutive files. Large files are split into several units and small files are grouped into one. Each range is
+    (index of the file, start, end), an empty file has one empty range so that its entry is written.
+    '''
+    units = []
+    unit = []
+    unit_size = 0
+    for index, size in enumerate(filesizes):
+        file_ranges = get_block_plan(size, track_block_size, parameters["header_size"], parameters["resilience_rates"],
+                                     hasher, symbol_size=symbol_size, sector_size=sector_size).ranges(range_size)
+        for range_start, range_end in (list(file_ranges) or [(0, 0)]):
+            unit.append((index, range_start, range_end))
+            unit_size += range_end - range_start
+            if unit_size >= range_size:
+                units.append(unit)
+                unit = []
+                unit_size = 0
+    if unit:
+        units.append(unit)
+    return units
+
+def compute_ecc_hash_ranges(ranges, max_block_size, header_size, resilience_rates, hash_algo, symbol_size=1,
+                            sector_size=0):
+    '''
+    Records of several ranges, each (input_path, start, end, size), see compute_ecc_hash_range
+    '''
+    return [compute_ecc_hash_range(input_path, start, end, size, max_block_size, header_size, resilience_rates,
+                                   hash_algo, symbol_size, sector_size) if end > start else bytearray()
+            for input_path, start, end, size in ranges]
+
+def compute_units_ecc_hash(input_paths, filesizes, workers, executor=None):
+    '''
+    Generate the records of the work units of several files in order, with the unit they belong to. The units are
+    encoded in this process when there is one worker and no executor, else by a pool of processes with at most 2 units
+    per worker in flight.
+    '''
+    args = (track_block_size, parameters["header_size"], parameters["resilience_rates"], hasher.algo, symbol_size,
+            sector_size)
+    units = ecc_work_units(filesizes, config.ecc_range_size)
+    def unit_ranges(unit):
+        return [(input_paths[index], start, end, filesizes[index]) for index, start, end in unit]
+    if executor is None and workers <= 1:
+        for unit in units:
+            yield unit, compute_ecc_hash_ranges(unit_ranges(unit), *args)
+        return
+    with (ecc_process_pool(workers) if executor is None else nullcontext(executor)) as executor:
+        pending = deque() # units with their future
+        try:
+            for unit in units:
+                pending.append((unit, executor.submit(compute_ecc_hash_ranges, unit_ranges(unit), *args)))
+                # keep the pool busy but give the oldest unit before submitting more
+                while len(pending) >= workers * 2 or (pending and pending[0][1].done()):
+                    unit, future = pending.popleft()
+                    yield unit, future.result()
+            while pending:
+                unit, future = pending.popleft()
+                yield unit, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+def input_fingerprint(path, relfilepath):
+    '''
+    Cheap identification of an input file and of the ecc settings, to check that a checkpoint belongs to them: size,
+    modification time and blake2b of a few samples of the file, and a digest of the database header and parameters.
+    '''
+    stat = os.stat(path)
+    samples = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for offset in (0, stat.st_size // 2, max(0, stat.st_size - 65536)):
+            file.seek(offset)
+            samples.update(file.read(65536))
+    settings = hashlib.blake2b(database_header() + repr(parameters).encode(), digest_size=16)
+    return {"relfilepath": relfilepath, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "samples": samples.hexdigest(), "settings": settings.hexdigest()}
+
+def write_checkpoint(path, checkpoint):
+    '''
+    Atomically replace the checkpoint of a database generation. Its input_offset is a block boundary of the input file
+    and db_offset the size of the database written for the blocks before it.
+    '''
+    with open(path + ".tmp", 'w') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+
+def read_checkpoint(path, fingerprint, database_path):
+    '''
+    Checkpoint of a previous generation of a database, or None if there is none or if it can't be used anymore: the
+    input file or the parameters changed, or the database doesn't hold the data of the checkpoint.
+    '''
+    try:
+        with open(path) as file:
+            checkpoint = json.load(file)
+        db_size = os.path.getsize(database_path)
+        if not os.path.exists(database_path + ".idx"):
+            return None
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("fingerprint") != fingerprint or db_size < checkpoint["db_offset"]:
+        return None
+    if checkpoint["complete"] and db_size != checkpoint["db_offset"]:
+        return None
+    return checkpoint
+
 class ECCMan(object):
     '''
     Error correction code manager, which provides a facade API to use different kinds of ecc algorithms or
     libraries/codecs.
     '''
+    check_batch_min_blocks = 128 # about the time to build the tables of a message size for encode_batch
+
     def __init__(self, n, k, algo=1):
-        self.c_exp = 8 # we stay in GF(2^8) for this software
-        self.field_charac = int((2**self.c_exp) - 1)
+        self.c_exp = 8 # we stay in GF(2^8) for this software, except for the long codewords of algorithm 6
         # brownanrs library implementations: fully correct base 3 implementation, and mode 2 is for fast encoding
         if algo == 1 or algo == 2:
             self.gen_nb = 3
@@ -174,26 +534,53 @@ class ECCMan(object):
             self.fcr = 1
             self.ecc_manager = brownanrs.RSCoder(n, k, generator=self.gen_nb, prim=self.prim, fcr=self.fcr)
         # reedsolo fast implementation, compatible with brownanrs in base 3
-        elif algo == 3:
+        # algo 5 is the same with batches of blocks encoded by NumPy, single blocks still go through reedsolo
+        # the tables and generator polynomials of reedsolo are only built when a block is first encoded or decoded, see
+        # init_reedsolo_tables and generator_polys
+        elif algo == 3 or algo == 5:
             self.gen_nb = 3
             self.prim = 0x11b
             self.fcr = 1
-
-            reedsolo.init_tables(generator=self.gen_nb, prim=self.prim)
-            self.g = reedsolo.rs_generator_poly_all(n, fcr=self.fcr, generator=self.gen_nb)
         # reedsolo fast implementation, incompatible with any other implementation
         elif algo == 4:
             self.gen_nb = 2
-            self.prim = 0x187
+            self.prim = 0x187 # parameters for US FAA ADSB UAT RS FEC
             self.fcr = 120
-            reedsolo.init_tables(self.prim) # parameters for US FAA ADSB UAT RS FEC
-            self.g = reedsolo.rs_generator_poly_all(n, fcr=self.fcr, generator=self.gen_nb)
+        # NumPy codec of GF(2^16), incompatible with the codewords of GF(2^8). n and k are still counted in bytes, each
+        # symbol is 2 bytes, so they must be even.
+        elif algo == 6:
+            self.c_exp = 16
+            self.gen_nb = 2
+            self.prim = 0x1100b
+            self.fcr = 1
+            if n % 2 or k % 2:
+                raise ValueError("The codewords of GF(2^16) are made of 2 bytes symbols, %i and %i must be even" % (n, k))
         else:
             raise Exception("Specified algorithm %i is not supported!" % algo)
+        self.field_charac = int((2**self.c_exp) - 1)
 
         self.algo = algo
         self.n = n
         self.k = k
+        self._g = None
+        self._batch_codec = None
+
+    @property
+    def g(self):
+        '''Generator polynomials of reedsolo for every ecc size, indexed by the ecc size'''
+        if self._g is None:
+            self._g = generator_polys(self.n, self.fcr, self.gen_nb, self.prim)
+        return self._g
+
+    @property
+    def batch_codec(self):
+        '''Codec of algorithms 5 and 6, also used for the erasures of algorithms 3 and 4'''
+        if self._batch_codec is None:
+            if self.algo == 6:
+                self._batch_codec = rs16.RS16Codec(self.n // 2, prim=self.prim, generator=self.gen_nb, fcr=self.fcr)
+            else:
+                self._batch_codec = rs_batch.RSBatchCodec(self.n, prim=self.prim, generator=self.gen_nb, fcr=self.fcr)
+        return self._batch_codec
 
     def encode(self, message, k=None):
         '''Encode one message block (up to 255) into an ecc'''
@@ -204,17 +591,50 @@ class ECCMan(object):
         elif self.algo == 2:
             message, _ = self.pad(b(message), k=k)
             mesecc = self.ecc_manager.encode_fast(message, k=k)
-        elif self.algo == 3 or self.algo == 4:
+        elif self.algo == 3 or self.algo == 4 or self.algo == 5:
+            init_reedsolo_tables(self.gen_nb, self.prim)
             message, _ = self.pad(bytearray(b(message)), k=k)
             mesecc = rs_encode_msg(message, self.n-k, fcr=self.fcr, gen=self.g[self.n-k])
+        elif self.algo == 6:
+            message, _ = self.pad(b(message), k=k)
+            mesecc = message + self.batch_codec.encode(message, k=k // 2)
 
         ecc = mesecc[len(message):]
         return _bytes(ecc)
 
-    def decode(self, message, ecc, k=None, enable_erasures=False, erasures_char="\x00", only_erasures=False):
+    def encode_batch(self, messages, k=None, out=None):
+        '''
+        Encode a batch of message blocks that all have the same size k
+        Parameters
+        ----------
+        messages numpy.ndarray
+            uint8 array of shape (number of blocks, k), shorter blocks must already be padded with pad()
+        k int (optional)
+        out numpy.ndarray (optional)
+            uint8 array of shape (number of blocks, n-k) the ecc is written into, it can be a view like the ecc columns
+            of the records of a database. Algorithms 5 and 6 then allocate nothing per batch.
+        Returns
+        -------
+        numpy.ndarray
+            uint8 array of shape (number of blocks, n-k) with the ecc of each block, identical to encode()
+        '''
+        if not k: k = self.k
+        if self.algo == 5:
+            return self.batch_codec.encode_batch(messages, k=k, out=out)
+        elif self.algo == 6:
+            return self.batch_codec.encode_batch(messages, k=k // 2, out=out)
+        if out is None:
+            out = np.zeros((len(messages), self.n-k), dtype=np.uint8)
+        for i, message in enumerate(messages):
+            out[i] = np.frombuffer(self.encode(message.tobytes(), k=k), dtype=np.uint8)
+        return out
+
+    def decode(self, message, ecc, k=None, enable_erasures=False, erasures_char="\x00", only_erasures=False,
+               erase_pos=None):
         '''
         Repair a message and its ecc also, given the message and its ecc (both can be corrupted, we will still try to
-        fix both of them)
+        fix both of them). The erasures are the bytes equal to erasures_char with enable_erasures, or the positions in
+        the message given by erase_pos when they are known, like the unreadable sectors of the sector layout.
         '''
         if not k: k = self.k
         # Optimization, use bytearray
@@ -227,13 +647,16 @@ class ECCMan(object):
         # correct syndrome computation)
         # Note that this must be done before padding, else we risk counting the padded null bytes as erasures!
         erasures_pos = None
-        if enable_erasures:
+        if erase_pos is not None:
+            erasures_pos = list(erase_pos)
+            if only_erasures and not erasures_pos: return message, ecc
+        elif enable_erasures:
             # Concatenate to find erasures in the whole codeword
             mesecc = message + ecc
             # Convert char to a int (because we use a bytearray)
             if isinstance(erasures_char, str): erasures_char = ord(erasures_char)
             # Find the positions of the erased characters
-            erasures_pos = bytearray([i for i in range(len(mesecc)) if mesecc[i] == erasures_char])
+            erasures_pos = [i for i in range(len(mesecc)) if mesecc[i] == erasures_char]
             # Failing case: no erasures found and we want to only correct erasures, then we return the message as-is
             if only_erasures and not erasures_pos: return message, ecc
 
@@ -246,10 +669,24 @@ class ECCMan(object):
         # If the message was left padded, then we need to update the positions of the erasures
         if erasures_pos and pad:
             len_pad = len(pad)
-            erasures_pos = bytearray([x+len_pad for x in erasures_pos])
+            erasures_pos = [x+len_pad for x in erasures_pos]
+        # reedsolo expects a bytearray, the positions in the long codewords of algorithm 6 do not fit in one
+        if erasures_pos is not None and self.algo != 6:
+            erasures_pos = bytearray(erasures_pos)
 
         # Decoding
-        if self.algo == 1:
+        if self.algo in (3, 4, 5) and only_erasures and erasures_pos and \
+                len(set(erasures_pos)) == len(erasures_pos):
+            # every error position is known, the erased values are solved directly (see RSBatchCodec.decode_erasures)
+            if len(erasures_pos) > self.n - k:
+                raise reedsolo.ReedSolomonError("Too many erasures to correct")
+            codewords, decoded = self.batch_codec.decode_erasures(
+                np.frombuffer(bytes(message + ecc), dtype=np.uint8)[None, :], self.n - k, list(erasures_pos))
+            if not decoded[0]:
+                raise reedsolo.ReedSolomonError("Could not correct message")
+            msg_repaired = bytearray(codewords[0, :k].tobytes())
+            ecc_repaired = bytearray(codewords[0, k:].tobytes())
+        elif self.algo == 1:
             # Avoid automatic stripping because we are working with binary streams, thus we should manually strip
             # padding only when we know we padded
             msg_repaired, ecc_repaired = self.ecc_manager.decode(message + ecc, nostrip=True, k=k,
@@ -258,9 +695,10 @@ class ECCMan(object):
             msg_repaired, ecc_repaired = self.ecc_manager.decode_fast(message + ecc, nostrip=True, k=k,
                                                                       erasures_pos=erasures_pos,
                                                                       only_erasures=only_erasures)
-        elif self.algo == 3:
+        elif self.algo == 3 or self.algo == 5:
             # msg_repaired, ecc_repaired = self.ecc_manager.decode_fast(message + ecc, nostrip=True, k=k,
             # erasures_pos=erasures_pos, only_erasures=only_erasures)
+            init_reedsolo_tables(self.gen_nb, self.prim)
             msg_repaired, ecc_repaired, _ = reedsolo.rs_correct_msg_nofsynd(bytearray(message + ecc), self.n-k,
                                                                             fcr=self.fcr, generator=self.gen_nb,
                                                                             erase_pos=erasures_pos,
@@ -268,16 +706,63 @@ class ECCMan(object):
             msg_repaired = bytearray(msg_repaired)
             ecc_repaired = bytearray(ecc_repaired)
         elif self.algo == 4:
+            init_reedsolo_tables(self.gen_nb, self.prim)
             msg_repaired, ecc_repaired, _ = reedsolo.rs_correct_msg(bytearray(message + ecc), self.n-k, fcr=self.fcr,
                                                                     generator=self.gen_nb, erase_pos=erasures_pos,
                                                                     only_erasures=only_erasures)
             msg_repaired = bytearray(msg_repaired)
             ecc_repaired = bytearray(ecc_repaired)
+        elif self.algo == 6:
+            # a symbol is erased if any of its bytes is
+            if erasures_pos is not None:
+                erasures_pos = sorted(set(x // 2 for x in erasures_pos))
+            msg_repaired, ecc_repaired = self.batch_codec.decode(bytes(message), bytes(ecc), erase_pos=erasures_pos,
+                                                                 only_erasures=only_erasures)
 
         if pad: # Strip the null bytes if we padded the message before decoding
             msg_repaired = msg_repaired[len(pad):len(msg_repaired)]
         return _bytes(msg_repaired), _bytes(ecc_repaired)
 
+    def decode_batch(self, messages, eccs, k=None, erase_pos=None, only_erasures=False):
+        '''
+        Repair a batch of message blocks that all have the same size k, like decode() on each of them. Algorithm 5
+        decodes the whole batch at once with NumPy (see rs_batch.RSBatchCodec.decode_batch), the others block by block.
+        Parameters
+        ----------
+        messages numpy.ndarray
+            uint8 array of shape (number of blocks, k), shorter blocks must already be padded with pad()
+        eccs numpy.ndarray
+            uint8 array of shape (number of blocks, n-k)
+        k int (optional)
+        erase_pos list (optional)
+            Positions in the messages that are erased in every block, like the lost sectors of the sector layout
+        only_erasures bool (optional)
+        Returns
+        -------
+        list
+            The repaired messages and eccs as uint8 arrays of the same shapes, and a bool array of the blocks that could
+            be decoded, the others are left as they were (decode() raises for them)
+        '''
+        if not k: k = self.k
+        messages = np.asarray(messages, dtype=np.uint8)
+        eccs = np.asarray(eccs, dtype=np.uint8)
+        if self.algo == 5:
+            codewords, decoded = self.batch_codec.decode_batch(np.hstack((messages, eccs)), self.n - k,
+                                                               erase_pos=erase_pos, only_erasures=only_erasures)
+            return codewords[:, :k], codewords[:, k:], decoded
+        repaired_messages, repaired_eccs = messages.copy(), eccs.copy()
+        decoded = np.zeros(len(messages), dtype=bool)
+        for i in range(len(messages)):
+            try:
+                message, ecc = self.decode(messages[i].tobytes(), eccs[i].tobytes(), k=k, erase_pos=erase_pos,
+                                           only_erasures=only_erasures)
+            except (reedsolo.ReedSolomonError, brownanrs.RSCodecError):
+                continue
+            repaired_messages[i] = np.frombuffer(message, dtype=np.uint8)
+            repaired_eccs[i] = np.frombuffer(ecc, dtype=np.uint8)
+            decoded[i] = True
+        return repaired_messages, repaired_eccs, decoded
+
     def pad(self, message, k=None):
         '''
         Automatically left pad with null bytes a message if too small, or leave unchanged if not necessary. This allows
@@ -317,14 +802,41 @@ class ECCMan(object):
         ecc, _ = self.rpad(ecc, k=k)
         if self.algo == 1 or self.algo == 2:
             return self.ecc_manager.check_fast(message + ecc, k=k)
-        elif self.algo == 3 or self.algo == 4:
+        elif self.algo == 3 or self.algo == 4 or self.algo == 5:
+            init_reedsolo_tables(self.gen_nb, self.prim)
             return reedsolo.rs_check(bytearray(message + ecc), self.n-k, fcr=self.fcr, generator=self.gen_nb)
+        elif self.algo == 6:
+            return self.batch_codec.check(message, ecc)
+
+    def check_batch(self, messages, eccs, k=None):
+        '''
+        Check a batch of message blocks that all have the same size k with their ecc, like check() on each of them. The
+        codes are systematic, so a block is valid when its ecc is the one encoded from its message: the batch is
+        encoded with encode_batch and compared, which for algorithms 5 and 6 is done with NumPy. Smaller batches than
+        check_batch_min_blocks are checked block by block, the tables of encode_batch would take longer to build.
+        Parameters
+        ----------
+        messages numpy.ndarray
+            uint8 array of shape (number of blocks, k), shorter blocks must already be padded with pad()
+        eccs numpy.ndarray
+            uint8 array of shape (number of blocks, n-k), truncated eccs must already be padded with rpad()
+        k int (optional)
+        Returns
+        -------
+        numpy.ndarray
+            bool array of the valid blocks
+        '''
+        eccs = np.asarray(eccs, dtype=np.uint8)
+        if len(messages) < self.check_batch_min_blocks:
+            return np.array([bool(self.check(bytearray(message.tobytes()), bytearray(ecc.tobytes()), k=k))
+                             for message, ecc in zip(messages, eccs)], dtype=bool)
+        return (self.encode_batch(messages, k=k) == eccs).all(axis=1)
 
     def description(self):
         '''
         Provide a description for each algorithm available, useful to print in ecc file
         '''
-        if 0 < self.algo <= 3:
+        if 0 < self.algo <= 3 or self.algo == 5: # same codewords, so the same description
             return (f"Reed-Solomon with polynomials in Galois field of characteristic %{self.field_charac}"
                     f"(2^%{self.c_exp}) with generator=%{self.gen_nb}, prime poly=%{hex(self.prim)} and first"
                     f"consecutive root=%{self.fcr}.")
@@ -332,20 +844,250 @@ class ECCMan(object):
             return (f"Reed-Solomon with polynomials in Galois field of characteristic %{self.field_charac}"
                     f"(2^%{self.c_exp}) under US FAA ADSB UAT RS FEC standard with generator=%{self.gen_nb},"
                     f"prime poly=%{hex(self.prim)} and first consecutive root=%{self.fcr}.")
+        elif self.algo == 6:
+            return (f"Reed-Solomon with polynomials in Galois field of characteristic %{self.field_charac}"
+                    f"(2^%{self.c_exp}) with generator=%{self.gen_nb}, prime poly=%{hex(self.prim)}, first"
+                    f"consecutive root=%{self.fcr} and codewords of %{self.n // 2} symbols.")
         else:
             return "No description for this ECC algorithm."
 
-def compute_ecc_params(max_block_size, rate, hasher):
+class AutoECCMan(ECCMan):
+    '''
+    ECCMan of the algorithm "auto": each operation goes through the manager of the fastest algorithm on this machine, see
+    autotune_ecc_algo. They all produce the codewords of algorithms 1-3, so the databases do not depend on the choice.
+    '''
+    candidates = (1, 2, 3, 5) # algorithms with the same codewords
+    operations = ("encode", "encode_batch", "decode", "decode_batch", "check")
+
+    def __init__(self, n, k):
+        super().__init__(n, k, algo=3)
+        self.algo = "auto"
+        self.managers = {} # by algorithm
+
+    def manager(self, operation):
+        algo = autotune_ecc_algo()[operation]
+        if algo not in self.managers:
+            self.managers[algo] = ECCMan(self.n, self.k, algo=algo)
+        return self.managers[algo]
+
+    def encode(self, message, k=None):
+        return self.manager("encode").encode(message, k=k)
+
+    def encode_batch(self, messages, k=None, out=None):
+        return self.manager("encode_batch").encode_batch(messages, k=k, out=out)
+
+    def decode(self, message, ecc, k=None, enable_erasures=False, erasures_char="\x00", only_erasures=False,
+               erase_pos=None):
+        return self.manager("decode").decode(message, ecc, k=k, enable_erasures=enable_erasures,
+                                             erasures_char=erasures_char, only_erasures=only_erasures,
+                                             erase_pos=erase_pos)
+
+    def decode_batch(self, messages, eccs, k=None, erase_pos=None, only_erasures=False):
+        return self.manager("decode_batch").decode_batch(messages, eccs, k=k, erase_pos=erase_pos,
+                                                         only_erasures=only_erasures)
+
+    def check(self, message, ecc, k=None):
+        return self.manager("check").check(message, ecc, k=k)
+
+    def description(self):
+        return ECCMan(self.n, self.k, algo=3).description()
+
+def new_ecc_manager(n, k, algo):
+    '''
+    ECCMan of the algorithm, or AutoECCMan when it is "auto"
+    '''
+    return AutoECCMan(n, k) if algo == "auto" else ECCMan(n, k, algo=algo)
+
+@lru_cache(maxsize=None)
+def autotune_ecc_algo():
+    '''
+    Fastest algorithm of each operation of ECCMan (encode, encode_batch, decode and check) on this machine. The
+    algorithms are benchmarked once per machine and Python installation, see benchmark_ecc_algos, and the choice is
+    saved in tables_cache_dir so that the next runs and the processes of the pool read it instead.
+    Returns
+    -------
+    dict
+        Operation name to algorithm number
+    '''
+    machine = json.dumps([autotune_version, platform.node(), platform.machine(), platform.platform(),
+                          platform.python_version(), reedsolo.__file__, np.__version__])
+    path = os.path.join(tables_cache_dir, f"autotune_v{tables_cache_version}.json")
+    try:
+        with open(path) as f:
+            tuned = json.load(f)
+    except (OSError, ValueError):
+        tuned = {}
+    choice = tuned.get(machine)
+    if isinstance(choice, dict) and set(choice) == set(AutoECCMan.operations) and \
+            all(algo in AutoECCMan.candidates for algo in choice.values()):
+        return choice
+    print("Benchmarking the ECC algorithms on this machine, this is only done once.")
+    timings = benchmark_ecc_algos(AutoECCMan.candidates)
+    choice = {operation: min(seconds, key=seconds.get) for operation, seconds in timings.items()}
+    tuned[machine] = choice
+    try:
+        os.makedirs(tables_cache_dir, exist_ok=True)
+        tmp_path = path + ".%i.tmp" % os.getpid()
+        with open(tmp_path, 'w') as f:
+            json.dump(tuned, f, indent=1)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: the choice of ECC algorithms could not be cached in {tables_cache_dir}: {e}")
+    return choice
+
+def benchmark_ecc_algos(candidates, message_sizes=(159, 213), blocks=64, batch_blocks=1024, budget=0.05):
+    '''
+    Seconds per block of each operation of the candidate algorithms, on random blocks of the message sizes of the
+    variable rate (0.3 and 0.1). The results of every algorithm are compared to the ones of algorithm 3, and an algorithm
+    with a different result is left out of that operation. Each operation runs once per message size to build the
+    tables, then is timed until budget seconds are spent, so the slow pure Python algorithms are only timed on a few
+    blocks. encode_batch and decode_batch are only timed for the algorithms with an encode or decode at most 10 times
+    slower than the fastest, the others go through batches block by block.
+    Parameters
+    ----------
+    candidates list
+        Algorithms compatible with algorithm 3
+    message_sizes list (optional)
+    blocks int (optional)
+        Blocks of each message size
+    batch_blocks int (optional)
+        Blocks of each batch of encode_batch, about the blocks of a range of config.ecc_range_size go in one batch.
+        A quarter of them go in the batches of decode_batch.
+    budget float (optional)
+        Seconds spent timing an operation of an algorithm, after the first block
+    Returns
+    -------
+    dict
+        Operation name to a dict of algorithm to seconds per block
+    '''
+    n = parameters["max_block_size"]
+    rng = np.random.default_rng(0)
+    reference = ECCMan(n, message_sizes[0], algo=3)
+    calls = {operation: [] for operation in AutoECCMan.operations}
+    for k in message_sizes:
+        messages = rng.integers(0, 256, (batch_blocks, k), dtype=np.uint8)
+        eccs = reference.encode_batch(messages, k=k)
+        calls["encode_batch"].append(((messages, k), eccs.tobytes()))
+        for message, ecc in zip(messages[:blocks], eccs[:blocks]):
+            message, ecc = message.tobytes(), ecc.tobytes()
+            calls["encode"].append(((message, k), ecc))
+            calls["check"].append(((message, ecc, k), True))
+            # a quarter of the errors that can be corrected
+            codeword = bytearray(message + ecc)
+            for pos in rng.choice(n, (n - k) // 4, replace=False):
+                codeword[pos] ^= int(rng.integers(1, 256))
+            calls["decode"].append(((bytes(codeword[:k]), bytes(codeword[k:]), k), (message, ecc)))
+        # the same damage on every block of a batch
+        decode_blocks = batch_blocks // 4
+        codewords = np.hstack((messages, eccs))[:decode_blocks]
+        positions = rng.random((decode_blocks, n)).argsort(axis=1)[:, :(n - k) // 4]
+        np.bitwise_xor.at(codewords, (np.arange(decode_blocks)[:, None], positions),
+                          rng.integers(1, 256, positions.shape, dtype=np.uint8))
+        calls["decode_batch"].append(((codewords[:, :k], codewords[:, k:], k), messages[:decode_blocks].tobytes()))
+    # alternate the message sizes, the budget may stop the timing of an algorithm before the last call
+    for operation in ("encode", "check", "decode"):
+        calls[operation] = [call for pair in zip(*[calls[operation][i * blocks:(i + 1) * blocks]
+                                                   for i in range(len(message_sizes))]) for call in pair]
+    timings = {operation: {} for operation in AutoECCMan.operations}
+    for algo in candidates:
+        manager = ECCMan(n, message_sizes[0], algo=algo)
+        operations = {"encode": manager.encode, "decode": manager.decode,
+                      "check": lambda message, ecc, k: bool(manager.check(message, ecc, k))}
+        for operation in ("encode", "check", "decode"):
+            seconds = time_calls(operations[operation], calls[operation], len(message_sizes), budget)
+            if seconds is not None:
+                timings[operation][algo] = seconds
+    for algo in candidates:
+        manager = ECCMan(n, message_sizes[0], algo=algo)
+        batch_operations = {
+            "encode_batch": lambda messages, k: manager.encode_batch(messages, k).tobytes(),
+            "decode_batch": lambda messages, eccs, k: manager.decode_batch(messages, eccs, k)[0].tobytes()}
+        for operation, single in (("encode_batch", "encode"), ("decode_batch", "decode")):
+            if timings[single].get(algo, float("inf")) > 10 * min(timings[single].values()):
+                continue
+            seconds = time_calls(batch_operations[operation], calls[operation], len(message_sizes), budget)
+            if seconds is not None:
+                timings[operation][algo] = seconds / len(calls[operation][0][0][0])
+    return timings
+
+def time_calls(function, calls, warmup, budget):
+    '''
+    Seconds per call of function on the arguments of calls, after the first warmup calls. Returns None when a result is
+    not the expected one.
+    Parameters
+    ----------
+    function function
+    calls list
+        Tuples of the arguments and the expected result
+    warmup int
+        Calls that are not timed
+    budget float
+        Seconds after which the remaining calls are skipped
+    '''
+    for args, expected in calls[:warmup]:
+        if function(*args) != expected:
+            return None
+    count = 0
+    start = time.perf_counter()
+    for args, expected in calls[warmup:] or calls:
+        if function(*args) != expected:
+            return None
+        count += 1
+        if time.perf_counter() - start > budget:
+            break
+    return (time.perf_counter() - start) / count
+
+def init_reedsolo_tables(generator, prim):
+    '''
+    The Galois field tables of reedsolo are global to the library, build them for these parameters if they are not the
+    current ones. This is cheap, but only done when a block is encoded, decoded or checked.
+    '''
+    global reedsolo_tables
+    if reedsolo_tables != (generator, prim):
+        reedsolo.init_tables(generator=generator, prim=prim)
+        reedsolo_tables = (generator, prim)
+
+@lru_cache(maxsize=None)
+def generator_polys(n, fcr, generator, prim):
+    '''
+    Generator polynomials of reedsolo for every ecc size of codewords of n symbols, like rs_generator_poly_all. They take
+    a noticeable time to compute for n=255, and every process of the pool needs them, so they are saved once in a
+    versioned file of tables_cache_dir and loaded from it afterwards.
+    '''
+    path = os.path.join(tables_cache_dir,
+                        f"generator_polys_v{tables_cache_version}_{n}_{fcr}_{generator}_{hex(prim)}.npy")
+    # the polynomial of nsym ecc symbols has nsym+1 coefficients, they are concatenated from nsym=0 to n-1
+    offsets = np.cumsum([0] + [nsym + 1 for nsym in range(n)])
+    try:
+        flat = np.load(path)
+        if flat.dtype != np.uint8 or flat.shape != (offsets[-1],):
+            raise ValueError("Unexpected shape of %s" % path)
+    except (OSError, ValueError):
+        init_reedsolo_tables(generator, prim)
+        polys = reedsolo.rs_generator_poly_all(n, fcr=fcr, generator=generator)
+        flat = np.concatenate([np.frombuffer(bytes(poly), dtype=np.uint8) for poly in polys])
+        try:
+            os.makedirs(tables_cache_dir, exist_ok=True)
+            tmp_path = path + ".%i.tmp" % os.getpid() # other processes may be writing it at the same time
+            with open(tmp_path, 'wb') as f:
+                np.save(f, flat)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: the generator polynomials could not be cached in {tables_cache_dir}: {e}")
+    return [bytearray(flat[offsets[nsym]:offsets[nsym + 1]].tobytes()) for nsym in range(n)]
+
+def compute_ecc_params(max_block_size, rate, hasher, symbol_size=1):
     '''
     Compute the ecc parameters (size of the message, size of the hash, size of the ecc). This is an helper function to
-    easily compute the parameters from a resilience rate to instanciate an ECCMan object.
+    easily compute the parameters from a resilience rate to instanciate an ECCMan object. The sizes are whole numbers of
+    symbols of symbol_size bytes.
     https://github.com/lrq3000/pyFileFixity/blob/496b0518ebd51cdcd594fcd63a85066a13d1921c/pyFileFixity/lib/eccman.py#L55
     '''
     # message_size = max_block_size - int(round(max_block_size * rate * 2, 0)) # old way to compute, wasn't really
     # correct because we applied the rate on the total message+ecc size, when we should apply the rate to the message
     # size only (that is not known beforehand, but we want the ecc size (k) = 2*rate*message_size or in other words
     # that k + k * 2 * rate = n)
-    message_size = int(round(float(max_block_size) / (1 + 2*rate), 0))
+    message_size = symbol_size * int(round(float(max_block_size // symbol_size) / (1 + 2*rate), 0))
     ecc_size = max_block_size - message_size
     hash_size = len(hasher) # 32 when we use MD5
     return {"message_size": message_size, "ecc_size": ecc_size, "hash_size": hash_size}
@@ -363,79 +1105,515 @@ def compute_ecc_hash_from_string(string, ecc_manager, hasher, max_block_size, re
                                                                      len(string), [resilience_rate])])
     return ecc_stream
 
-def stream_compute_ecc_hash(ecc_manager, hasher, file, max_block_size, header_size, resilience_rates):
+def stream_compute_ecc_hash(ecc_manager, hasher, file, max_block_size, header_size, resilience_rates, size=None):
     '''
-    Generate a stream of hash/ecc blocks, of variable encoding rate and size, given a file.
+    Generate a stream of hash/ecc blocks, of variable encoding rate and size, given a file. When its size is given,
+    the file is only read sequentially, so it can be a pipe.
     '''
-    curpos = file.tell() # init the reading cursor at the beginning of the file
-    # Find the total size to know when to stop
-    #size = os.fstat(file.fileno()).st_size # old way of doing it, doesn't work with _StringIO objects
-    file.seek(0, os.SEEK_END) # alternative way of finding the total size: go to the end of the file
-    size = file.tell()
-    file.seek(0, curpos) # place the reading cursor back at the beginning of the file
+    if size is None:
+        curpos = file.tell() # init the reading cursor at the beginning of the file
+        # Find the total size to know when to stop
+        #size = os.fstat(file.fileno()).st_size # old way of doing it, doesn't work with _StringIO objects
+        file.seek(0, os.SEEK_END) # alternative way of finding the total size: go to the end of the file
+        size = file.tell()
+        file.seek(0, curpos) # place the reading cursor back at the beginning of the file
+    # The rate and thus the ecc parameters of each block are given by the block plan of the file
+    plan = get_block_plan(size, max_block_size, header_size, resilience_rates, hasher)
     # Main encoding loop
-    while curpos < size: # Continue encoding while we do not reach the end of the file
-        # Calculating the encoding rate
-        if curpos < header_size: # if we are still reading the file's header, we use a constant rate
-            rate = resilience_rates[0]
-        # else we use a progressive rate for the rest of the file the we calculate on-the-fly depending on our current
-        # reading cursor position in the file
-        else:
-            # find the rate for the current stream of data (interpolate between stage 2 and stage 3 rates depending on
-            # the cursor position in the file)
-            rate = feature_scaling(curpos, header_size, size, resilience_rates[1], resilience_rates[2])
-
-        # Compute the ecc parameters given the calculated rate
-        ecc_params = compute_ecc_params(max_block_size, rate, hasher)
+    for run in range(plan.nb_runs):
+        ecc_params = plan.ecc_params(run)
         # ecc_manager = ECCMan(max_block_size, ecc_params["message_size"]) # not necessary to create an ecc manager
         # anymore, as it is very costly. Now we can specify a value for k on the fly (tables for all possible values of
         # k are pre-generated in the reed-solomon libraries)
+        for _ in range(int(plan.counts[run])):
+            # Compute the ecc and hash for the current message block
+            mes = file.read(ecc_params["message_size"])
+            hash = hasher.hash(mes)
+            ecc = ecc_manager.encode(mes, k=ecc_params["message_size"])
+            # Return the result
+            yield [b(hash), b(ecc), ecc_params]
+
+def compute_block_rate(curpos, size, header_size, resilience_rates):
+    '''
+    Resilience rate of the block starting at the cursor position curpos of a file of the given size. Together with
+    compute_ecc_params, this fully determines the block boundaries of a file.
+    '''
+    if curpos < header_size: # if we are still reading the file's header, we use a constant rate
+        return resilience_rates[0]
+    # else we use a progressive rate for the rest of the file the we calculate on-the-fly depending on our current
+    # reading cursor position in the file (interpolate between stage 2 and stage 3 rates)
+    return feature_scaling(curpos, header_size, size, resilience_rates[1], resilience_rates[2])
+
+class BlockPlan(object):
+    '''
+    Layout of the hash/ecc blocks of a file: where each message block starts, its size and the size of its ecc record.
+    It is computed once per file size and parameters and stored as arrays of runs of consecutive blocks sharing the same
+    message size, which are only a few dozens even for very large files.
+    Parameters
+    ----------
+    size int
+        Size in bytes of the file, or of the field for the intra ecc
+    max_block_size int
+    header_size int
+    resilience_rates list
+    hasher Hasher
+    constantmode bool (optional)
+        Use the first resilience rate for every block, like the intra ecc of the entries metadata
+    symbol_size int (optional)
+        Bytes of the symbols of the codewords, 2 in GF(2^16), the message sizes are multiples of it
+    sector_size int (optional)
+        Sector-aligned layout for optical discs when not 0, see encode_sector_groups: each block is then a group of as
+        many sectors as there are symbols in the message of its codewords, and its record holds the hash of each sector
+        followed by the ecc of the sector_size / symbol_size codewords interleaved across them
+    '''
+    def __init__(self, size, max_block_size, header_size, resilience_rates, hasher, constantmode=False,
+                 symbol_size=1, sector_size=0):
+        if sector_size % symbol_size:
+            raise ValueError(f"Sectors of {sector_size} bytes are not made of whole symbols of {symbol_size} bytes")
+        self.size = size
+        self.max_block_size = max_block_size
+        self.symbol_size = symbol_size
+        self.sector_size = sector_size
+        self.header_size = header_size
+        self.resilience_rates = resilience_rates
+        self.hasher = hasher
+        self.hash_size = len(hasher)
+        self.constantmode = constantmode
+        offsets, message_sizes, counts = [], [], []
+        curpos = 0
+        while curpos < size:
+            message_size = self.message_size_at(curpos)
+            # the rate is constant in the header and linear afterwards, so inside each stage the message size is
+            # monotonic and the number of consecutive blocks of the same size is found with a binary search
+            if curpos < header_size and not constantmode:
+                stage_end = min(header_size, size)
+            else:
+                stage_end = size
+            low, high = 1, -(-(stage_end - curpos) // message_size)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self.message_size_at(curpos + (middle - 1) * message_size) == message_size:
+                    low = middle
+                else:
+                    high = middle - 1
+            offsets.append(curpos)
+            message_sizes.append(message_size)
+            counts.append(low)
+            curpos += low * message_size
+        self.nb_runs = len(offsets)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.message_sizes = np.array(message_sizes, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        if sector_size:
+            # message bytes of the codewords of a group, one symbol of each of its sectors
+            self.codeword_sizes = self.message_sizes // sector_size * symbol_size
+            self.ecc_sizes = (max_block_size - self.codeword_sizes) * (sector_size // symbol_size)
+            self.record_sizes = self.hash_size * (self.message_sizes // sector_size) + self.ecc_sizes
+        else:
+            self.codeword_sizes = self.message_sizes
+            self.ecc_sizes = max_block_size - self.message_sizes
+            self.record_sizes = self.hash_size + self.ecc_sizes
+        run_ecc_sizes = self.counts * self.record_sizes
+        # index of the first block and position of its record in the ecc track, for each run
+        self.first_blocks = np.concatenate(([0], np.cumsum(self.counts)[:-1])).astype(np.int64)
+        self.ecc_offsets = np.concatenate(([0], np.cumsum(run_ecc_sizes)[:-1])).astype(np.int64)
+        self.nb_blocks = int(self.counts.sum())
+        self.ecc_size = int(run_ecc_sizes.sum()) # exact size of the hash/ecc track of the file
+
+    def message_size_at(self, curpos):
+        '''Message size of the block starting at curpos, the size of its group of sectors in the sector layout'''
+        if self.constantmode:
+            rate = self.resilience_rates[0]
+        else:
+            rate = compute_block_rate(curpos, self.size, self.header_size, self.resilience_rates)
+        message_size = compute_ecc_params(self.max_block_size, rate, self.hasher, self.symbol_size)["message_size"]
+        if self.sector_size:
+            return message_size // self.symbol_size * self.sector_size
+        return message_size
+
+    def ecc_params(self, run):
+        '''
+        Same parameters as compute_ecc_params for the blocks of a run. In the sector layout, the hash size is the size
+        of the hash of each sector and the ecc size the size of the ecc of the whole group, and codeword_size is the
+        message size of its codewords.
+        '''
+        return {"message_size": int(self.message_sizes[run]), "ecc_size": int(self.ecc_sizes[run]),
+                "hash_size": self.hash_size, "codeword_size": int(self.codeword_sizes[run]),
+                "record_size": int(self.record_sizes[run])}
+
+    def locate(self, pos):
+        '''
+        Find the block containing the byte at position pos of the file, in O(log n).
+        Returns
+        -------
+        list
+            Index of the block, position of the block in the file, index of its run and position of its hash/ecc
+            record in the ecc track
+        '''
+        run = int(np.searchsorted(self.offsets, pos, side='right')) - 1
+        i = (pos - int(self.offsets[run])) // int(self.message_sizes[run])
+        return [int(self.first_blocks[run]) + i, int(self.offsets[run]) + i * int(self.message_sizes[run]), run,
+                int(self.ecc_offsets[run]) + i * int(self.record_sizes[run])]
+
+    def runs(self, start=0, end=None):
+        '''
+        Iterate over the runs of blocks between the block boundaries start and end, yielding the run index, the position
+        of its first block and its number of blocks. The last block of the file may be shorter than its message size.
+        '''
+        if end is None: end = self.size
+        if start >= end:
+            return
+        first_run = self.locate(start)[2]
+        for run in range(first_run, self.nb_runs):
+            offset = int(self.offsets[run])
+            if offset >= end:
+                break
+            message_size = int(self.message_sizes[run])
+            skipped = max(0, start - offset) // message_size
+            count = min(int(self.counts[run]), -(-(end - offset) // message_size)) - skipped
+            yield run, offset + skipped * message_size, count
+
+    def records_size(self, start, end):
+        '''Size of the hash/ecc records of the blocks between the block boundaries start and end'''
+        ecc_end = self.ecc_size if end >= self.size else self.locate(end)[3]
+        return ecc_end - self.locate(start)[3]
+
+    def blocks(self):
+        '''Iterate over every block, yielding its position in the file, its run and the position of its record'''
+        for run in range(self.nb_runs):
+            offset, ecc_offset = int(self.offsets[run]), int(self.ecc_offsets[run])
+            message_size, record_size = int(self.message_sizes[run]), int(self.record_sizes[run])
+            for i in range(int(self.counts[run])):
+                yield offset + i * message_size, run, ecc_offset + i * record_size
+
+    def ranges(self, range_size, start=0):
+        '''
+        Split the file from the block boundary start into [start, end) byte ranges made of whole blocks, each about
+        range_size bytes long, so that every range can be encoded independently of the others.
+        '''
+        range_start = start
+        while range_start < self.size:
+            target = range_start + range_size
+            if target >= self.size:
+                range_end = self.size
+            else:
+                _, block_start, run, _ = self.locate(target)
+                range_end = block_start if block_start == target else block_start + int(self.message_sizes[run])
+            yield range_start, min(range_end, self.size)
+            range_start = range_end
+
+@lru_cache(maxsize=256)
+def _cached_block_plan(size, max_block_size, header_size, resilience_rates, hasher, constantmode, symbol_size,
+                       sector_size):
+    return BlockPlan(size, max_block_size, header_size, resilience_rates, hasher, constantmode=constantmode,
+                     symbol_size=symbol_size, sector_size=sector_size)
+
+def get_block_plan(size, max_block_size, header_size, resilience_rates, hasher, constantmode=False, symbol_size=1,
+                   sector_size=0):
+    '''
+    Cached BlockPlan for these parameters, so that the layout of a file is only computed once
+    '''
+    return _cached_block_plan(size, max_block_size, header_size, tuple(resilience_rates), hasher, constantmode,
+                              symbol_size, sector_size)
+
+def track_code(field_bits, long_block_size=None):
+    '''
+    Size in bytes of the codewords of the ecc tracks and of their symbols, for the Galois field GF(2^field_bits). The
+    codewords of GF(2^8) are parameters["max_block_size"] bytes, the ones of GF(2^16) long_block_size symbols of 2
+    bytes, config.ecc_long_block_size by default.
+    Returns
+    -------
+    list
+        max_block_size and symbol_size
+    '''
+    if field_bits == 8:
+        return [parameters["max_block_size"], 1]
+    elif field_bits == 16:
+        if long_block_size is None:
+            long_block_size = config.ecc_long_block_size
+        if not 0 < long_block_size <= 65535:
+            raise ValueError("The codewords of GF(2^16) have at most 65535 symbols, not %i" % long_block_size)
+        return [2 * long_block_size, 2]
+    raise ValueError("Unsupported Galois field GF(2^%s) for the ecc tracks" % field_bits)
 
-        # Compute the ecc and hash for the current message block
-        mes = file.read(ecc_params["message_size"])
-        hash = hasher.hash(mes)
-        ecc = ecc_manager.encode(mes, k=ecc_params["message_size"])
-        # print("mes %i (%i) - ecc %i (%i) - hash %i (%i)" % (len(mes), message_size, len(ecc), ecc_params["ecc_size"],
-        # len(hash), ecc_params["hash_size"]))
+@lru_cache(maxsize=None)
+def get_track_manager(max_block_size, symbol_size):
+    '''
+    ECC manager of the tracks of the files, for codewords of max_block_size bytes made of symbols of symbol_size bytes
+    (see track_code), always the same object so that its tables are only built once
+    '''
+    if symbol_size == 2:
+        return ECCMan(max_block_size, 2, algo=6)
+    return new_ecc_manager(max_block_size, 1, parameters["ecc_algo"])
 
-        # Return the result
-        yield [b(hash), b(ecc), ecc_params]
-        # Prepare for next iteration
-        curpos = file.tell()
+def compute_ecc_hash_range(input_path, start, end, size, max_block_size, header_size, resilience_rates, hash_algo,
+                           symbol_size=1, sector_size=0, out=None):
+    '''
+    Compute the concatenated hash/ecc records for the blocks of input_path between start and end, which must be block
+    boundaries (see BlockPlan.ranges). This is the unit of work of parallel_compute_ecc_hash and runs inside a worker
+    process, so it only relies on its arguments: the hasher named hash_algo and the ecc manager of the track for
+    max_block_size and symbol_size (see get_track_manager), with the layout of sector_size (see BlockPlan).
+    The range is read with a single call into a buffer reused by the next ranges of the thread, then encoded by
+    encode_ecc_hash_blocks, into out when given.
+    '''
+    hasher = get_hasher(hash_algo)
+    plan = get_block_plan(size, max_block_size, header_size, resilience_rates, hasher, symbol_size=symbol_size,
+                          sector_size=sector_size)
+    data = rs_batch.scratch_arrays(range_scratch, {"data": ((end - start,), np.uint8)})[0]
+    with open(input_path, 'rb') as file:
+        file.seek(start)
+        data[file.readinto(data):] = 0 # like a file that was truncated while reading it
+    return encode_ecc_hash_blocks(data, start, end, plan, hasher, out=out)
+
+def encode_ecc_hash_blocks(data, start, end, plan, hasher, out=None):
+    '''
+    Concatenated hash/ecc records of data, the content of the file between the block boundaries start and end. Blocks
+    are views of data without copies, and consecutive blocks with the same message size are encoded together with
+    ECCMan.encode_batch directly into the records. They are written into out when given, a writable buffer of at least
+    plan.records_size(start, end) bytes, and a memoryview of them is returned: the encoding then allocates nothing but
+    the hash of each block. Otherwise they are returned in a new bytearray.
+    '''
+    view = memoryview(data).cast('B')
+    ecc_manager = get_track_manager(plan.max_block_size, plan.symbol_size)
+    records_size = plan.records_size(start, end)
+    if out is None:
+        records = bytearray(records_size)
+    else:
+        records = memoryview(out).cast('B')[:records_size]
+        if len(records) < records_size:
+            raise ValueError(f"The output buffer of {len(records)} bytes is smaller than the {records_size} bytes of "
+                             "records")
+    records_array = np.frombuffer(records, dtype=np.uint8)
+    hash_size = plan.hash_size
+    hash_block = hasher.hash
+    offset = 0 # in data
+    position = 0 # in records
+    for run, _, count in plan.runs(start, end):
+        message_size = int(plan.message_sizes[run])
+        record_size = int(plan.record_sizes[run])
+        if plan.sector_size:
+            for _ in range(count):
+                group = view[offset:offset + message_size]
+                encode_sector_group(group, records_array[position:position + record_size],
+                                    int(plan.codeword_sizes[run]), plan, ecc_manager, hasher)
+                offset += len(group)
+                position += record_size
+            continue
+        # only the last block of the file can be shorter than its message size
+        full = min(count, (len(view) - offset) // message_size)
+        messages = np.frombuffer(view, dtype=np.uint8, count=full * message_size, offset=offset)
+        # each record is the hash followed by the ecc of the block
+        run_records = records_array[position:position + full * record_size].reshape(full, record_size)
+        ecc_manager.encode_batch(messages.reshape(full, message_size), k=message_size, out=run_records[:, hash_size:])
+        for i in range(full):
+            records[position:position + hash_size] = hash_block(view[offset:offset + message_size])
+            offset += message_size
+            position += record_size
+        if full < count:
+            mes = bytes(view[offset:])
+            records[position:position + hash_size] = hash_block(mes)
+            records[position + hash_size:position + record_size] = ecc_manager.encode(mes, k=message_size)
+            offset = len(view)
+            position += record_size
+    return records
+
+def encode_sector_group(group, record, codeword_size, plan, ecc_manager, hasher):
+    '''
+    Write the record of a group of sectors, in the sector-aligned layout (see BlockPlan): the hash of each sector, then
+    the ecc of each codeword. Codeword i is made of the symbol i of every sector of the group, so an unreadable sector
+    is one erasure at a known position in every codeword, instead of errors smeared over a few consecutive blocks. The
+    codewords of a group are encoded as one batch. The last group of a file is padded with null bytes.
+    Parameters
+    ----------
+    group bytes-like
+    record numpy.ndarray
+        uint8 array of the record, written in place
+    codeword_size int
+        Size of the messages of the codewords, in bytes
+    plan BlockPlan
+    ecc_manager ECCMan
+    hasher Hasher
+    '''
+    sector_size, symbol_size = plan.sector_size, plan.symbol_size
+    sectors = codeword_size // symbol_size
+    if len(group) < sectors * sector_size:
+        group = bytes(group) + bytes(sectors * sector_size - len(group))
+    hash_size = len(hasher)
+    for i in range(sectors):
+        record[i * hash_size:(i + 1) * hash_size] = np.frombuffer(
+            hasher.hash(group[i * sector_size:(i + 1) * sector_size]), dtype=np.uint8)
+    messages = sector_codewords(np.frombuffer(group, dtype=np.uint8, count=sectors * sector_size), sectors,
+                                sector_size, symbol_size)
+    ecc_manager.encode_batch(messages, k=codeword_size,
+                             out=record[sectors * hash_size:].reshape(sector_size // symbol_size, -1))
+
+def sector_codewords(symbols, sectors, sector_size, symbol_size):
+    '''
+    Messages of the codewords of a group of sectors, of shape (sector_size / symbol_size, codeword size), from the
+    uint8 array of its sectors, see encode_sector_group
+    '''
+    return (symbols.reshape(sectors, sector_size // symbol_size, symbol_size).transpose(1, 0, 2)
+            .reshape(sector_size // symbol_size, sectors * symbol_size))
+
+def codeword_sectors(messages, sectors, sector_size, symbol_size):
+    '''
+    Bytes of a group of sectors from the messages of its codewords, the inverse of sector_codewords
+    '''
+    return (np.asarray(messages, dtype=np.uint8).reshape(sector_size // symbol_size, sectors, symbol_size)
+            .transpose(1, 0, 2).tobytes())
+
+def ecc_process_pool(workers):
+    '''
+    Pool of processes encoding ranges of files, see compute_ecc_hash_range, or decoding the blocks of a repair, see
+    repair.BlockDecoder
+    '''
+    if parameters["ecc_algo"] == "auto":
+        autotune_ecc_algo() # once here, instead of a benchmark in every process at the same time
+    # spawn instead of fork, the calling thread usually belongs to a Qt application
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def parallel_compute_ecc_hash(db, input_path, size, workers, progress_function, total_estimate, start, executor=None,
+                              input_offset=0, checkpoint_function=None):
+    '''
+    Encode the hash/ecc records of a file from input_offset with a pool of processes and write them to the database in
+    order. At most 2 ranges per worker are in flight, which bounds the memory held by results waiting to be written.
+    The pool is created for this file unless a shared executor is given. checkpoint_function is called with the input
+    offset written so far every config.ecc_checkpoint_interval seconds and on shutdown.
+    Returns False if progress_function asked for a shutdown.
+    '''
+    ranges = get_block_plan(size, track_block_size, parameters["header_size"], parameters["resilience_rates"], hasher,
+                            symbol_size=symbol_size, sector_size=sector_size).ranges(config.ecc_range_size,
+                                                                                     start=input_offset)
+    with (ecc_process_pool(workers) if executor is None else nullcontext(executor)) as executor:
+        pending = deque() # futures with the end of their range
+        last_update = 0
+        last_checkpoint = time.time()
+        for range_start, range_end in ranges:
+            pending.append((executor.submit(compute_ecc_hash_range, input_path, range_start, range_end, size,
+                                            track_block_size, parameters["header_size"],
+                                            parameters["resilience_rates"], hasher.algo, symbol_size, sector_size),
+                            range_end))
+            # keep the pool busy but write the oldest range before submitting more
+            while len(pending) >= workers * 2 or (pending and pending[0][0].done()):
+                future, written = pending.popleft()
+                db.write(future.result())
+                if checkpoint_function and time.time() - last_checkpoint >= config.ecc_checkpoint_interval:
+                    checkpoint_function(written)
+                    last_checkpoint = time.time()
+                elapsed = int(time.time() - start)
+                if elapsed != last_update: # update the progress at most once per second
+                    last_update = elapsed
+                    if progress_function(db.tell(), total_estimate, elapsed):
+                        for future, _ in pending:
+                            future.cancel()
+                        if checkpoint_function:
+                            checkpoint_function(written) # to resume from here
+                        return False
+        while pending:
+            db.write(pending.popleft()[0].result())
+    return True
+
+def database_header():
+    '''
+    Header of an ecc database: identifier with the version, parameters, hasher and description of the ecc algorithm.
+    The version 3 stores md5 hexadecimal digests and has no hasher line, the version 4 stores the binary digests of the
+    hasher that it names. The tracks of a version 4 database with a field line are encoded in GF(2^16), with the number
+    of symbols of its codewords (see track_code), else in GF(2^8). With a layout line, they are interleaved across the
+    sectors of the given size (see BlockPlan).
+    '''
+    version = "3.1.4" if hasher.algo == "md5" and symbol_size == 1 and not sector_size else "4.0.0"
+    # each character in the version will be repeated 3 times, so that in case of tampering, a majority vote can try
+    # to disambiguate
+    header = [b("**PYSTRUCTADAPTECCv%s**\n" % (''.join([x * 3 for x in version])))]
+    # Write the parameters (they are NOT reloaded automatically! It's the user role to memorize those parameters
+    # (using any means: own brain memory, keep a copy on paper, on email, etc.), so that the parameters are NEVER
+    # tampered. The parameters MUST be ultra reliable so that errors in the ECC file can be more efficiently recovered.
+    for i in range(3): header.append(("** Parameters: " + " ".join(
+        parameters) + "\n").encode())  # copy them 3 times just to be redundant in case of ecc file corruption
+    if version != "3.1.4":
+        # the hasher is needed to read the database, it's also copied 3 times for a majority vote
+        for i in range(3): header.append(b("** Hasher: %s\n" % hasher.algo))
+    if symbol_size != 1:
+        # the field and codeword size are needed to read the tracks, also copied 3 times
+        for i in range(3): header.append(b("** Field: %i %i\n" % (8 * symbol_size, track_block_size // symbol_size)))
+    if sector_size:
+        for i in range(3): header.append(b("** Layout: sectors %i\n" % sector_size))
+    header.append(b("** Generated under %s\n" % ecc_manager_variable.description()))
+    return b''.join(header)
+
+@lru_cache(maxsize=None)
+def get_hasher(algo):
+    '''
+    Hasher for an algorithm, always the same object so that it can be used as a key of cached block plans
+    '''
+    return Hasher(algo)
+
+@lru_cache(maxsize=1024)
+def ecc_file_sizes(filesize, relfilepath):
+    '''
+    Exact sizes in bytes of the ecc database and of its index generated for a file
+    Parameters
+    ----------
+    filesize int
+    relfilepath str
+        Path of the file stored in the database, its base name
+    Returns
+    -------
+    list
+        Size of the database (.txt) and size of the index (.txt.idx)
+    '''
+    return [len(database_header()) + ecc_entry_size(filesize, relfilepath), index_entry_size()]
+
+def archive_ecc_sizes(filesizes, relfilepaths):
+    '''
+    Exact sizes in bytes of the ecc database and of its index generated for several files, see generate_archive_ecc
+    '''
+    return [len(database_header()) + sum(ecc_entry_size(size, path) for size, path in zip(filesizes, relfilepaths)),
+            len(filesizes) * index_entry_size()]
+
+def ecc_entry_size(filesize, relfilepath):
+    '''
+    Size of the entry of a file in an ecc database
+    '''
+    def intra_ecc_size(field_size):
+        # same plan as compute_ecc_hash_from_string
+        return get_block_plan(field_size, parameters["max_block_size"], field_size,
+                              [parameters["resilience_rate_intra"]], hasher_intra).ecc_size
+    # entrymarker, the metadata fields with their intra ecc, each followed by a field delimiter, then the ecc track
+    return (len(parameters["entrymarker"]) + len(b(relfilepath)) + len(str(filesize))
+            + intra_ecc_size(len(relfilepath)) + intra_ecc_size(len(str(filesize)))
+            + len(parameters["field_delim"]) * 4
+            + get_block_plan(filesize, track_block_size, parameters["header_size"],
+                             parameters["resilience_rates"], hasher, symbol_size=symbol_size,
+                             sector_size=sector_size).ecc_size)
+
+def index_entry_size():
+    '''
+    Size of the records of an entry in the index: 5 markers, each with its type, position and ecc
+    '''
+    return 5 * (1 + 8 + ecc_params_idx["ecc_size"])
 
 def estimate_total_size(input_path):
-    size = os.stat(input_path).st_size
-    # Compute predicted size of their headers
-    if size >= parameters["header_size"]:  # for big files, we limit the size to the header size
-        filesize_header = parameters["header_size"]
-        filesize_content = size - parameters["header_size"]
-    else:  # else for size smaller than the defined header size, it will just be the size of the file
-        filesize_header = size
-        filesize_content = 0
-    # Size of the ecc entry for this file will be:
-    # entrymarker-bytes + field_delim-bytes*occurrence + size of the ecc per block for all blocks in file header +
-    # size of the hash per block for all blocks in file header.
-    # Compute the total number of bytes we will add with ecc + hash (accounting for the padding of the remaining
-    # characters at the end of the sequence in case it doesn't fit with the message_size, by using ceil() )
-    result = (len(parameters["entrymarker"]) + len(parameters["field_delim"]) * 3) + (
-                    int(math.ceil(float(filesize_header) / ecc_params_header["message_size"])) *
-                    (ecc_params_header["ecc_size"] + ecc_params_header["hash_size"])
-                ) + (int(math.ceil(float(filesize_content) / ecc_params_variable_average["message_size"])) * (
-                    ecc_params_variable_average["ecc_size"] + ecc_params_variable_average["hash_size"] + 1)
-                )
-    return result
-
-hasher = Hasher("md5") # md5 is default hash algorithm
-hasher_intra = Hasher('none')
+    '''
+    Exact number of bytes of the ecc database and index of a file, computed from its block plan
+    '''
+    sizes = ecc_file_sizes(os.stat(input_path).st_size, os.path.basename(input_path))
+    return sum(sizes)
+
+# the ECC managers are cheap to create, their tables are built on first use and the slowest are cached on disk
+tables_cache_dir = os.path.join(os.path.dirname(__file__), "crypto-disco-ecc-cache", "tables")
+tables_cache_version = 1 # increment when the format of the cached tables changes
+autotune_version = 2 # increment when the benchmark of autotune_ecc_algo changes, the algorithms are benchmarked again
+range_scratch = threading.local() # read buffer of compute_ecc_hash_range, reused by the next ranges of a thread
+reedsolo_tables = None # parameters of the current global tables of reedsolo, see init_reedsolo_tables
+hasher = get_hasher(config.ecc_hash_algo) # hasher of the databases generated by this run
+hasher_intra = get_hasher('none')
 ecc_params_idx = compute_ecc_params(27, 1, hasher_intra)
 ecc_params_intra = compute_ecc_params(parameters["max_block_size"], parameters["resilience_rate_intra"], hasher_intra)
-ecc_manager_variable = ECCMan(parameters["max_block_size"], 1, algo=parameters["ecc_algo"])
-ecc_manager_intra = ECCMan(parameters["max_block_size"], ecc_params_intra["message_size"], algo=parameters["ecc_algo"])
-ecc_manager_intra = ECCMan(parameters["max_block_size"], ecc_params_intra["message_size"], algo=parameters["ecc_algo"])
-ecc_manager_idx = ECCMan(27, ecc_params_idx["message_size"], algo=parameters["ecc_algo"])
-rs_encode_msg = reedsolo.rs_encode_msg # local reference for small speed boost
-ecc_params_header = compute_ecc_params(parameters["max_block_size"], parameters["resilience_rates"][0], hasher)
-# compute the average variable rate to compute statistics
-ecc_params_variable_average = compute_ecc_params(parameters["max_block_size"],
-                                                 (parameters["resilience_rates"][1]
-                                                  + parameters["resilience_rates"][2])/2, hasher)
\ No newline at end of file
+track_block_size, symbol_size = track_code(config.ecc_field_bits) # codewords of the tracks generated by this run
+sector_size = config.ecc_sector_size # sector-aligned layout of the tracks generated by this run, see BlockPlan
+ecc_manager_variable = get_track_manager(track_block_size, symbol_size)
+ecc_manager_intra = new_ecc_manager(parameters["max_block_size"], ecc_params_intra["message_size"],
+                                    parameters["ecc_algo"])
+ecc_manager_idx = new_ecc_manager(27, ecc_params_idx["message_size"], parameters["ecc_algo"])
+rs_encode_msg = reedsolo.rs_encode_msg # local reference for small speed boost
\ No newline at end of file
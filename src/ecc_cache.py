@@ -0,0 +1,138 @@
+'''
+Persistent cache of the ECC databases, so that building a disc again with mostly the same files only encodes the files
+that changed. An entry is a directory named after the key of the input file, holding its .txt database and .idx index,
+and the least recently used entries are evicted when the cache grows over config.ecc_cache_max_size. Databases are
+prepared in the staging directory, for example by ecc.StreamEccEncoder while a file is written, then stored.
+'''
+import hashlib
+import threading
+import tempfile
+import shutil
+import json
+import os
+import ecc
+import config
+
+class EccCache(object):
+    # shared by the caches of every worker, they use the same directory
+    lock = threading.Lock()
+
+    def __init__(self, cache_dir=None, max_size=None):
+        '''
+        Parameters
+        ----------
+        cache_dir str (optional)
+            Preferably on the same filesystem as the run dirs so that entries are hardlinked instead of copied, defaults
+            to crypto-disco-ecc-cache next to the ECC run dirs
+        max_size int (optional)
+            Bytes kept on disk, defaults to config.ecc_cache_max_size. 0 disables the cache.
+        '''
+        self.cache_dir = cache_dir or os.path.join(os.path.dirname(__file__), "crypto-disco-ecc-cache")
+        self.entries_dir = os.path.join(self.cache_dir, "entries")
+        self.staging_dir = os.path.join(self.cache_dir, "staging")
+        self.max_size = config.ecc_cache_max_size if max_size is None else max_size
+        if self.max_size:
+            os.makedirs(self.entries_dir, exist_ok=True)
+            os.makedirs(self.staging_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.max_size)
+
+    def key(self, input_path):
+        '''
+        The identity of the file (size, mtime, inode) and a fingerprint of its content and of the ECC settings, see
+        ecc.input_fingerprint. The file name is part of it because it is written in the database.
+        '''
+        stat = os.stat(input_path)
+        identity = ecc.input_fingerprint(input_path, os.path.basename(input_path))
+        identity.update({"inode": stat.st_ino, "device": stat.st_dev})
+        return hashlib.blake2b(json.dumps(identity, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    def contains(self, input_path, key=None):
+        '''
+        Whether the database and index of the input file are cached, without placing them anywhere
+        '''
+        if not self.enabled:
+            return False
+        entry_dir = os.path.join(self.entries_dir, key or self.key(input_path))
+        with self.lock:
+            return all(os.path.exists(os.path.join(entry_dir, filename))
+                       for filename in self.entry_filenames(input_path))
+
+    def fetch(self, input_path, output_path, key=None):
+        '''
+        Place the cached database and index of the input file in output_path, returns False on a cache miss
+        '''
+        if not self.enabled:
+            return False
+        entry_dir = os.path.join(self.entries_dir, key or self.key(input_path))
+        filenames = self.entry_filenames(input_path)
+        with self.lock:
+            if not all(os.path.exists(os.path.join(entry_dir, filename)) for filename in filenames):
+                return False
+            # a stale checkpoint of an interrupted run would resume by writing through the links
+            ckpt_path = os.path.join(output_path, filenames[0] + ".ckpt")
+            if os.path.exists(ckpt_path):
+                os.remove(ckpt_path)
+            for filename in filenames:
+                link_or_copy(os.path.join(entry_dir, filename), os.path.join(output_path, filename))
+            os.utime(entry_dir) # most recently used
+        print(f"\n- Reusing the cached ECC of file {os.path.basename(input_path)}")
+        return True
+
+    def store(self, input_path, output_path, key=None):
+        '''
+        Add the database and index generated in output_path for the input file, then evict the least recently used
+        entries over the size limit
+        '''
+        if not self.enabled:
+            return
+        entry_dir = os.path.join(self.entries_dir, key or self.key(input_path))
+        with self.lock:
+            # entries appear whole
+            tmp_dir = tempfile.mkdtemp(dir=self.staging_dir)
+            for filename in self.entry_filenames(input_path):
+                link_or_copy(os.path.join(output_path, filename), os.path.join(tmp_dir, filename))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache fits in max_size. Must hold the lock.
+        '''
+        entries = []
+        for name in os.listdir(self.entries_dir):
+            entry_dir = os.path.join(self.entries_dir, name)
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def staging(self):
+        '''
+        Temporary directory to prepare databases that are then stored, removed when the context exits
+        '''
+        return tempfile.TemporaryDirectory(dir=self.staging_dir)
+
+    @staticmethod
+    def entry_filenames(input_path):
+        '''Names of the database and index, like ecc.generate_ecc writes them'''
+        name = os.path.basename(input_path) + ".txt"
+        return [name, name + ".idx"]
+
+def link_or_copy(src, dst):
+    '''
+    Hardlink src to dst, or copy it when the filesystem does not allow it. dst is replaced.
+    '''
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
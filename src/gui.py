@@ -17,7 +17,7 @@ from PySide6.QtWidgets import (
     QMainWindow, QFileDialog, QVBoxLayout, QPushButton, QTableWidget, QComboBox, QTextEdit, QMessageBox,
     QTableWidgetItem, QLabel, QWidget, QCheckBox, QHBoxLayout, QProgressDialog, QWizard
 )
-from PySide6.QtCore import Qt, QFileInfo, QThreadPool, QFile
+from PySide6.QtCore import Qt, QFileInfo, QThreadPool, QFile, QTimer
 import os
 import iso
 import zip
@@ -136,6 +136,10 @@ class crypto_disco(QMainWindow):
         layout.addLayout(run_layout)
         # Thread management
         self.threadpool = QThreadPool()
+        # background ECC of the added files into the ECC cache, one file at a time
+        self.speculative_pool = QThreadPool()
+        self.speculative_pool.setMaxThreadCount(1)
+        self.speculative_ecc = {} # path of the file to its compute_ecc.SpeculativeEccWorker
 
     def setup_menu_bar(self):
         # Create menu bar
@@ -156,6 +160,9 @@ class crypto_disco(QMainWindow):
         print_template_action = QtGui.QAction("Print Template Wizard", self)
         print_template_action.triggered.connect(self.run_template_wizard)
         file_menu.addAction(print_template_action)
+        scrub_action = QtGui.QAction("Scrub Disc or Folder", self)
+        scrub_action.triggered.connect(self.run_scrub)
+        file_menu.addAction(scrub_action)
         # Checkboxes operations
         uncheck_ecc = QtGui.QAction("Uncheck All ECC", self)
         uncheck_ecc.triggered.connect(lambda: self.change_check_col(False, "ECC"))
@@ -280,6 +287,38 @@ class crypto_disco(QMainWindow):
             f"[ECC: {utils.total_size_str(utils.get_total_ecc_sizes(self.file_list))}]"
         )
         self.nested_donuts.update_all(self.file_list, self.current_disc_type, self.total_size_clones)
+        # deferred, so that restaging the files after a removal keeps the background ECC of the others running
+        QTimer.singleShot(0, self.update_speculative_ecc)
+
+    def update_speculative_ecc(self):
+        '''
+        Start the background ECC of the files with ECC checked and cancel it for the files removed or unchecked, the
+        EccWorker then reuses what completed from the ECC cache
+        '''
+        wanted = set()
+        if config.ecc_speculative and config.ecc_cache_max_size and not self.media_playback.isChecked():
+            wanted = {os.path.join(f["directory"], f["file_name"]) for f in self.file_list
+                      if f["ecc_checked"] and not f["default_file"]}
+        for path in list(self.speculative_ecc):
+            if path not in wanted:
+                self.cancel_speculative_ecc(path)
+        for path in wanted.difference(self.speculative_ecc):
+            if os.path.isfile(path):
+                worker = compute_ecc.SpeculativeEccWorker(path)
+                self.speculative_ecc[path] = worker
+                self.speculative_pool.start(worker, priority=-1) # after the other tasks of the pool
+        return True
+
+    def cancel_speculative_ecc(self, path=None):
+        '''
+        Cancel the background ECC of a file, or of every file that isn't cached yet when no path is given
+        '''
+        paths = [path] if path else [p for p, worker in self.speculative_ecc.items() if not worker.done]
+        for p in paths:
+            worker = self.speculative_ecc.pop(p)
+            self.speculative_pool.tryTake(worker) # not started yet
+            worker.cancel_task()
+        return True
 
     def set_ecc_dir(self, ecc_dir):
         self.current_ecc_dir = ecc_dir
@@ -437,6 +476,11 @@ class crypto_disco(QMainWindow):
         print(f"Files to be added from drag and drop: {files}")
         self.stage_files(files)
 
+    def closeEvent(self, event):
+        # the pool waits for the background ECC running when the window is destroyed
+        self.cancel_speculative_ecc()
+        super().closeEvent(event)
+
     def run_application(self):
         '''
         Prompt user for output ISO file path
@@ -487,6 +531,8 @@ class crypto_disco(QMainWindow):
                     lambda err: utils.error_popup("Failed Processing Error Correcting Codes (ECC)", err))
                 ecc_worker.signals.cancel.connect(self.ecc_progress_dialog.cancel)
                 self.ecc_progress_dialog.canceled.connect(ecc_worker.cancel_task)
+                # the files not in the ECC cache yet are encoded by the EccWorker with every core
+                self.cancel_speculative_ecc()
                 self.threadpool.start(ecc_worker)
         else:
             self.run_playback_iso()
@@ -625,6 +671,38 @@ class crypto_disco(QMainWindow):
                 "msg": msg
             })
 
+    def run_scrub(self):
+        try:
+            root = QFileDialog.getExistingDirectory(None, "Select Disc or Folder to Scrub")
+            if not root:
+                return
+            report_path, _ = QFileDialog.getSaveFileName(
+                None, "Save Scrub Report", f"scrub-{utils.datetime_str()}.json", "JSON Files (*.json)")
+            if not report_path:
+                return
+            worker = compute_repair.ScrubWorker(root, report_path)
+            progress_dialog = QProgressDialog("Scrubbing...", "Cancel", 0, 100, self)
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.setValue(0)
+            worker.signals.progress.connect(progress_dialog.setValue)
+            worker.signals.progress_text.connect(progress_dialog.setLabelText)
+            worker.signals.error.connect(
+                lambda err: utils.error_popup(f"Failed to Scrub {root}", err))
+            worker.signals.result.connect(lambda report: utils.info_popup(
+                "Scrub complete" if report["correctable"] else "Scrub found damage that can't be corrected",
+                f"{report['bad_blocks']} bad blocks, files: {report['statuses']}\nReport saved to {report_path}"))
+            worker.signals.cancel.connect(progress_dialog.cancel)
+            progress_dialog.canceled.connect(worker.cancel_task)
+            progress_dialog.show()
+            self.threadpool.start(worker)
+        except Exception as e:
+            msg = traceback.format_exc()
+            print(msg)
+            utils.error_popup("Error Scrubbing", {
+                "exception": e,
+                "msg": msg
+            })
+
     def run_burn(self):
         print("Starting burn wizard...")
         try:
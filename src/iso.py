@@ -6,6 +6,7 @@ import os
 import sys
 import utils
 import config
+import ecc
 import shutil
 import subprocess
 import platform
@@ -47,9 +48,13 @@ class IsoWorker(QRunnable):
             # cleanup
             print(f"Deleting {self.stage_dir} . . .")
             shutil.rmtree(self.stage_dir)
+            output_text = f"Output is at {self.output_path}"
+            if config.ecc_iso_sidecar:
+                self.generate_iso_ecc()
+                output_text += f"\nwith its ECC at {self.output_path}.txt"
             self.signals.progress.emit(100)
             print("All done.")
-            self.signals.result.emit(["Done Generating .ISO Image", f"Output is at {self.output_path}",
+            self.signals.result.emit(["Done Generating .ISO Image", output_text,
                 f"{self.disc_type}\n{self.output_path}\n{pformat(self.file_list)}", ""])
             return True
         except Exception as e:
@@ -81,6 +86,15 @@ class IsoWorker(QRunnable):
 
     def setup_ecc_files(self):
         # ECC is computed before this class is called
+        self.setup_recovery_files()
+        archive_path = os.path.join(self.ecc_dir, f"{config.ecc_archive_name}.txt") if config.ecc_archive_name else None
+        if archive_path and os.path.exists(archive_path):
+            # a single database for all the files, see ecc.generate_archive_ecc
+            print(f"Copying ECC database {config.ecc_archive_name} into stage folder . . .")
+            os.makedirs(os.path.join(self.stage_dir, f"{self.iso_ecc_dir}/"), exist_ok=True)
+            for ecc_ext_path in [archive_path, archive_path + '.idx']:
+                shutil.copy2(ecc_ext_path, os.path.join(self.stage_dir, f"{self.iso_ecc_dir}/"))
+            return True
         for file_metadata in self.file_list:
             print(f"Copying ECC for {file_metadata['file_name']} into stage folder . . .")
             if file_metadata["ecc_checked"]:
@@ -92,6 +106,41 @@ class IsoWorker(QRunnable):
                     shutil.copy2(ecc_ext_path, os.path.join(self.stage_dir, f"{self.iso_ecc_dir}/"))
         return True
 
+    def setup_recovery_files(self):
+        # recovery volumes of all the files of the disc, see recovery.generate_recovery
+        volumes = sorted(name for name in os.listdir(self.ecc_dir) if name.startswith("recovery.vol"))
+        if volumes:
+            print(f"Copying {len(volumes)} recovery volumes into stage folder . . .")
+            os.makedirs(os.path.join(self.stage_dir, f"{self.iso_ecc_dir}/"), exist_ok=True)
+        for name in volumes:
+            shutil.copy2(os.path.join(self.ecc_dir, name), os.path.join(self.stage_dir, f"{self.iso_ecc_dir}/"))
+
+    def generate_iso_ecc(self):
+        '''
+        ECC database of the whole image, written next to it (.iso.txt and .iso.txt.idx) to be stored apart from the disc,
+        for example on a companion disc. Unlike the ECC of the files, it also protects the filesystem structures, the
+        clones and the ECC databases on the disc. The image is encoded in parallel by ranges, see ecc.generate_ecc.
+        '''
+        print(f"Generating the ECC of {self.output_path} . . .")
+        self.signals.progress_text.emit(f"Processing Error Correcting Codes (ECC) for\n"
+                                        f"{os.path.basename(self.output_path)}")
+        self.signals.progress.emit(0)
+        self.signals.progress_end.emit(100)
+        def progress_function(progress, total, elapsed):
+            self.signals.progress.emit((progress / total) * 100)
+            details = f"[{(progress / (1024**2)):.2f} MB/{(total / (1024**2)):.2f} MB] "
+            if elapsed:
+                details += f"[{((progress / (1024**2)) / elapsed):.2f} MB/s] "
+            self.signals.progress_text.emit(f"Processing Error Correcting Codes (ECC) for\n"
+                                            f"{os.path.basename(self.output_path)}\n{details}")
+            return self.shutdown
+        if not ecc.generate_ecc(self.output_path, os.path.dirname(os.path.abspath(self.output_path)),
+                                progress_function=progress_function, resume=False):
+            raise self.cancel_exception
+        # the checkpoint of the ECC generation is not needed anymore, the image is complete
+        os.remove(self.output_path + ".txt.ckpt")
+        return True
+
     def setup_clone_files(self):
         current_size_bytes = utils.get_path_size(self.stage_dir)
         print("Current size of files: ", current_size_bytes)
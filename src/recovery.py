@@ -0,0 +1,534 @@
+'''
+Recovery volumes of a disc, like PAR2: the files of the disc are concatenated and cut into config.ecc_recovery_slices
+data slices, and recovery slices are computed from all of them with a Cauchy Reed-Solomon code over GF(2^16). Any data
+slices lost, up to the number of recovery slices, are rebuilt from the others, whatever the files they belong to. This
+complements the ECC databases, whose blocks only correct a fraction of their own bytes: an unreadable area of the disc
+loses whole slices, and rebuilding a slice is a single pass of multiplications with no error location to search.
+
+Recovery slice i is the sum over the data slices j of C[i, j] * D_j, with the Cauchy matrix C[i, j] = 1 / (x_i + y_j),
+y_j = j and x_i = data slices + i, so that any square submatrix of C can be inverted. The slices are processed by stripes
+of stripe_size bytes, in parallel on the process pool of the ECC (see ecc.ecc_process_pool).
+
+A volume holds some recovery slices then a trailer: the metadata (index of the volume, files, slice size and checksums
+of every slice) in JSON, its blake2b, its length and the magic. Every volume has the whole metadata, so any of them is
+enough to find the slices that were lost.
+
+References
+----------
+- https://parchive.github.io/doc/Parity%20Volume%20Set%20Specification%20v2.0.html
+- https://en.wikipedia.org/wiki/Cauchy_matrix
+'''
+from collections import deque
+from contextlib import nullcontext, ExitStack
+from functools import lru_cache
+import tempfile
+import hashlib
+import struct
+import json
+import time
+import os
+import numpy as np
+import config
+import ecc
+import rs16
+
+magic = b"\nCRYPTO-DISCO-RECOVERY-1\n"
+stripe_size = 256 * 1024 # bytes of each slice processed at a time, the checksum of a slice is built from its stripes
+rebuild_buffer_size = 16 * 1024 ** 2 # bytes of the lost slices rebuilt by a worker at a time, see repair_from_recovery
+volume_name = "recovery.vol%i.bin"
+
+def disc_files(input_paths):
+    '''
+    Files under the input paths, with their path on the disc like iso.IsoWorker stages them: a file at the root by its
+    base name, and a directory with its whole tree
+    Returns
+    -------
+    list
+        (path, relative path with /)
+    '''
+    files = []
+    for path in input_paths:
+        if os.path.isdir(path):
+            root = os.path.dirname(os.path.abspath(path))
+            files += [(os.path.join(dirpath, filename),
+                       os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, "/"))
+                      for dirpath, _, filenames in sorted(os.walk(path)) for filename in sorted(filenames)]
+        else:
+            files.append((path, os.path.basename(path)))
+    return files
+
+def slices_layout(total_size, percent):
+    '''
+    Size of the slices, number of data slices and number of recovery slices for files of total_size bytes
+    '''
+    slices = min(config.ecc_recovery_slices, 32768)
+    # slices are made of whole 2 bytes symbols
+    slice_size = max(2, 2 * -(-total_size // (2 * slices)))
+    data_slices = -(-total_size // slice_size)
+    # the Cauchy matrix needs data slices + recovery slices distinct elements of GF(2^16)
+    return slice_size, data_slices, min(-(-data_slices * percent // 100), 65536 - data_slices)
+
+@lru_cache(maxsize=8)
+def cauchy_logs(data_slices, recovery_slices):
+    '''Logs of the Cauchy matrix, of shape (recovery slices, data slices)'''
+    gf = rs16.gf16_tables(0x1100b, 2)
+    x = np.arange(data_slices, data_slices + recovery_slices, dtype=np.int32)[:, None]
+    y = np.arange(data_slices, dtype=np.int32)[None, :]
+    return gf.field_charac - gf.log[x ^ y]
+
+def gf_mul_accumulate(accumulator, coefficient_logs, data):
+    '''
+    accumulator[i] ^= coefficient[i] * data for arrays of GF(2^16) symbols, coefficients given by their logs
+    '''
+    gf = rs16.gf16_tables(0x1100b, 2)
+    accumulator ^= gf.exp[coefficient_logs[:, None] + gf.log[data][None, :]]
+
+class DiscReader(object):
+    '''
+    Reads ranges of the concatenation of the files of a disc, missing bytes read as zeros. The files are opened once
+    and closed with the reader.
+    '''
+    def __init__(self, paths, sizes):
+        self.paths = paths
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        self.stack = ExitStack()
+        self.files = {}
+
+    def read(self, pos, length):
+        data = bytearray(length)
+        index = int(np.searchsorted(self.offsets, pos, side='right')) - 1
+        out = 0
+        while out < length and index < len(self.paths):
+            file_pos = pos + out - int(self.offsets[index])
+            count = min(length - out, int(self.offsets[index + 1]) - (pos + out))
+            if count > 0:
+                if index not in self.files:
+                    try:
+                        self.files[index] = self.stack.enter_context(open(self.paths[index], 'rb'))
+                    except OSError:
+                        self.files[index] = None
+                if self.files[index] is not None:
+                    self.files[index].seek(file_pos)
+                    chunk = self.files[index].read(count)
+                    data[out:out + len(chunk)] = chunk
+                out += count
+            index += 1
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stack.close()
+
+def compute_recovery_stripe(paths, sizes, slice_size, recovery_slices, start, end):
+    '''
+    Recovery slices between the offsets start and end of every slice, and the blake2b of each data slice between
+    them. This is the unit of work of generate_recovery and runs in a worker process.
+    Returns
+    -------
+    list
+        Bytes of the recovery stripes, one after the other, and bytes of the digests of the data stripes
+    '''
+    data_slices = -(-sum(sizes) // slice_size)
+    logs = cauchy_logs(data_slices, recovery_slices)
+    recovery = np.zeros((recovery_slices, (end - start) // 2), dtype=np.uint16)
+    digests = bytearray()
+    with DiscReader(paths, sizes) as reader:
+        for j in range(data_slices):
+            data = reader.read(j * slice_size + start, end - start)
+            digests += hashlib.blake2b(data, digest_size=16).digest()
+            gf_mul_accumulate(recovery, logs[:, j], np.frombuffer(data, dtype='>u2'))
+    return recovery.astype('>u2').tobytes(), bytes(digests)
+
+def generate_recovery(input_paths, output_path, percent=None, progress_function=lambda x,y,z: False, workers=None,
+                      executor=None):
+    '''
+    Write the recovery volumes of the files of a disc in output_path, see the module documentation
+    Parameters
+    ----------
+    input_paths list
+        Files and directories of the disc
+    output_path str
+    percent int (optional)
+        Size of the recovery slices in percent of the data, defaults to config.ecc_recovery_percent
+    progress_function function (optional)
+        Same as ecc.generate_ecc
+    workers int (optional)
+        Same as ecc.generate_ecc
+    executor ProcessPoolExecutor (optional)
+        Same as ecc.generate_ecc
+    Returns
+    -------
+    list
+        Paths of the volumes written, or False if progress_function asked for a shutdown
+    '''
+    percent = config.ecc_recovery_percent if percent is None else percent
+    files = disc_files(input_paths)
+    paths = [path for path, _ in files]
+    sizes = [os.stat(path).st_size for path in paths]
+    total_size = sum(sizes)
+    slice_size, data_slices, recovery_slices = slices_layout(total_size, percent)
+    if not total_size or not recovery_slices:
+        return []
+    print(f"Generating {recovery_slices} recovery slices of {slice_size} bytes for {data_slices} data slices.")
+    if workers is None:
+        workers = config.ecc_workers or os.cpu_count() or 1
+    volumes = min(config.ecc_recovery_volumes, recovery_slices)
+    # recovery slice i goes into volume i % volumes
+    volume_paths = [os.path.join(output_path, volume_name % v) for v in range(volumes)]
+    stripes = [(start, min(start + stripe_size, slice_size)) for start in range(0, slice_size, stripe_size)]
+    data_digests = [hashlib.blake2b(digest_size=16) for _ in range(data_slices)]
+    recovery_digests = [hashlib.blake2b(digest_size=16) for _ in range(recovery_slices)]
+    start_time = time.time()
+    last_update = 0
+    with ExitStack() as stack:
+        outputs = [stack.enter_context(open(path, 'wb')) for path in volume_paths]
+        if executor is None and workers <= 1:
+            results = ((stripe, compute_recovery_stripe(paths, sizes, slice_size, recovery_slices, *stripe))
+                       for stripe in stripes)
+        else:
+            results = ecc_pool_results(stack, stripes, workers, executor,
+                                       lambda stripe: (compute_recovery_stripe, paths, sizes, slice_size,
+                                                       recovery_slices, *stripe))
+        for (start, end), (recovery, digests) in results:
+            width = end - start
+            for j in range(data_slices):
+                data_digests[j].update(digests[16 * j:16 * (j + 1)])
+            for i in range(recovery_slices):
+                stripe = recovery[i * width:(i + 1) * width]
+                recovery_digests[i].update(hashlib.blake2b(stripe, digest_size=16).digest())
+                # slices are in the order of their index in each volume
+                outputs[i % volumes].seek((i // volumes) * slice_size + start)
+                outputs[i % volumes].write(stripe)
+            elapsed = int(time.time() - start_time)
+            if elapsed != last_update: # update the progress at most once per second
+                last_update = elapsed
+                if progress_function(end * data_slices, slice_size * data_slices, elapsed):
+                    return False
+        metadata = {"version": 2, "slice_size": slice_size, "stripe_size": stripe_size, "data_slices": data_slices,
+                    "recovery_slices": recovery_slices, "volumes": volumes,
+                    "files": [[relpath, size] for (_, relpath), size in zip(files, sizes)],
+                    "data_digests": [digest.hexdigest() for digest in data_digests],
+                    "recovery_digests": [digest.hexdigest() for digest in recovery_digests]}
+        for v, output in enumerate(outputs):
+            # the index of the volume is in its trailer, the volumes can be renamed
+            trailer = json.dumps(dict(metadata, volume=v)).encode()
+            output.seek(len(range(v, recovery_slices, volumes)) * slice_size)
+            output.write(trailer + hashlib.blake2b(trailer, digest_size=16).digest() + struct.pack('>Q', len(trailer))
+                         + magic)
+            output.truncate()
+    print("All done! Recovery volumes: %s" % ", ".join(os.path.basename(path) for path in volume_paths))
+    return volume_paths
+
+def ecc_pool_results(stack, stripes, workers, executor, task):
+    '''
+    Results of the stripes computed by a pool of processes, in order, with at most 2 stripes per worker in flight
+    '''
+    executor = stack.enter_context(ecc.ecc_process_pool(workers) if executor is None else nullcontext(executor))
+    pending = deque()
+    try:
+        for stripe in stripes:
+            pending.append((stripe, executor.submit(*task(stripe))))
+            while len(pending) >= workers * 2 or (pending and pending[0][1].done()):
+                stripe, future = pending.popleft()
+                yield stripe, future.result()
+        while pending:
+            stripe, future = pending.popleft()
+            yield stripe, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+def read_volume_metadata(volume_path):
+    '''
+    Metadata of the trailer of a volume, or None if it is missing or damaged
+    '''
+    try:
+        with open(volume_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size < len(magic) + 24:
+                return None
+            f.seek(size - len(magic) - 8)
+            length, end = struct.unpack('>Q', f.read(8))[0], f.read()
+            if end != magic or length > size:
+                return None
+            f.seek(size - len(magic) - 24 - length)
+            trailer = f.read(length)
+            if hashlib.blake2b(trailer, digest_size=16).digest() != f.read(16):
+                return None
+        return json.loads(trailer)
+    except (OSError, ValueError):
+        return None
+
+def slice_digest(read_stripe, slice_size, metadata):
+    '''Checksum of a slice, the blake2b of the blake2b of its stripes, like generate_recovery'''
+    digest = hashlib.blake2b(digest_size=16)
+    for start in range(0, slice_size, metadata["stripe_size"]):
+        stripe = read_stripe(start, min(start + metadata["stripe_size"], slice_size))
+        digest.update(hashlib.blake2b(stripe, digest_size=16).digest())
+    return digest.hexdigest()
+
+def find_volumes(directory):
+    '''Paths of the recovery volumes in a directory, like the ECC/ directory of a disc'''
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith("recovery.vol") and name.endswith(".bin")]
+
+def volume_index(volume_path, metadata):
+    '''Index of a volume in its recovery set, from its trailer or from its name for the volumes of version 1'''
+    if "volume" in metadata:
+        return metadata["volume"]
+    try:
+        return int(os.path.basename(volume_path).split(".vol")[1].split(".")[0])
+    except (IndexError, ValueError):
+        return None
+
+class DiscWriter(object):
+    '''
+    Writes ranges of the concatenation of the files of a disc into outputs, the files without an output are skipped
+    like the bytes past the end of the disc. The outputs are opened once and closed with the writer.
+    '''
+    def __init__(self, output_paths, sizes):
+        self.output_paths = output_paths
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        self.stack = ExitStack()
+        self.files = {}
+
+    def write(self, pos, data):
+        index = int(np.searchsorted(self.offsets, pos, side='right')) - 1
+        out = 0
+        while out < len(data) and index < len(self.output_paths):
+            count = min(len(data) - out, int(self.offsets[index + 1]) - (pos + out))
+            if count > 0:
+                if self.output_paths[index] is not None:
+                    if index not in self.files:
+                        self.files[index] = self.stack.enter_context(open(self.output_paths[index], 'r+b'))
+                    self.files[index].seek(pos + out - int(self.offsets[index]))
+                    self.files[index].write(data[out:out + count])
+                out += count
+            index += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stack.close()
+
+def compute_data_digests(paths, sizes, slice_size, start, end):
+    '''
+    Blake2b of each data slice between the offsets start and end, the unit of work of the check of the slices of
+    repair_from_recovery
+    '''
+    data_slices = -(-sum(sizes) // slice_size)
+    digests = bytearray()
+    with DiscReader(paths, sizes) as reader:
+        for j in range(data_slices):
+            digests += hashlib.blake2b(reader.read(j * slice_size + start, end - start), digest_size=16).digest()
+    return bytes(digests)
+
+@lru_cache(maxsize=4)
+def rebuild_logs(data_slices, recovery_slices, rows, lost):
+    '''Logs of the inverse of the submatrix of the Cauchy matrix for the recovery slices rows and the lost slices'''
+    return gf_inverse_logs(cauchy_logs(data_slices, recovery_slices)[list(rows)][:, list(lost)])
+
+def rebuild_stripe(paths, sizes, slice_size, recovery_slices, lost, rows, sources, start, end):
+    '''
+    Lost data slices between the offsets start and end, from the recovery slices rows, read in the volumes at
+    sources (path, position), and from the data slices that are kept. This is the unit of work of the rebuild of
+    repair_from_recovery and runs in a worker process.
+    Returns
+    -------
+    bytes
+        The rebuilt stripes in the order of lost, one after the other
+    '''
+    data_slices = -(-sum(sizes) // slice_size)
+    logs = cauchy_logs(data_slices, recovery_slices)[list(rows)]
+    lost_slices = set(lost)
+    syndromes = np.zeros((len(rows), (end - start) // 2), dtype=np.uint16)
+    with DiscReader(paths, sizes) as reader, ExitStack() as stack:
+        volumes = {}
+        for r, (path, position) in enumerate(sources):
+            if path not in volumes:
+                volumes[path] = stack.enter_context(open(path, 'rb'))
+            volumes[path].seek(position + start)
+            syndromes[r] = np.frombuffer(volumes[path].read(end - start), dtype='>u2')
+        # remove the contribution of the data slices that are kept from the recovery slices
+        for j in range(data_slices):
+            if j not in lost_slices:
+                gf_mul_accumulate(syndromes, logs[:, j], np.frombuffer(reader.read(j * slice_size + start,
+                                                                                   end - start), dtype='>u2'))
+    # then the lost slices are the inverse of the submatrix of the lost slices times the syndromes
+    inverse_logs = rebuild_logs(data_slices, recovery_slices, rows, lost)
+    data = np.zeros((len(lost), (end - start) // 2), dtype=np.uint16)
+    for r in range(len(rows)):
+        gf_mul_accumulate(data, inverse_logs[:, r], syndromes[r])
+    return data.astype('>u2').tobytes()
+
+def repair_from_recovery(root_path, volume_paths, output_path, entries=None, progress_function=lambda x,y,z: False,
+                         workers=None, executor=None):
+    '''
+    Rebuild the slices of the files of a disc that were lost or damaged from the recovery volumes, and write the files
+    that had such slices, repaired, in output_path. The slices are checked then rebuilt by stripes on the process pool
+    of the ECC, and each rebuilt stripe is written into the repaired files, which replace their outputs once every
+    slice matches its checksum.
+    Parameters
+    ----------
+    root_path str
+        Directory of the files, like the root of the disc
+    volume_paths list
+        Paths of the recovery volumes, some can be missing or damaged
+    output_path str
+    entries list (optional)
+        Paths of the files to write relative to root_path, every file with a lost slice when None
+    progress_function function (optional)
+        Same as ecc.generate_ecc
+    workers int (optional)
+        Same as ecc.generate_ecc
+    executor ProcessPoolExecutor (optional)
+        Same as ecc.generate_ecc
+    Returns
+    -------
+    bool
+        True if no slice of the files was lost or every lost slice was rebuilt
+    '''
+    metadatas = [read_volume_metadata(path) for path in volume_paths]
+    metadata = next((m for m in metadatas if m), None)
+    if metadata is None:
+        print("Error: none of the recovery volumes could be read.")
+        return False
+    slice_size = metadata["slice_size"]
+    data_slices = metadata["data_slices"]
+    volumes = metadata["volumes"]
+    relpaths = [relpath for relpath, _ in metadata["files"]]
+    sizes = [size for _, size in metadata["files"]]
+    paths = [os.path.join(root_path, *relpath.split("/")) for relpath in relpaths]
+    offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    if workers is None:
+        workers = config.ecc_workers or os.cpu_count() or 1
+    start_time = time.time()
+    last_update = 0
+    outputs = {} # temporary output of each file to write by its index
+    with ExitStack() as stack:
+        if executor is None and workers > 1:
+            executor = stack.enter_context(ecc.ecc_process_pool(workers))
+        def results(stripes, task):
+            # task(stripe) is the function and its arguments, like ecc_pool_results
+            if executor is None:
+                return ((stripe, function(*arguments)) for stripe in stripes for function, *arguments in [task(stripe)])
+            return ecc_pool_results(stack, stripes, workers, executor, task)
+        def update_progress(end):
+            nonlocal last_update
+            elapsed = int(time.time() - start_time)
+            if elapsed != last_update: # update the progress at most once per second
+                last_update = elapsed
+                return progress_function(end * data_slices, slice_size * data_slices, elapsed)
+            return False
+        try:
+            # checksums of the data slices, from the checksums of their stripes
+            stripes = [(start, min(start + metadata["stripe_size"], slice_size))
+                       for start in range(0, slice_size, metadata["stripe_size"])]
+            data_digests = [hashlib.blake2b(digest_size=16) for _ in range(data_slices)]
+            for (start, end), digests in results(stripes, lambda stripe: (compute_data_digests, paths, sizes,
+                                                                          slice_size, *stripe)):
+                for j in range(data_slices):
+                    data_digests[j].update(digests[16 * j:16 * (j + 1)])
+                if update_progress(end):
+                    return False
+            lost = [j for j in range(data_slices) if data_digests[j].hexdigest() != metadata["data_digests"][j]]
+            if entries is None:
+                wanted = range(len(paths))
+            else:
+                entries = set(entry.replace(os.sep, "/") for entry in entries)
+                wanted = [index for index, relpath in enumerate(relpaths) if relpath in entries]
+            for j in lost:
+                for index in wanted:
+                    if max(j * slice_size, int(offsets[index])) < min((j + 1) * slice_size, int(offsets[index + 1])):
+                        outputs[index] = None
+            if not outputs:
+                print("All done! No slice of the files was lost.")
+                return True
+            # recovery slices that are intact, from the volumes of the same recovery set
+            available = {}
+            for volume_path, volume_metadata in zip(volume_paths, metadatas):
+                if volume_metadata is None or volume_metadata["data_digests"] != metadata["data_digests"]:
+                    continue
+                v = volume_index(volume_path, volume_metadata)
+                if v is None:
+                    print(f"Warning: the index of the recovery volume {volume_path} is unknown.")
+                    continue
+                with open(volume_path, 'rb') as f:
+                    def read_stripe(start, end):
+                        f.seek(position + start)
+                        return f.read(end - start)
+                    for t, i in enumerate(range(v, metadata["recovery_slices"], volumes)):
+                        position = t * slice_size
+                        if slice_digest(read_stripe, slice_size, metadata) == metadata["recovery_digests"][i]:
+                            available[i] = (volume_path, position)
+            print(f"{len(lost)} slices lost, {len(available)} recovery slices available.")
+            if len(lost) > len(available):
+                print("Error: not enough recovery slices to rebuild the lost slices.")
+                return False
+            rows = tuple(sorted(available)[:len(lost)])
+            # the files to write start as copies of the damaged files, their lost slices are written over
+            for index in sorted(outputs):
+                outfilepath = os.path.join(output_path, *relpaths[index].split("/"))
+                os.makedirs(os.path.dirname(outfilepath), exist_ok=True)
+                fd, outputs[index] = tempfile.mkstemp(prefix=".recovery-", dir=os.path.dirname(outfilepath))
+                with os.fdopen(fd, 'wb') as outfile, DiscReader([paths[index]], [sizes[index]]) as reader:
+                    for pos in range(0, sizes[index], stripe_size):
+                        outfile.write(reader.read(pos, min(stripe_size, sizes[index] - pos)))
+            # the stripes are cut so that a worker doesn't rebuild more than rebuild_buffer_size bytes at a time
+            width = metadata["stripe_size"]
+            while width % 4 == 0 and width > 4096 and len(lost) * width > rebuild_buffer_size:
+                width //= 2
+            stripes = [(start, min(start + width, slice_size)) for start in range(0, slice_size, width)]
+            stripe_digests = [hashlib.blake2b(digest_size=16) for _ in lost]
+            rebuilt_digests = [hashlib.blake2b(digest_size=16) for _ in lost]
+            with DiscWriter([outputs.get(index) for index in range(len(paths))], sizes) as writer:
+                for (start, end), data in results(stripes, lambda stripe: (
+                        rebuild_stripe, paths, sizes, slice_size, metadata["recovery_slices"], tuple(lost), rows,
+                        [available[i] for i in rows], *stripe)):
+                    for t, j in enumerate(lost):
+                        stripe = data[t * (end - start):(t + 1) * (end - start)]
+                        writer.write(j * slice_size + start, stripe)
+                        # checksum of the slice from the checksums of its stripes, like slice_digest
+                        stripe_digests[t].update(stripe)
+                        if end % metadata["stripe_size"] == 0 or end == slice_size:
+                            rebuilt_digests[t].update(stripe_digests[t].digest())
+                            stripe_digests[t] = hashlib.blake2b(digest_size=16)
+                    if update_progress(end):
+                        return False
+            for t, j in enumerate(lost):
+                if rebuilt_digests[t].hexdigest() != metadata["data_digests"][j]:
+                    print(f"Error: slice {j} could not be rebuilt.")
+                    return False
+            for index in sorted(outputs):
+                os.replace(outputs[index], os.path.join(output_path, *relpaths[index].split("/")))
+                outputs[index] = None
+        finally:
+            # don't leave the temporary outputs behind when the rebuild fails or is interrupted
+            for partpath in outputs.values():
+                if partpath is not None and os.path.exists(partpath):
+                    os.remove(partpath)
+    print("All done! Files repaired from the recovery slices: %s" % ", ".join(relpaths[i] for i in sorted(outputs)))
+    return True
+
+def gf_inverse_logs(matrix_logs):
+    '''
+    Logs of the inverse of a square matrix of GF(2^16) given by its logs, by Gauss-Jordan elimination. The submatrices
+    of a Cauchy matrix are always invertible.
+    '''
+    gf = rs16.gf16_tables(0x1100b, 2)
+    size = len(matrix_logs)
+    matrix = np.concatenate([gf.exp[matrix_logs], np.eye(size, dtype=np.uint16)], axis=1)
+    for column in range(size):
+        pivot = column + int(np.flatnonzero(matrix[column:, column])[0])
+        matrix[[column, pivot]] = matrix[[pivot, column]]
+        matrix[column] = gf.mul(matrix[column], gf.inverse(matrix[column, column]))
+        factors = matrix[:, column].copy()
+        factors[column] = 0
+        matrix ^= gf.exp[gf.log[factors][:, None] + gf.log[matrix[column]][None, :]]
+    return gf.log[matrix[:, size:]]
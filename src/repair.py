@@ -1,14 +1,22 @@
 import os
 import time
+import mmap
+import tempfile
+import struct
 from io import BytesIO
+from functools import lru_cache
+from contextlib import ExitStack, nullcontext
+import itertools
 import ecc
-import utils
-from utils import b
+import config
+import numpy as np
+from collections import Counter, deque
+from utils import b, Hasher
 from creedsolo import ReedSolomonError
 from unireedsolomon.rs import RSCodecError
 
 def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_erasures=False,
-                   erasure_symbol="0", fast_check=True, callback=False):
+                   erasure_symbol="0", fast_check=True, callback=False, entries=None, report=None):
     '''
     Credit to PyFileFixity
     - Even though the file noted by the "damaged" path variable is sufficient, the ECC file has the filename included
@@ -18,9 +26,10 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
     Parameters
     ----------
     damaged str
-        The path of the damaged file to repair
+        The path of the damaged file to repair, or of the directory of the files of a database with several entries
+        (see ecc.generate_archive_ecc)
     repair_dir str
-        The path of the directory to place the repair
+        The path of the directory to place the repair, or None to only check the files without writing anything
     ecc_file str
         The path of the error correcting codes file utilized for repair
     ecc_file_idx str (Optional)
@@ -33,13 +42,46 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
         Symbol that will be flagged as an erasure. When extracting corrupted data, the extraction software does this
     fast_check bool
         Checks if the hash value is the same but the value isn't (malicious intent, or extremely random occurance)
+    entries list (Optional)
+        Paths of the entries to repair, relative to the directory. Every entry when damaged is a directory and None,
+        only the damaged file when it is a file, or the single entry of the database whatever its path. The entries
+        that the database doesn't have are skipped and reported as "missing".
+    report list (Optional)
+        The result of the check of each file is appended to it, a dictionary with its "path" relative to the directory
+        and "status": "healthy", "correctable" when all its corrupted blocks can be repaired, "damaged" when some can't,
+        "misdetected" when its ecc track couldn't be used, or why it was skipped. The files that were checked also have
+        their "size", number of "blocks", "bad_blocks" and "correctable_blocks" among them (see scrub.scrub_disc).
     '''
     # Read the ecc file
     database = os.path.abspath(os.path.expanduser(ecc_file))
-    entrymarker = ecc.parameters["entrymarker"]
-    field_delim = ecc.parameters["field_delim"]
-    rootfolderpath = os.path.dirname(damaged)
-    with open(database, 'rb') as db:
+    entries_given = entries is not None
+    if os.path.isdir(damaged):
+        rootfolderpath = damaged
+    else:
+        rootfolderpath = os.path.dirname(damaged)
+        if entries is None:
+            entries = [os.path.basename(damaged)]
+    if entries is not None:
+        entries = set(entry.replace(os.sep, "/") for entry in entries)
+    with EccDatabase(database) as entries_db, ExitStack() as stack:
+        db = entries_db.file
+        if not entries_db.indexed:
+            print("The index of the ECC database could not be read, its entrymarkers are searched instead.")
+        # Hasher of the blocks, md5 for databases version 3 and named in the header for version 4
+        header = read_database_header(db)
+        print(f"ECC database version {header['version']}, blocks hashed with {header['hasher']}")
+        hasher = ecc.get_hasher(header["hasher"])
+        # Codewords of the tracks, GF(2^16) when the header has a field line
+        max_block_size, symbol_size = header["max_block_size"], header["symbol_size"]
+        ecc_manager = ecc.get_track_manager(max_block_size, symbol_size)
+        # Tracks interleaved across sectors, each sector has its own hash that is always checked
+        sector_size = header["sector_size"]
+        if sector_size:
+            print(f"ECC tracks interleaved across sectors of {sector_size} bytes")
+            fast_check = True
+        # Processes decoding the corrupted blocks one by one when a file is heavily damaged, see decode_blocks
+        decoder = stack.enter_context(BlockDecoder(max_block_size, symbol_size, enable_erasures=enable_erasures,
+                                                   erasures_char=erasure_symbol, only_erasures=only_erasures))
         # Counters
         files_count = 0
         files_corrupted = 0
@@ -47,18 +89,24 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
         files_repaired_completely = 0
         files_skipped = 0
 
-        # Main loop: process each ecc entry
-        entry = 1  # to start the while loop
-        while entry:
-            # -- Read the next ecc entry (extract the raw string from the ecc file)
-            # if replication_rate == 1:
-            entry_pos = get_next_entry(db, entrymarker)
-
-            # No entry? Then we finished because this is the end of file (stop condition)
-            if not entry_pos: break
+        # The entry of a database of a single file is the damaged file whatever its name, like in the databases of
+        # ecc.generate_ecc, only the entries asked for are looked up by their path in the others
+        if not entries_given and len(entries_db) == 1:
+            entries = None
+        found = set() # entries asked for that are in the database
+        # The entries of the files to repair are found by their path, unless one of them is missing because its path
+        # was damaged in the database: every entry is then read with its path repaired by its intra-ecc
+        entry_numbers = range(len(entries_db))
+        if entries is not None:
+            paths = entries_db.entry_numbers()
+            if entries.issubset(paths):
+                entry_numbers = sorted(paths[entry] for entry in entries)
 
+        # Main loop: process each ecc entry
+        for entry_number in entry_numbers:
             # -- Extract the fields from the ecc entry
-            entry_p = entry_fields(db, entry_pos, b(field_delim))
+            entry_pos = entries_db.positions[entry_number]
+            entry_p = entries_db.fields(entry_number)
 
             # -- Get file path, check its correctness and correct it by using intra-ecc if necessary
             relfilepath = entry_p["relfilepath"]  # Relative file path, given in the ecc fields
@@ -77,10 +125,10 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
             # Report errors
             if fpcorrupted:
                 if fpcorrected:
-                    print("\n- Fixed error in metadata field at offset %i filepath %s." % (entry_pos[0], filepath))
+                    print("\n- Fixed error in metadata field at offset %i filepath %s." % (entry_pos[0], relfilepath))
                 else:
                     print(f"\n- Error in filepath, could not correct completely metadata field at offset %{entry_pos[0]}"
-                          f" with value: %{filepath}. Please fix manually by editing the ecc file or set the corrupted "
+                          f" with value: %{relfilepath}. Please fix manually by editing the ecc file or set the corrupted "
                           f"characters to null bytes and --enable_erasures.")
             if fperrmsg != '': print(fperrmsg)
 
@@ -89,6 +137,10 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
             # Update entry_p
             entry_p["relfilepath"] = relfilepath
             # -- End of intra-ecc on filepath
+            # The database may hold the ECC of other files
+            if entries is not None and relfilepath not in entries:
+                continue
+            found.add(relfilepath)
 
             # -- Get file size, check its correctness and correct it by using intra-ecc if necessary
             filesize = str(entry_p["filesize"])
@@ -139,12 +191,16 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
                     f"Error: ecc entry corrupted on filepath field, please try to manually repair the filepath "
                     f"(filepath: {relfilepath} - missing/corrupted character at {relfilepath.find("\x00")}).")
                 files_skipped += 1
+                if report is not None:
+                    report.append({"path": relfilepath, "status": "corrupted entry"})
                 continue
             # Check that file still exists before checking it
             if not os.path.isfile(filepath):
                 print(f"Error: file {relfilepath} could not be found: either file was moved or the ecc entry was "
                       f"corrupted (filepath is incorrect?).")
                 files_skipped += 1
+                if report is not None:
+                    report.append({"path": relfilepath, "status": "missing"})
                 continue
 
             # -- Checking file size: if the size has changed, the blocks may not match anymore!
@@ -154,145 +210,181 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
                       f"the file correction because blocks may not match (you can set --ignore_size to still correct "
                       f"even if size is different, maybe just the entry was corrupted).")
                 files_skipped += 1
+                if report is not None:
+                    report.append({"path": relfilepath, "status": "size mismatch", "size": real_filesize})
                 continue
 
             files_count += 1
             # -- Check blocks and repair if necessary
             corrupted = False  # flag to signal that the file was corrupted and we need to reconstruct it afterwards
             repaired_partially = False  # flag to signal if a file was repaired only partially
-            # Do a first run to check if there's any error. If yes, then we will begin back from the start of the file
-            # but this time we will streamline copy the data to an output file.
-            with open(filepath, 'rb') as file:
-                # For each message block, check the message with hash and repair with ecc if necessary
-                # Extract and assemble each message block from the original file with its corresponding ecc and hash
-                for i, e in enumerate(stream_entry_assemble(
-                        ecc.hasher, file, db, entry_p, ecc.parameters["max_block_size"], ecc.parameters["header_size"],
-                        ecc.parameters["resilience_rates"])):
-                    # If the message block has a different hash or the message+ecc is corrupted (syndrome is not null),
-                    # it was corrupted (or the hash is corrupted or one of the characters of the ecc was corrupted, or
-                    # both). In any case, it's an any clause here (any potential corruption condition triggers the
-                    # correction).
-                    if ecc.hasher.hash(e["message"]) != e["hash"] or (
-                            not fast_check and not ecc.ecc_manager_variable.check(e["message"], e["ecc"],
-                                                                              k=e["ecc_params"]["message_size"])):
-                        corrupted = True
-                        break
-            # -- Reconstruct/Copying the repaired file
-            # If the first run detected a corruption, then we try to repair the file (we create an output file where
-            # good blocks will be copied as-is but bad blocks will be repaired, if it's possible)
-            if corrupted:
-                files_corrupted += 1
-                # flag to check that we could repair at least one block, else we will delete the output file since we
-                # didn't do anything
-                repaired_one_block = False
-                # flag to check if the ecc track is misaligned/misdetected (we only encounter corrupted blocks that we
-                # can't fix)
-                err_consecutive = True
-                with open(filepath, 'rb') as file:
-                    outfilepath = os.path.join(repair_dir, relfilepath)  # get the full path to the output file
-                    outfiledir = os.path.dirname(outfilepath)
-                    # if the target directory does not exist, create it (and create recursively all parent directories too)
-                    if not os.path.isdir(outfiledir):
-                        os.makedirs(outfiledir)
-                    with open(outfilepath, 'wb') as outfile:
-                        # TODO: optimize to copy over what we have already checked, so that we get directly to the first
-                        # error that triggered the correction
-                        # For each message block, check the message with hash and repair with ecc if necessary
-                        # Extract and assemble each message block from the original file with its corresponding ecc and
-                        # hash
-                        for i, e in enumerate(
-                                stream_entry_assemble(ecc.hasher, file, db, entry_p, ecc.parameters["max_block_size"],
-                                                      ecc.parameters["header_size"], ecc.parameters["resilience_rates"])):
-                            # If the message block has a different hash, it was corrupted (or the hash is corrupted,
-                            # or both)
-                            progress_message = ""
-                            if ecc.hasher.hash(e["message"]) == e["hash"] and (
-                                    fast_check or ecc.ecc_manager_variable.check(e["message"], e["ecc"],
-                                                                             k=e["ecc_params"]["message_size"])):
+            # flag to check that we could repair at least one block, else we will delete the output file since we
+            # didn't do anything
+            repaired_one_block = False
+            # flag to check if the ecc track is misaligned/misdetected (we only encounter corrupted blocks that we
+            # can't fix)
+            err_consecutive = True
+            misdetected = False  # flag to signal that the rest of the file was skipped
+            # blocks checked in the file, the corrupted ones and those of them that could be repaired
+            blocks_count, bad_blocks, repaired_blocks = 0, 0, 0
+            # Single pass: the blocks are checked and streamed to a temporary output file at once, the corrupted ones
+            # repaired on the way, so that the file is read only once. The output is moved to its place in the repair
+            # directory when there was something to repair, else it's just an exact copy of the original and removed.
+            # Without a repair directory, the blocks are only checked.
+            partpath = None
+            if repair_dir is not None:
+                os.makedirs(repair_dir, exist_ok=True)
+                outfilepath = os.path.join(repair_dir, relfilepath)  # get the full path to the output file
+                partfd, partpath = tempfile.mkstemp(prefix=".repair-", dir=repair_dir)
+            try:
+                with (open(filepath, 'rb') as file,
+                      os.fdopen(partfd, 'wb') if partpath is not None else nullcontext() as outfile):
+                    # For each message block, check the message with hash and repair with ecc if necessary
+                    # Extract and assemble each message block from the original file with its corresponding ecc and
+                    # hash, the corrupted blocks are decoded in batches ahead of this loop when they can be
+                    blocks = stream_entry_assemble(hasher, file, db, entry_p, max_block_size,
+                                                   ecc.parameters["header_size"], ecc.parameters["resilience_rates"],
+                                                   symbol_size=symbol_size, sector_size=sector_size)
+                    batch_decode = not (sector_size or enable_erasures or only_erasures)
+                    for i, e in enumerate(decode_blocks(blocks, ecc_manager, hasher, fast_check, sector_size,
+                                                        batch_decode, decoder=decoder)):
+                        # If the message block has a different hash or the message+ecc is corrupted (syndrome is not
+                        # null), it was corrupted (or the hash is corrupted or one of the characters of the ecc was
+                        # corrupted, or both). In any case, it's an any clause here (any potential corruption
+                        # condition triggers the correction).
+                        progress_message = ""
+                        blocks_count += 1
+                        if e["intact"]:
+                            if outfile is not None:
                                 outfile.write(e["message"])
-                                err_consecutive = False
-                            else:
-                                # Try to repair the block using ECC
-                                progress_message = f"File {relfilepath}: corruption in block {i}. Trying to fix it.\n"
-                                try:
-                                    repaired_block, repaired_ecc = ecc.ecc_manager_variable.decode(
+                            err_consecutive = False
+                        else:
+                            corrupted = True
+                            bad_blocks += 1
+                            # Try to repair the block using ECC
+                            progress_message = f"File {relfilepath}: corruption in block {i}. Trying to fix it.\n"
+                            try:
+                                if sector_size:
+                                    repaired_block, ecc_ok = correct_sector_group(
+                                        ecc_manager, hasher, e, max_block_size, symbol_size, sector_size)
+                                elif "decoded" in e:
+                                    repaired_block, repaired_ecc = e["decoded"]
+                                elif "decode_error" in e:
+                                    raise e["decode_error"]
+                                else:
+                                    repaired_block, repaired_ecc = ecc_manager.decode(
                                         e["message"], e["ecc"], k=e["ecc_params"]["message_size"],
                                         enable_erasures=enable_erasures, erasures_char=erasure_symbol,
                                         only_erasures=only_erasures)
-                                # the reedsolo lib may raise an exception when it can't decode. We ensure that we can
-                                # still continue to decode the rest of the file, and the other files.
-                                except (ReedSolomonError,
-                                        RSCodecError) as exc:
-                                    repaired_block = None
-                                    repaired_ecc = None
-                                    progress_message += "Error: file %s: block %i: %s\n" % (relfilepath, i, exc)
-                                # Check if the repair was successful. This is an "all" condition: if all checks fail,
-                                # then the correction failed. Else, we assume that the checks failed because the ecc
-                                # entry was partially corrupted (it's highly improbable that any one check success by
-                                # chance, it's a lot more probable that it's simply that the entry was partially
-                                # corrupted, eg: the hash was corrupted and thus cannot match anymore).
-                                hash_ok = False
+                            # the reedsolo lib may raise an exception when it can't decode. We ensure that we can
+                            # still continue to decode the rest of the file, and the other files.
+                            except (ReedSolomonError,
+                                    RSCodecError) as exc:
+                                repaired_block = None
+                                repaired_ecc = None
+                                progress_message += "Error: file %s: block %i: %s\n" % (relfilepath, i, exc)
+                            # Check if the repair was successful. This is an "all" condition: if all checks fail,
+                            # then the correction failed. Else, we assume that the checks failed because the ecc
+                            # entry was partially corrupted (it's highly improbable that any one check success by
+                            # chance, it's a lot more probable that it's simply that the entry was partially
+                            # corrupted, eg: the hash was corrupted and thus cannot match anymore).
+                            hash_ok = False
+                            if repaired_block is None:
                                 ecc_ok = False
-                                if repaired_block is not None:
-                                    hash_ok = (ecc.hasher.hash(repaired_block) == e["hash"])
-                                    ecc_ok = ecc.ecc_manager_variable.check(repaired_block, repaired_ecc,
-                                                                        k=e["ecc_params"]["message_size"])
-                                # If the hash now match the repaired message block, we commit the new block
-                                if repaired_block is not None and (hash_ok or ecc_ok):
+                            else:
+                                hash_ok = (block_hash(hasher, dict(e, message=repaired_block), sector_size)
+                                           == e["hash"])
+                                if not sector_size:
+                                    ecc_ok = ecc_manager.check(repaired_block, repaired_ecc,
+                                                               k=e["ecc_params"]["message_size"])
+                            # If the hash now match the repaired message block, we commit the new block
+                            if repaired_block is not None and (hash_ok or ecc_ok):
+                                if outfile is not None:
                                     outfile.write(repaired_block)  # save the repaired block
-                                    # Show a precise report about the repair
-                                    if hash_ok and ecc_ok:
-                                        progress_message += "File %s: block %i repaired!" % (relfilepath, i)
-                                    elif not hash_ok:
-                                        progress_message += (f"File {relfilepath}: block {i} probably repaired with"
-                                                             f"matching ecc check but with a hash error (assume the hash"
-                                                             f" was corrupted).")
-                                    elif not ecc_ok:
-                                        progress_message += (f"File {relfilepath}: block {i} probably repaired with "
-                                                             f"matching hash but with ecc check error (assume the ecc "
-                                                             f"was partially corrupted).")
-                                    # Turn on the repaired flag, to trigger the copying of the file (else it will be
-                                    # removed if all blocks repairs failed in this file)
-                                    repaired_one_block = True
-                                    err_consecutive = False
-                                # Else the hash does not match: the repair failed (either because the ecc is too much
-                                # tampered, or because the hash is corrupted. Either way, we don't commit).
-                                else:
+                                # Show a precise report about the repair
+                                if hash_ok and ecc_ok:
+                                    progress_message += "File %s: block %i repaired!" % (relfilepath, i)
+                                elif not hash_ok:
+                                    progress_message += (f"File {relfilepath}: block {i} probably repaired with"
+                                                         f"matching ecc check but with a hash error (assume the hash"
+                                                         f" was corrupted).")
+                                elif not ecc_ok:
+                                    progress_message += (f"File {relfilepath}: block {i} probably repaired with "
+                                                         f"matching hash but with ecc check error (assume the ecc "
+                                                         f"was partially corrupted).")
+                                # Turn on the repaired flag, to trigger the copying of the file (else it will be
+                                # removed if all blocks repairs failed in this file)
+                                repaired_one_block = True
+                                repaired_blocks += 1
+                                err_consecutive = False
+                            # Else the hash does not match: the repair failed (either because the ecc is too much
+                            # tampered, or because the hash is corrupted. Either way, we don't commit).
+                            else:
+                                if outfile is not None:
                                     outfile.write(e["message"])  # copy the bad block that we can't repair...
-                                    # you need to code yourself to use bit-recover, it's in perl but it should work
-                                    # given the hash computed by this script and the corresponding message block.
-                                    progress_message += (f"Error: file {relfilepath} could not repair block {i} (both "
-                                                         f"hash and ecc check mismatch). If you know where the errors "
-                                                         f"are, you can set the characters to a null character so that "
-                                                         f"the ecc may correct twice more characters.")
-                                    repaired_partially = True
-                                    # Detect if the ecc track is misaligned/misdetected (we encounter only errors that
-                                    # we can't fix)
-                                    if err_consecutive and i >= 10:  # threshold is ten consecutive uncorrectable errors
-                                        progress_message += (f"\nFailure: Too many consecutive uncorrectable errors for"
-                                                             f" {relfilepath}. Most likely, the ecc track was "
-                                                             f"misdetected (try to repair the entrymarkers and field "
-                                                             f"delimiters). Skipping this track/file.")
-                                        # Optimization: move the reading cursor to the beginning of the next ecc entry,
-                                        # this will save some iterations in get_next_entry()
-                                        db.seek(entry_p["ecc_field_pos"][1])
-                                        break
-                            callback(e["curpos"], entry_p["filesize"], progress_message)
+                                # you need to code yourself to use bit-recover, it's in perl but it should work
+                                # given the hash computed by this script and the corresponding message block.
+                                progress_message += (f"Error: file {relfilepath} could not repair block {i} (both "
+                                                     f"hash and ecc check mismatch). If you know where the errors "
+                                                     f"are, you can set the characters to a null character so that "
+                                                     f"the ecc may correct twice more characters.")
+                                repaired_partially = True
+                                # Detect if the ecc track is misaligned/misdetected (we encounter only errors that
+                                # we can't fix)
+                                if err_consecutive and i >= 10:  # threshold is ten consecutive uncorrectable errors
+                                    progress_message += (f"\nFailure: Too many consecutive uncorrectable errors for"
+                                                         f" {relfilepath}. Most likely, the ecc track was "
+                                                         f"misdetected (try to repair the entrymarkers and field "
+                                                         f"delimiters). Skipping this track/file.")
+                                    misdetected = True
+                                    break
+                        callback(e["curpos"], entry_p["filesize"], progress_message)
+                # -- Reconstruct/Copying the repaired file
+                # Check that at least one block was repaired, else we couldn't fix anything in the file (or there was
+                # nothing to fix) and thus we should just remove the output file which is an exact copy of the
+                # original without any added value
+                if partpath is not None and repaired_one_block:
+                    outfiledir = os.path.dirname(outfilepath)
+                    # if the target directory does not exist, create it (and create recursively all parent
+                    # directories too)
+                    if not os.path.isdir(outfiledir):
+                        os.makedirs(outfiledir)
+                    os.replace(partpath, outfilepath)
+                elif partpath is not None:
+                    os.remove(partpath)
+            except BaseException:
+                # don't leave the temporary output behind when the repair is interrupted
+                if partpath is not None and os.path.exists(partpath):
+                    os.remove(partpath)
+                raise
+            if report is not None:
+                status = "misdetected" if misdetected else "damaged" if repaired_partially else \
+                    "correctable" if corrupted else "healthy"
+                report.append({"path": relfilepath, "status": status, "size": filesize, "blocks": blocks_count,
+                               "bad_blocks": bad_blocks, "correctable_blocks": repaired_blocks})
+            if corrupted:
+                files_corrupted += 1
+            if not repaired_one_block:
+                continue
+            if partpath is not None:
                 # Copying the last access time and last modification time from the original file
                 # TODO: a more reliable way would be to use the db computed by rfigc.py, because if a software
-                #  maliciously tampered the data, then the modification date may also have changed (but not if it's a
-                #  silent error, in that case we're ok).
+                #  maliciously tampered the data, then the modification date may also have changed (but not if it's
+                #  a silent error, in that case we're ok).
                 filestats = os.stat(filepath)
                 os.utime(outfilepath, (filestats.st_atime, filestats.st_mtime))
-                # Check that at least one block was repaired, else we couldn't fix anything in the file and thus we
-                # should just remove the output file which is an exact copy of the original without any added value
-                if not repaired_one_block:
-                    os.remove(outfilepath)
-                # Counters...
-                elif repaired_partially:
-                    files_repaired_partially += 1
-                else:
-                    files_repaired_completely += 1
+            # Counters...
+            if repaired_partially:
+                files_repaired_partially += 1
+            else:
+                files_repaired_completely += 1
+        # Entries asked for that the database doesn't have can't be checked
+        if entries is not None:
+            for relfilepath in sorted(entries - found):
+                print(f"Error: file {relfilepath} has no entry in the ecc file {database}.")
+                files_skipped += 1
+                if report is not None:
+                    report.append({"path": relfilepath, "status": "missing"})
     # All ecc entries processed for checking and potentally repairing, we're done correcting!
     print(f"All done! Stats:\n- Total files processed: {files_count}\n- Total files corrupted: {files_corrupted}\n"
           f"- Total files repaired completely: {files_repaired_completely}\n"
@@ -306,96 +398,362 @@ def correct_errors(damaged, repair_dir, ecc_file, only_erasures=False, enable_er
     else:
         return False
 
-def get_next_entry(file, entrymarker, only_coord=True, blocksize=65535):
+def decode_blocks(blocks, ecc_manager, hasher, fast_check, sector_size, batch_decode=True, window=None,
+                  decoder=None):
     '''
-    Find or read the next ecc entry in a given ecc file.
-    Call this function multiple times with the same file handle to get subsequent markers positions (this is not a
-    generator but it works very similarly, because it will continue reading from the file's current cursor position
-    -- this can be used advantageously if you want to read only a specific entry by seeking before supplying the file handle).
-    This will read any string length between two entrymarkers.
-    The reading is very tolerant, so it will always return any valid entry (but also scrambled entries if any, but the
-    decoding will ensure everything's ok).
-    `file` is a file handle, not the path to the file.
+    Blocks assembled by stream_entry_assemble, with "intact" set when they pass the checks of correct_errors. They are
+    read ahead by windows that double from 64 blocks up to config.ecc_repair_window blocks, so that a corruption near
+    the start of a file is found without reading far ahead. Without fast_check, the blocks of a window with a
+    matching hash are checked by their ecc in batches of the same message size (see ECCMan.check_batch), and with
+    batch_decode the corrupted blocks are decoded in batches too (see ECCMan.decode_batch). The repaired message and
+    ecc of those that could be decoded are in "decoded", the others are decoded again one by one by correct_errors to
+    report why. With a BlockDecoder, those are decoded by its processes instead while the next window is read, and
+    the exception raised by ECCMan.decode of a block that can't be repaired is in "decode_error". The blocks are still
+    yielded in order, at most 2 windows are held.
     '''
-    # TODO: use mmap native module instead of manually reading using blocksize?
-    entrymarker = bytearray(b(entrymarker))
-    found = False
-    # start and end vars are the relative position of the starting/ending entrymarkers in the current buffer
-    start = None
-    end = None
-    # startcursor and endcursor are the absolute position of the starting/ending entrymarkers inside the database file
-    startcursor = None
-    endcursor = None
-    buf = 1
-    # Sanity check: cannot screen the file's content if the window is of the same size as the pattern to match
-    # (the marker)
-    if blocksize <= len(entrymarker): blocksize = len(entrymarker) + 1
-    # Continue the search as long as we did not find at least one starting marker and one ending marker (or end of file)
-    while (not found and buf):
-        # Read a long block at once, we will readjust the file cursor after
-        buf = bytearray(file.read(blocksize))
-        # Find the start marker (if not found already)
-        if start is None or start == -1:
-            start = buf.find(entrymarker); # relative position of the starting marker in the currently read string
-            # assign startcursor only if it's empty (meaning that we did not find the starting entrymarker, else if
-            # found we are only looking for
-            if start >= 0 and not startcursor:
-                startcursor = file.tell() - len(buf) + start # absolute position of the starting marker in the file
-            if start >= 0: start = start + len(entrymarker)
-        # If we have a starting marker, we try to find a subsequent marker which will be the ending of our entry (if the
-        # entry is corrupted we don't care: it won't pass the entry_to_dict() decoding or subsequent steps of decoding
-        # and we will just pass to the next ecc entry). This allows to process any valid entry, no matter if previous
-        # ones were scrambled.
-        if startcursor is not None and startcursor >= 0:
-            end = buf.find(entrymarker, start)
-            # Special case: we didn't find any ending marker but we reached the end of file, then we are probably in
-            # fact just reading the last entry (thus there's no ending marker for this entry)
-            if end < 0 and len(buf) < blocksize:
-                end = len(buf) # It's ok, we have our entry, the ending marker is just the end of file
-            # If we found an ending marker (or if end of file is reached), then we compute the absolute cursor value and
-            # put the file reading cursor back in position, just before the next entry
-            # (where the ending marker is if any)
-            if end >= 0:
-                endcursor = file.tell() - len(buf) + end
-                # Make sure we are not redetecting the same marker as the start marker
-                if endcursor > startcursor:
-                    file.seek(endcursor)
-                    found = True
-                else:
-                    end = -1
-                    encursor = None
-        #print("Start:", start, startcursor)
-        #print("End: ", end, endcursor)
-        # Stop criterion to avoid infinite loop: in the case we could not find any entry in the rest of the file and we
-        # reached the EOF, we just quit now
-        if len(buf) < blocksize: break
-        # Did not find the full entry in one buffer? Reinit variables for next iteration, but keep in memory startcursor.
-        # reset the start position for the end buf find at next iteration (ie: in the arithmetic operations to compute
-        # the absolute endcursor position, the start entrymarker won't be accounted because it was discovered in a
-        # previous buffer).
-        if start > 0: start = 0
-        if not endcursor:
-            # Try to fix edge case where blocksize stops the buffer exactly in the middle of the ending entrymarker. The
-            # starting marker should always be ok because it should be quite close (or generally immediately after) the
-            # previous entry, but the end depends on the end of the current entry (size of the original file), thus the
-            # buffer may miss the ending entrymarker. should offset file.seek(-len(entrymarker)) before searching for
-            # ending.
-            file.seek(file.tell()-len(entrymarker))
-    # if an entry was found, we seek to the beginning of the entry and then either read the entry from file or just
-    # return the markers positions (aka the entry bounds)
-    if found:
-        file.seek(startcursor + len(entrymarker))
-        if only_coord:
-            # Return only coordinates of the start and end markers
-            # Note: it is useful to just return the reading positions and not the entry itself because it can get quite
-            # huge and may overflow memory, thus we will read each ecc blocks on request using a generator.
-            return [startcursor + len(entrymarker), endcursor]
-        else:
-            # Return the full entry's content
-            return file.read(endcursor - startcursor - len(entrymarker))
+    window = window or config.ecc_repair_window
+    size = min(64, window)
+    blocks = iter(blocks)
+    pending = deque() # windows of blocks read ahead, some of them decoded by the processes of the decoder
+    try:
+        while True:
+            ahead = list(itertools.islice(blocks, size))
+            if not ahead:
+                break
+            size = min(size * 2, window)
+            for e in ahead:
+                e["intact"] = block_hash(hasher, e, sector_size) == e["hash"]
+            if not fast_check:
+                for k, group in blocks_by_size([e for e in ahead if e["intact"]]).items():
+                    messages, eccs = padded_blocks(ecc_manager, group, k)
+                    for e, valid in zip(group, ecc_manager.check_batch(messages, eccs, k=k)):
+                        e["intact"] = bool(valid)
+            if batch_decode:
+                for k, group in blocks_by_size([e for e in ahead if not e["intact"]]).items():
+                    messages, eccs = padded_blocks(ecc_manager, group, k)
+                    messages, eccs, decoded = ecc_manager.decode_batch(messages, eccs, k=k)
+                    for e, message, ecc_block, ok in zip(group, messages, eccs, decoded):
+                        if ok:
+                            # strip the padding of the last block, like ECCMan.decode
+                            e["decoded"] = (message[k - len(e["message"]):].tobytes(), ecc_block.tobytes())
+            if decoder is not None and not sector_size:
+                remaining = [e for e in ahead if not e["intact"] and "decoded" not in e]
+                if decoder.wanted(len(remaining)):
+                    for e in remaining:
+                        e["future"] = decoder.submit(e)
+            pending.append(ahead)
+            # keep the processes busy with this window but give the previous one before reading more
+            while len(pending) > 1 or (pending and not any("future" in e for e in pending[0])):
+                yield from decoded_blocks(pending.popleft())
+        while pending:
+            yield from decoded_blocks(pending.popleft())
+    finally:
+        # the repair of the file may stop before its end
+        for e in itertools.chain.from_iterable(pending):
+            if "future" in e:
+                e["future"].cancel()
+
+def decoded_blocks(blocks):
+    '''Blocks of a window of decode_blocks, once those sent to a BlockDecoder are decoded'''
+    for e in blocks:
+        future = e.pop("future", None)
+        if future is not None:
+            try:
+                e["decoded"] = future.result()
+            except (ReedSolomonError, RSCodecError) as exc:
+                e["decode_error"] = exc
+        yield e
+
+def decode_block(max_block_size, symbol_size, message, ecc_block, k, **options):
+    '''
+    Repaired message and ecc of a corrupted block by ECCMan.decode with the options of the repair. This is the unit of
+    work of a BlockDecoder and runs inside a worker process, so it only relies on its arguments: the ecc manager of the
+    track for max_block_size and symbol_size (see ecc.get_track_manager).
+    '''
+    ecc_manager = ecc.get_track_manager(max_block_size, symbol_size)
+    return ecc_manager.decode(message, ecc_block, k=k, **options)
+
+class BlockDecoder(object):
+    '''
+    Pool of processes decoding the corrupted blocks of a repair one by one (see decode_blocks), for the tracks of
+    codewords of max_block_size bytes made of symbols of symbol_size bytes. The options are those of ECCMan.decode.
+    The pool is only started for a window with at least config.ecc_repair_parallel_min_blocks blocks to decode, so
+    that lightly damaged files don't wait for the processes, and is then used until the decoder is closed.
+    '''
+    def __init__(self, max_block_size, symbol_size, workers=None, **options):
+        self.track = (max_block_size, symbol_size)
+        self.options = options
+        if workers is None:
+            workers = config.ecc_repair_workers or os.cpu_count() or 1
+        self.workers = workers
+        self.executor = None
+
+    def wanted(self, count):
+        '''Whether count corrupted blocks of a window are decoded by the processes'''
+        if self.workers <= 1 or not count:
+            return False
+        return self.executor is not None or count >= config.ecc_repair_parallel_min_blocks
+
+    def submit(self, e):
+        '''Future of the "decoded" message and ecc of a block assembled by stream_entry_assemble'''
+        if self.executor is None:
+            self.executor = ecc.ecc_process_pool(self.workers)
+        return self.executor.submit(decode_block, *self.track, bytes(e["message"]), bytes(e["ecc"]),
+                                    e["ecc_params"]["message_size"], **self.options)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def blocks_by_size(blocks):
+    '''Blocks assembled by stream_entry_assemble grouped by their message size'''
+    groups = {}
+    for e in blocks:
+        groups.setdefault(e["ecc_params"]["message_size"], []).append(e)
+    return groups
+
+def padded_blocks(ecc_manager, blocks, k):
+    '''
+    Messages and eccs of blocks of the message size k as uint8 arrays, padded like ECCMan.decode and ECCMan.check
+    '''
+    messages = np.array([np.frombuffer(ecc_manager.pad(e["message"], k=k)[0], dtype=np.uint8) for e in blocks])
+    eccs = np.array([np.frombuffer(ecc_manager.rpad(e["ecc"], k=k)[0], dtype=np.uint8) for e in blocks])
+    return messages, eccs
+
+def block_hash(hasher, e, sector_size):
+    '''
+    Hash of the message of a block assembled by stream_entry_assemble, like its record: in the sector layout, the hash
+    of each sector of the group, the last ones padded with null bytes
+    '''
+    if not sector_size:
+        return hasher.hash(e["message"])
+    group = bytes(e["message"]) + bytes(e["ecc_params"]["message_size"] - len(e["message"]))
+    return b''.join(hasher.hash(group[i:i + sector_size]) for i in range(0, len(group), sector_size))
+
+def correct_sector_group(ecc_manager, hasher, e, max_block_size, symbol_size, sector_size):
+    '''
+    Repair a group of sectors of the sector layout (see ecc.encode_sector_group). The sectors whose hash differs are
+    erasures at known positions in every codeword, so they are first corrected as erasures only, which repairs as many
+    sectors as there are ecc symbols in the codewords, twice the errors that could be corrected. If that fails, for
+    example because the ecc is also damaged, they are corrected as errors and erasures.
+    Returns
+    -------
+    list
+        The repaired message of the group or None, and whether all its codewords are now valid
+    '''
+    codeword_size = e["ecc_params"]["codeword_size"]
+    sectors = codeword_size // symbol_size
+    hash_size = len(hasher)
+    group = bytes(e["message"]) + bytes(e["ecc_params"]["message_size"] - len(e["message"]))
+    lost = [i for i in range(sectors) if hasher.hash(group[i * sector_size:(i + 1) * sector_size])
+            != e["hash"][i * hash_size:(i + 1) * hash_size]]
+    erase_pos = [i * symbol_size + j for i in lost for j in range(symbol_size)]
+    messages = ecc.sector_codewords(np.frombuffer(group, dtype=np.uint8), sectors, sector_size, symbol_size)
+    # a truncated ecc is padded like ECCMan.rpad
+    eccs = np.frombuffer(bytes(e["ecc"]).ljust(e["ecc_params"]["ecc_size"], b"\x00"),
+                         dtype=np.uint8).reshape(len(messages), -1)
+    for only_erasures in (True, False):
+        if only_erasures and len(erase_pos) > max_block_size - codeword_size:
+            continue
+        # every codeword of the group has the same erasures, they are decoded together
+        repaired, _, decoded = ecc_manager.decode_batch(messages, eccs, k=codeword_size, erase_pos=erase_pos,
+                                                        only_erasures=only_erasures)
+        if not decoded.all():
+            continue
+        repaired_block = ecc.codeword_sectors(repaired, sectors, sector_size, symbol_size)[:len(e["message"])]
+        # erasures only always give a codeword, it is only right if the sectors now match their hash
+        if only_erasures and block_hash(hasher, dict(e, message=repaired_block), sector_size) != e["hash"]:
+            continue
+        return repaired_block, True
+    return None, False
+
+def read_database_header(db):
+    '''
+    Read the header of an ecc database, before its first entry, to find its version, the hasher of its blocks and the
+    field of its codewords. Each character of the version, each hasher line, each field line and each layout line are
+    written 3 times, a majority vote recovers them if a copy is tampered. Databases version 3 have no hasher line and
+    store md5 hexadecimal digests, databases without a field line are encoded in GF(2^8) and databases without a
+    layout line are not interleaved across sectors.
+    Returns
+    -------
+    dict
+        version str, hasher str, max_block_size int, symbol_size int (see ecc.track_code) and sector_size int (see
+        ecc.BlockPlan)
+    '''
+    pos = db.tell()
+    db.seek(0)
+    header = db.read(4096).split(b(ecc.parameters["entrymarker"]))[0] # the header is smaller than 1 KB
+    db.seek(pos)
+    lines = header.split(b"\n")
+    # version: majority vote on each character repeated 3 times
+    version = "3.1.4"
+    marker = lines[0].split(b"ECCv")
+    if len(marker) == 2:
+        repeated = marker[1].split(b"**")[0].decode("latin-1")
+        voted = "".join(Counter(repeated[i:i + 3]).most_common(1)[0][0] for i in range(0, len(repeated), 3))
+        if voted:
+            version = voted
+    # hasher: majority vote on the copies of its line that name a known algorithm
+    hashers = Counter(line[len(b"** Hasher: "):].decode("latin-1").strip() for line in lines[1:]
+                      if line.startswith(b"** Hasher: "))
+    hashers = [algo for algo, _ in hashers.most_common() if algo in Hasher.known_algo]
+    if hashers:
+        hasher = hashers[0]
+    elif version.startswith("3"):
+        hasher = "md5"
     else:
-        # Nothing found (or no new entry to find, we've already found them all), so we return None
+        hasher = ecc.hasher.algo
+        print(f"Warning: the hasher of the ECC database could not be read, trying {hasher}.")
+    # field: majority vote on the copies of its line, the number of bits and of symbols of the codewords
+    fields = Counter(tuple(line[len(b"** Field: "):].split()) for line in lines[1:] if line.startswith(b"** Field: "))
+    max_block_size, symbol_size = ecc.track_code(8)
+    for field, _ in fields.most_common():
+        try:
+            max_block_size, symbol_size = ecc.track_code(*[int(x) for x in field])
+            break
+        except (ValueError, TypeError):
+            continue
+    else:
+        if fields:
+            print("Warning: the field of the ECC database could not be read, trying GF(2^8).")
+    # layout: majority vote on the copies of its line, the size of the sectors
+    layouts = Counter(line[len(b"** Layout: sectors "):].strip() for line in lines[1:]
+                      if line.startswith(b"** Layout: sectors "))
+    layouts = [int(size) for size, _ in layouts.most_common() if size.isdigit() and int(size) % symbol_size == 0]
+    sector_size = layouts[0] if layouts else 0
+    return {"version": version, "hasher": hasher, "max_block_size": max_block_size, "symbol_size": symbol_size,
+            "sector_size": sector_size}
+
+def read_entry_offsets(index_path):
+    '''
+    Positions of the entrymarkers of the entries of a database, from the records of its index (see
+    ecc.write_entry_metadata), which are repaired with their ecc if needed. Returns None if the index is missing or
+    can't be repaired.
+    '''
+    record_size = 1 + 8 + ecc.ecc_params_idx["ecc_size"]
+    try:
+        with open(index_path, 'rb') as f:
+            index = f.read()
+    except OSError:
         return None
+    if not index or len(index) % record_size:
+        return None
+    offsets = []
+    for pos in range(0, len(index), record_size):
+        marker = index[pos:pos + 9]
+        marker_ecc = index[pos + 9:pos + record_size]
+        if not ecc.ecc_manager_idx.check(marker, marker_ecc):
+            try:
+                marker, marker_ecc = ecc.ecc_manager_idx.decode(marker, marker_ecc)
+            except (ReedSolomonError, RSCodecError):
+                return None
+            if not ecc.ecc_manager_idx.check(marker, marker_ecc):
+                return None
+        marker = b(marker)
+        # type 1 is the entrymarker, type 2 the field delimiters
+        if marker[:1] == b'1':
+            offsets.append(struct.unpack('>Q', marker[1:9])[0])
+    return offsets
+
+class EccDatabase(object):
+    '''
+    Reader of the entries of an ecc database. The positions of the entries come from the offsets of its index (.idx),
+    which have their own ecc, so any entry is reached directly, even if its entrymarker was tampered. When the index
+    is missing or damaged, the entrymarkers are found by a scan of a memory map of the database. The entries of the
+    files of an archive database are found by their path with entry_numbers.
+    '''
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path str
+            The path of the ecc database, its index is path.idx
+        '''
+        self.path = path
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        # an empty file can't be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else BytesIO()
+        self.entrymarker = b(ecc.parameters["entrymarker"])
+        self.field_delim = b(ecc.parameters["field_delim"])
+        self.indexed = True # False when the positions were scanned
+        self.positions = self.index_positions()
+        if self.positions is None:
+            self.indexed = False
+            self.positions = self.scan_positions()
+
+    def index_positions(self):
+        '''
+        Start and end of every entry, after its entrymarker, from the offsets of the index. Returns None when the index
+        is missing, can't be repaired or doesn't match the database.
+        '''
+        offsets = read_entry_offsets(self.path + ".idx")
+        if not offsets or offsets != sorted(set(offsets)) or offsets[-1] >= self.size:
+            return None
+        return [[start + len(self.entrymarker), end] for start, end in zip(offsets, offsets[1:] + [self.size])]
+
+    def scan_positions(self):
+        '''
+        Start and end of every entry, after its entrymarker, found in the memory map. An entry ends at the next
+        entrymarker, or at the end of the database for the last one.
+        '''
+        positions = []
+        start = self.map.find(self.entrymarker)
+        while start >= 0:
+            end = self.map.find(self.entrymarker, start + len(self.entrymarker))
+            positions.append([start + len(self.entrymarker), end if end >= 0 else self.size])
+            start = end
+        return positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def fields(self, number):
+        '''
+        The fields of the entry at this number (see entry_fields), a copy that can be modified
+        '''
+        return entry_fields(self.map, self.positions[number], self.field_delim)
+
+    def entry_numbers(self):
+        '''
+        Numbers of the entries by the path of their file as written in the database, with / separators. It is built once
+        for each version of the database file (see database_entry_numbers) and shared by the readers of the database,
+        so that the repair of a few files of an archive database doesn't read all its entries every time. An entry
+        whose path was damaged is missing, or under the damaged path.
+        '''
+        stat = os.fstat(self.file.fileno())
+        return database_entry_numbers(self.path, stat.st_size, stat.st_mtime_ns)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+@lru_cache(maxsize=16)
+def database_entry_numbers(path, size, mtime_ns):
+    '''
+    Numbers of the entries of an ecc database by the path of their file, for EccDatabase.entry_numbers. The size and
+    modification time of the database are part of the key so that a database written again is read again.
+    '''
+    numbers = {}
+    with EccDatabase(path) as database:
+        for number in range(len(database)):
+            relfilepath = database.fields(number)["relfilepath"].decode('latin-1')
+            # the first entry of a path is the one repaired when the database holds it several times
+            numbers.setdefault(relfilepath, number)
+    return numbers
 
 def entry_fields(file, entry_pos, field_delim):
     '''
@@ -464,7 +822,7 @@ def ecc_correct_intra_stream(ecc_manager_intra, ecc_params_intra, hasher_intra,
     fpfile = BytesIO(b(field))
     fpfile_ecc = BytesIO(b(ecc))
     # create a fake entry_pos so that the ecc reading function works correctly
-    fpentry_p = {"ecc_field_pos": [0, len(field)]}
+    fpentry_p = {"ecc_field_pos": [0, len(field)], "filesize": len(field)}
     # Prepare variables
     field_correct = [] # will store each block of the corrected (or already correct) filepath
     fcorrupted = False # check if field was corrupted
@@ -504,7 +862,7 @@ def ecc_correct_intra_stream(ecc_manager_intra, ecc_params_intra, hasher_intra,
     return (field, fcorrupted, fcorrected, errmsg)
 
 def stream_entry_assemble(hasher, file, eccfile, entry_fields, max_block_size, header_size, resilience_rates,
-                          constantmode=False):
+                          constantmode=False, symbol_size=1, sector_size=0):
     '''
     From an entry with its parameters (filename, filesize), assemble a list of each block from the original file along
     with the relative hash and ecc for easy processing later.
@@ -513,30 +871,29 @@ def stream_entry_assemble(hasher, file, eccfile, entry_fields, max_block_size, h
     eccfile.seek(entry_fields["ecc_field_pos"][0])
     curpos = file.tell()
     ecc_curpos = eccfile.tell()
+    # The position and ecc parameters of every block (constant rate in the header, progressive afterwards) are given by
+    # the block plan of the file
+    plan = ecc.get_block_plan(entry_fields["filesize"], max_block_size, header_size, resilience_rates, hasher,
+                              constantmode=constantmode, symbol_size=symbol_size, sector_size=sector_size)
+    runs_params = [plan.ecc_params(run) for run in range(plan.nb_runs)]
     # continue reading the input file until we reach the position of the previously detected ending marker
-    while (ecc_curpos < entry_fields["ecc_field_pos"][1]):
-        # Compute the current rate, depending on where we are inside the input file (headers? later stage?)
-        if curpos < header_size or constantmode: # header stage: constant rate
-            rate = resilience_rates[0]
-        else: # later stage 2 or 3: progressive rate
-            # find the rate for the current stream of data (interpolate between stage 2 and stage 3 rates depending on
-            # the cursor position in the file)
-            rate = utils.feature_scaling(curpos, header_size, entry_fields["filesize"], resilience_rates[1],
-                                         resilience_rates[2])
-        # From the rate, compute the ecc parameters
-        ecc_params = ecc.compute_ecc_params(max_block_size, rate, hasher)
+    for _, run, _ in plan.blocks():
+        if ecc_curpos >= entry_fields["ecc_field_pos"][1]:
+            break
+        ecc_params = runs_params[run]
         # Extract the message block from input file, given the computed ecc parameters
         mes = file.read(ecc_params["message_size"])
         if len(mes) == 0:
             # quit if message is empty (reached end-of-file), this is a safeguard if ecc pos ending was miscalculated
             # (we thus only need the starting position to be correct)
             return
-        buf = eccfile.read(ecc_params["hash_size"]+ecc_params["ecc_size"])
-        hash = buf[:ecc_params["hash_size"]]
-        ecc_result = buf[ecc_params["hash_size"]:]
+        buf = eccfile.read(ecc_params["record_size"])
+        # the hash of each sector of a group in the sector layout
+        hash = buf[:ecc_params["record_size"] - ecc_params["ecc_size"]]
+        ecc_result = buf[ecc_params["record_size"] - ecc_params["ecc_size"]:]
 
-        yield {"message": mes, "hash": hash, "ecc": ecc_result, "rate": rate, "ecc_params": ecc_params,
-               "curpos": curpos, "ecc_curpos": ecc_curpos}
+        yield {"message": mes, "hash": hash, "ecc": ecc_result, "ecc_params": ecc_params, "curpos": curpos,
+               "ecc_curpos": ecc_curpos}
         # Prepare for the next iteration of the loop
         curpos = file.tell()
         ecc_curpos = eccfile.tell()
@@ -0,0 +1,274 @@
+'''
+Vectorized Reed-Solomon codec over GF(2^16) built on NumPy, for long codewords of up to 65535 symbols of 16 bits. Where
+a codeword of GF(2^8) holds at most 255 bytes, a codeword of 4095 symbols holds about 6 KB of data, so a file has far
+fewer blocks, hashes and ecc records, and a burst of errors over many bytes falls in a single codeword that corrects it.
+
+Messages and ecc are bytes, each symbol is 2 bytes in big endian order so their sizes are even. The code is the same as
+reedsolo's with c_exp=16 (same generator polynomial and order of the symbols), but it is incompatible with the codewords
+of GF(2^8) of ECCMan algorithms 1 to 5.
+
+References
+----------
+- https://github.com/tomerfiliba-org/reedsolomon/blob/master/src/reedsolo/reedsolo.py
+- https://en.wikiversity.org/wiki/Reed%E2%80%93Solomon_codes_for_coders
+- Blahut, Algebraic Codes for Data Transmission, 2003, section 7.6 (Berlekamp-Massey algorithm with erasures)
+'''
+from functools import lru_cache
+import threading
+import numpy as np
+from creedsolo import ReedSolomonError
+from rs_batch import gf_mult_nolut, scratch_arrays
+
+class GF16(object):
+    '''
+    Log and anti-log tables of GF(2^16). The log of 0 is a sentinel that points to a zero area of the anti-log table, so
+    that exp[log[x] + log[y]] is x * y for whole arrays of elements, zeros included, without masking.
+    '''
+    def __init__(self, prim=0x1100b, generator=2):
+        self.prim = prim
+        self.generator = generator
+        self.c_exp = 16
+        self.field_charac = int(2**self.c_exp - 1)
+        self.zero_log = 2 * self.field_charac
+        # doubled anti-log table, then zeros for the sums with the sentinel
+        self.exp = np.zeros(4 * self.field_charac + 1, dtype=np.uint16)
+        self.log = np.zeros(self.field_charac + 1, dtype=np.int32)
+        x = 1
+        for i in range(self.field_charac):
+            self.exp[i] = x
+            self.log[x] = i
+            x = gf_mult_nolut(x, generator, prim, self.field_charac + 1)
+        if x != 1 or len(set(self.exp[:self.field_charac].tolist())) != self.field_charac:
+            raise ValueError("%i is not a generator of GF(2^16) with the prime polynomial %s" % (generator, hex(prim)))
+        self.exp[self.field_charac:2 * self.field_charac] = self.exp[:self.field_charac]
+        self.log[0] = self.zero_log
+
+    def mul(self, x, y):
+        '''Multiply arrays of elements'''
+        return self.exp[self.log[x] + self.log[y]]
+
+    def inverse(self, x):
+        return self.exp[self.field_charac - self.log[x]]
+
+    def pow_alpha(self, powers):
+        '''Generator to the powers, which may be negative'''
+        return self.exp[np.mod(powers, self.field_charac)]
+
+    def poly_mul(self, p, q):
+        '''Multiply two polynomials, coefficients are ordered from the lowest degree'''
+        r = np.zeros(len(p) + len(q) - 1, dtype=np.uint16)
+        logs = self.log[p]
+        for j, coef in enumerate(q):
+            if coef:
+                r[j:j + len(p)] ^= self.exp[logs + self.log[coef]]
+        return r
+
+class RS16Codec(object):
+    '''
+    Systematic Reed-Solomon codec over GF(2^16) for codewords of n symbols. Shorter messages are left padded with null
+    symbols (shortened code), like ECCMan.pad does. Encoding works on batches of messages of the same size, decoding on a
+    single codeword.
+    Parameters
+    ----------
+    n int
+        Symbols in a codeword, at most 65535
+    prim int (optional)
+    generator int (optional)
+    fcr int (optional)
+        First consecutive root of the generator polynomial
+    '''
+    def __init__(self, n=65535, prim=0x1100b, generator=2, fcr=1):
+        if not 0 < n <= 65535:
+            raise ValueError("Codewords of GF(2^16) have at most 65535 symbols, not %i" % n)
+        self.n = n
+        self.prim = prim
+        self.generator = generator
+        self.fcr = fcr
+        self._gf = None
+        self.generator_poly = lru_cache(maxsize=64)(self._generator_poly)
+        self.scratch = threading.local() # work arrays of encode_batch
+
+    @property
+    def gf(self):
+        '''Tables of the field, built on first use'''
+        if self._gf is None:
+            self._gf = gf16_tables(self.prim, self.generator)
+        return self._gf
+
+    def _generator_poly(self, nsym):
+        '''
+        Logs of the coefficients of the generator polynomial, from the highest degree without the leading 1. Same
+        polynomial as reedsolo.rs_generator_poly.
+        '''
+        g = np.array([1], dtype=np.uint16)
+        for i in range(nsym):
+            # (x - alpha^(fcr+i)) with the lowest degree first
+            g = self.gf.poly_mul(g, np.array([self.gf.pow_alpha(i + self.fcr), 1], dtype=np.uint16))
+        return self.gf.log[g[::-1][1:]].astype(np.int32)
+
+    def encode_batch(self, messages, k=None, out=None):
+        '''
+        Encode a batch of messages of shape (count, 2k) of bytes and return their ecc as an array of shape
+        (count, 2(n-k)) of bytes, written into out when given (see rs_batch.RSBatchCodec.encode_batch)
+        '''
+        messages = np.asarray(messages, dtype=np.uint8)
+        if k is None:
+            k = messages.shape[1] // 2
+        nsym = self.n - k
+        count = messages.shape[0]
+        gf = self.gf
+        g = self.generator_poly(nsym)[:, None]
+        work, row, logs, products = scratch_arrays(self.scratch, {
+            "work": ((k + nsym, count), np.uint16), "row": ((count,), np.int32), "logs": ((nsym, count), np.int32),
+            "products": ((nsym, count), np.uint16)})
+        # synthetic division of message * x^nsym by the generator, one row per symbol so that the rows updated by a
+        # symbol are contiguous for the whole batch
+        work[:k] = messages.reshape(count, 2 * k).view('>u2').T
+        work[k:] = 0
+        for i in range(k):
+            np.take(gf.log, work[i], out=row)
+            np.add(g, row, out=logs)
+            np.take(gf.exp, logs, out=products)
+            np.bitwise_xor(work[i + 1:i + 1 + nsym], products, out=work[i + 1:i + 1 + nsym])
+        if out is None:
+            out = np.empty((count, 2 * nsym), dtype=np.uint8)
+        np.copyto(out.view('>u2'), work[k:].T)
+        return out
+
+    def encode(self, message, k=None):
+        '''Ecc bytes of one message of 2k bytes'''
+        message = np.frombuffer(bytes(message), dtype=np.uint8)
+        return self.encode_batch(message[None, :], k=k)[0].tobytes()
+
+    def syndromes(self, codeword, nsym):
+        '''
+        Syndromes of a codeword array of symbols, S_i is the codeword evaluated at alpha^(fcr+i), for i from 0 to nsym-1
+        '''
+        gf = self.gf
+        length = len(codeword)
+        syndromes = np.zeros(nsym, dtype=np.uint16)
+        roots = np.arange(self.fcr, self.fcr + nsym, dtype=np.int64)[:, None]
+        # positions in chunks to bound the memory of the matrix of powers
+        chunk = max(1, (1 << 22) // max(nsym, 1))
+        for start in range(0, length, chunk):
+            symbols = codeword[start:start + chunk]
+            degrees = np.arange(length - 1 - start, length - 1 - start - len(symbols), -1, dtype=np.int64)[None, :]
+            terms = gf.exp[np.mod(roots * degrees, gf.field_charac) + gf.log[symbols][None, :]]
+            syndromes ^= np.bitwise_xor.reduce(terms, axis=1)
+        return syndromes
+
+    def check(self, message, ecc):
+        '''True if the message of 2k bytes and its ecc form a valid codeword'''
+        codeword = np.frombuffer(bytes(message) + bytes(ecc), dtype='>u2')
+        return not self.syndromes(codeword, len(ecc) // 2).any()
+
+    def decode(self, message, ecc, erase_pos=None, only_erasures=False):
+        '''
+        Correct the errors and erasures of a message of 2k bytes and its ecc, and return them repaired. Raises
+        ReedSolomonError when there are too many errors.
+        Parameters
+        ----------
+        message bytes
+        ecc bytes
+        erase_pos list (optional)
+            Positions of the erased symbols in the codeword
+        only_erasures bool (optional)
+            Only correct the erasures, which is faster and corrects twice as many symbols
+        '''
+        gf = self.gf
+        codeword = np.frombuffer(bytes(message) + bytes(ecc), dtype='>u2').astype(np.uint16)
+        length = len(codeword)
+        nsym = len(ecc) // 2
+        erase_pos = sorted(set(erase_pos or []))
+        if len(erase_pos) > nsym:
+            raise ReedSolomonError("Too many erasures to correct")
+        syndromes = self.syndromes(codeword, nsym)
+        if not syndromes.any():
+            return message, ecc
+        # locator of the erasures, the product of the (1 + X x) with X = alpha^(degree of the position)
+        erasures = np.array(erase_pos, dtype=np.int64)
+        locator = np.array([1], dtype=np.uint16)
+        for x in gf.pow_alpha(length - 1 - erasures):
+            locator = gf.poly_mul(locator, np.array([1, x], dtype=np.uint16))
+        if not only_erasures:
+            locator = self.berlekamp_massey(syndromes, locator, len(erase_pos))
+        errata = self.chien_search(locator, length)
+        if len(errata) != len(locator) - 1:
+            raise ReedSolomonError("Could not locate the errors")
+        codeword[errata] ^= self.forney(syndromes, locator, length - 1 - errata)
+        if self.syndromes(codeword, nsym).any():
+            raise ReedSolomonError("Could not correct the message")
+        repaired = codeword.astype('>u2').tobytes()
+        return repaired[:len(message)], repaired[len(message):]
+
+    def berlekamp_massey(self, syndromes, erasures_locator, erasures_count):
+        '''
+        Locator of the errata (errors and erasures), starting from the locator of the erasures. Polynomials are ordered
+        from the lowest degree.
+        '''
+        gf = self.gf
+        nsym = len(syndromes)
+        locator = erasures_locator.copy()
+        previous = erasures_locator.copy()
+        degree = erasures_count # length of the linear feedback shift register
+        for r in range(erasures_count, nsym):
+            # discrepancy between the syndrome r and the one predicted by the current locator
+            terms = min(len(locator), r + 1)
+            delta = int(np.bitwise_xor.reduce(gf.mul(locator[:terms], syndromes[r::-1][:terms])))
+            previous = np.concatenate(([0], previous)).astype(np.uint16)
+            if delta:
+                updated = np.zeros(max(len(locator), len(previous)), dtype=np.uint16)
+                updated[:len(locator)] = locator
+                updated[:len(previous)] ^= gf.mul(previous, np.uint16(delta))
+                if 2 * degree <= r + erasures_count:
+                    degree = r + 1 + erasures_count - degree
+                    previous = gf.mul(locator, gf.inverse(np.uint16(delta)))
+                locator = updated
+        locator = np.trim_zeros(locator, 'b')
+        if 2 * (len(locator) - 1) - erasures_count > nsym:
+            raise ReedSolomonError("Too many errors to correct")
+        return locator
+
+    def chien_search(self, locator, length):
+        '''Positions in the codeword of the roots of the locator, the inverses of alpha^(degree of the position)'''
+        gf = self.gf
+        positions = np.arange(length, dtype=np.int64)
+        values = np.zeros(length, dtype=np.uint16)
+        for t, coef in enumerate(locator):
+            if coef:
+                values ^= gf.exp[np.mod(-(length - 1 - positions) * t, gf.field_charac) + gf.log[coef]]
+        return positions[values == 0]
+
+    def forney(self, syndromes, locator, degrees):
+        '''
+        Magnitudes of the errata at the degrees (positions of the symbols counted from the end of the codeword), from
+        the evaluator S(x)L(x) mod x^nsym and the formal derivative of the locator L(x)
+        '''
+        gf = self.gf
+        evaluator = gf.poly_mul(syndromes, locator)[:len(syndromes)]
+        derivative = locator[1::2] # odd terms, the even ones vanish in characteristic 2, as a polynomial of x^2
+        inverses = gf.pow_alpha(-degrees)
+        numerators = self._eval(evaluator, inverses)
+        denominators = self._eval(derivative, gf.mul(inverses, inverses))
+        if not denominators.all():
+            raise ReedSolomonError("Could not find the magnitudes of the errors")
+        # X^(1-fcr) * evaluator(X^-1) / derivative(X^-1)
+        logs = (gf.log[numerators].astype(np.int64) - gf.log[denominators] + (1 - self.fcr) * degrees)
+        magnitudes = gf.exp[np.mod(logs, gf.field_charac)]
+        magnitudes[numerators == 0] = 0
+        return magnitudes
+
+    def _eval(self, p, x):
+        '''Evaluate the polynomial p, lowest degree first, at each non zero element of the array x'''
+        gf = self.gf
+        logs = gf.log[x].astype(np.int64)
+        result = np.zeros(len(x), dtype=np.uint16)
+        for t, coef in enumerate(p):
+            if coef:
+                result ^= gf.exp[np.mod(logs * t, gf.field_charac) + gf.log[coef]]
+        return result
+
+@lru_cache(maxsize=None)
+def gf16_tables(prim, generator):
+    '''Shared tables of the field, they take a fraction of a second to build'''
+    return GF16(prim=prim, generator=generator)
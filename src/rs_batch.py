@@ -0,0 +1,359 @@
+'''
+Vectorized Reed-Solomon codec over GF(2^8) built on NumPy. Instead of encoding one codeword per Python call, it works
+on batches of thousands of messages that share the same message size k.
+
+The field (prime polynomial and generator) and the code (first consecutive root) are parametrized exactly like
+creedsolo, so codewords produced here are bit-compatible with reedsolo/creedsolo and with ECCMan algorithms 1 to 3.
+
+References
+----------
+- https://github.com/tomerfiliba-org/reedsolomon/blob/master/src/creedsolo/creedsolo.pyx
+- https://en.wikiversity.org/wiki/Reed%E2%80%93Solomon_codes_for_coders
+'''
+from functools import lru_cache
+import threading
+import numpy as np
+
+def gf_mult_nolut(x, y, prim=0, field_charac_full=256):
+    '''
+    Multiplication in a Galois field without lookup tables (Russian peasant multiplication), only used to build the
+    tables. Same as reedsolo.gf_mult_noLUT with carryless=True.
+    '''
+    r = 0
+    while y:
+        if y & 1:
+            r ^= x
+        y >>= 1
+        x <<= 1
+        if prim > 0 and x & field_charac_full:
+            x ^= prim
+    return r
+
+def scratch_arrays(scratch, shapes):
+    '''
+    Arrays of the given shapes and dtypes, views of buffers of scratch (a threading.local) that only grow, so that a
+    codec encoding batch after batch allocates nothing. They are overwritten by the next call of the same thread.
+    '''
+    buffers = scratch.__dict__
+    arrays = []
+    for name, (shape, dtype) in shapes.items():
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if name not in buffers or len(buffers[name]) < size:
+            buffers[name] = np.empty(size, dtype=np.uint8)
+        arrays.append(buffers[name][:size].view(dtype).reshape(shape))
+    return arrays
+
+class GF(object):
+    '''
+    Log and anti-log tables of GF(2^c_exp), plus the full multiplication table, as NumPy arrays so that whole arrays of
+    field elements can be multiplied at once.
+    '''
+    def __init__(self, prim=0x11b, generator=3, c_exp=8):
+        self.prim = prim
+        self.generator = generator
+        self.c_exp = c_exp
+        self.field_charac = int(2**c_exp - 1)
+        self.exp = np.zeros(self.field_charac * 2, dtype=np.int32)
+        self.log = np.zeros(self.field_charac + 1, dtype=np.int32)
+        x = 1
+        for i in range(self.field_charac):
+            self.exp[i] = x
+            self.log[x] = i
+            x = gf_mult_nolut(x, generator, prim, self.field_charac + 1)
+        # doubled anti-log table, so that the sum of two logs never needs a modulo
+        self.exp[self.field_charac:] = self.exp[:self.field_charac]
+        # mul_table[x, y] = x * y, the zero row and column are handled by masking
+        logs = self.log[:, None] + self.log[None, :]
+        self.mul_table = self.exp[logs].astype(np.uint8)
+        self.mul_table[0, :] = 0
+        self.mul_table[:, 0] = 0
+        self.mul_flat = self.mul_table.ravel()
+
+    def mul(self, x, y):
+        return int(self.mul_table[x, y])
+
+    def mul_arrays(self, x, y):
+        '''Element-wise product of two uint8 arrays, broadcast like NumPy operators'''
+        return self.mul_flat[(np.asarray(x).astype(np.uint16) << 8) | y]
+
+    def pow(self, x, power):
+        return int(self.exp[(self.log[x] * power) % self.field_charac])
+
+    def inverse(self, x):
+        return int(self.exp[self.field_charac - self.log[x]])
+
+    def inverse_matrix(self, matrix):
+        '''Inverse of an invertible square matrix of uint8, by Gauss-Jordan elimination'''
+        size = len(matrix)
+        matrix = np.concatenate([np.asarray(matrix, dtype=np.uint8), np.eye(size, dtype=np.uint8)], axis=1)
+        for column in range(size):
+            pivot = column + int(np.flatnonzero(matrix[column:, column])[0])
+            matrix[[column, pivot]] = matrix[[pivot, column]]
+            matrix[column] = self.mul_table[self.inverse(int(matrix[column, column]))][matrix[column]]
+            factors = matrix[:, column].copy()
+            factors[column] = 0
+            matrix ^= self.mul_arrays(factors[:, None], matrix[column][None, :])
+        return matrix[:, size:]
+
+    def poly_mul(self, p, q):
+        '''Multiply two polynomials, coefficients are ordered from the highest degree'''
+        r = np.zeros(len(p) + len(q) - 1, dtype=np.uint8)
+        for j, coef in enumerate(q):
+            r[j:j + len(p)] ^= self.mul_table[coef][p]
+        return r
+
+    def generator_poly(self, nsym, fcr=0):
+        '''Same generator polynomial as reedsolo.rs_generator_poly'''
+        g = np.array([1], dtype=np.uint8)
+        for i in range(nsym):
+            g = self.poly_mul(g, np.array([1, self.pow(self.generator, i + fcr)], dtype=np.uint8))
+        return g
+
+class RSBatchCodec(object):
+    '''
+    Systematic Reed-Solomon encoder and decoder for batches of messages. Since encoding is linear, the ecc of a message
+    is the XOR of the ecc of each of its symbols at their position. For every message size k, a table holds the ecc
+    contribution of the 256 possible values at each of the k positions, so encoding a batch is k table gathers and XORs
+    over the whole batch. The tables are packed into 64 bits words to XOR 8 ecc symbols at a time. The syndromes of the
+    decoder are computed the same way, the rest of the decoding works on one row per codeword.
+    '''
+    def __init__(self, n=255, prim=0x11b, generator=3, fcr=1, cache_size=8, erasure_cache_size=256):
+        self.gf = GF(prim=prim, generator=generator)
+        self.n = n
+        self.fcr = fcr
+        # tables are about 4 MB per message size, keep only the most recent ones (the rate varies slowly in a file)
+        self.parity_tables = lru_cache(maxsize=cache_size)(self._parity_tables)
+        self.syndrome_tables = lru_cache(maxsize=cache_size)(self._syndrome_tables)
+        # the unreadable sectors of a disc repeat the same erasure patterns over many codewords
+        self.erasure_solvers = lru_cache(maxsize=erasure_cache_size)(self._erasure_solver)
+        # work arrays of encode_batch, reused by the next batches of the same thread
+        self.scratch = threading.local()
+
+    def _parity_tables(self, k):
+        '''
+        Returns an array of shape (k, 256, words) of uint64, where [i, v] is the ecc of a message with the value v at
+        position i and zeros elsewhere, padded to a multiple of 8 bytes.
+        '''
+        nsym = self.n - k
+        g = self.gf.generator_poly(nsym, self.fcr)
+        words = -(-nsym // 8)
+        # remainders of x^d mod g(x) for d = nsym to n-1, highest degree first like the ecc bytes of reedsolo
+        remainders = np.zeros((k, nsym), dtype=np.uint8)
+        r = g[1:].copy() # x^nsym mod g(x), since g(x) is monic
+        for d in range(k):
+            remainders[k - 1 - d] = r
+            top = r[0]
+            r = np.append(r[1:], np.uint8(0))
+            if top:
+                r ^= self.gf.mul_table[top][g[1:]]
+        tables = np.zeros((k, 256, words * 8), dtype=np.uint8)
+        # tables[i, v, j] = v * remainders[i, j]
+        tables[:, :, :nsym] = self.gf.mul_table[np.arange(256)[None, :, None], remainders[:, None, :]]
+        return tables.view(np.uint64)
+
+    def encode_batch(self, messages, k=None, out=None):
+        '''
+        Encode a batch of messages of shape (count, k) and return the ecc symbols as an array of shape (count, n-k).
+        Shorter messages must already be left padded with null bytes (shortened code), like ECCMan.pad does.
+        The ecc is written into out when given, any uint8 array of shape (count, n-k), like the ecc columns of the
+        records of a database.
+        '''
+        messages = np.asarray(messages, dtype=np.uint8)
+        if k is None:
+            k = messages.shape[1]
+        nsym = self.n - k
+        tables = self.parity_tables(k)
+        count = messages.shape[0]
+        columns, acc, tmp = scratch_arrays(self.scratch, {"columns": ((k, count), np.uint8),
+                                                 "acc": ((count, tables.shape[2]), np.uint64),
+                                                 "tmp": ((count, tables.shape[2]), np.uint64)})
+        # one contiguous column per message position
+        np.copyto(columns, messages.T)
+        acc.fill(0)
+        for i in range(k):
+            np.take(tables[i], columns[i], axis=0, out=tmp)
+            np.bitwise_xor(acc, tmp, out=acc)
+        if out is None:
+            out = np.empty((count, nsym), dtype=np.uint8)
+        np.copyto(out, acc.view(np.uint8)[:, :nsym])
+        return out
+
+    def _syndrome_tables(self, nsym):
+        '''
+        Returns an array of shape (n, 256, words) of uint64, where [i, v] are the nsym syndromes of a codeword with the
+        value v at position i and zeros elsewhere, padded to a multiple of 8 bytes.
+        '''
+        gf = self.gf
+        words = -(-nsym // 8)
+        # the syndrome j is the codeword evaluated at generator^(j+fcr), position i is the coefficient of degree n-1-i
+        powers = self.syndrome_powers(np.arange(self.n), nsym)
+        tables = np.zeros((self.n, 256, words * 8), dtype=np.uint8)
+        tables[:, :, :nsym] = gf.mul_table[np.arange(256)[None, :, None], powers[:, None, :]]
+        return tables.view(np.uint64)
+
+    def syndrome_powers(self, positions, nsym):
+        '''
+        Array of shape (len(positions), nsym), the row of a position is what a 1 there adds to the nsym syndromes
+        '''
+        degrees = (self.n - 1 - np.asarray(positions))[:, None] * (np.arange(nsym)[None, :] + self.fcr)
+        return self.gf.exp[degrees % self.gf.field_charac].astype(np.uint8)
+
+    def syndromes(self, codewords, nsym):
+        '''
+        Syndromes of a batch of codewords of shape (count, n), as an array of shape (count, nsym), like
+        reedsolo.rs_calc_syndromes without its leading 0. They are all null for the codewords without errors.
+        '''
+        codewords = np.asarray(codewords, dtype=np.uint8)
+        tables = self.syndrome_tables(nsym)
+        count = codewords.shape[0]
+        if count <= 8:
+            # a few codewords, like single blocks, are faster as one product with the syndromes of the value 1
+            powers = tables.view(np.uint8)[:, 1, :nsym]
+            return np.bitwise_xor.reduce(self.gf.mul_arrays(codewords[:, :, None], powers[None, :, :]), axis=1)
+        columns, acc, tmp = scratch_arrays(self.scratch, {"columns": ((self.n, count), np.uint8),
+                                                 "acc": ((count, tables.shape[2]), np.uint64),
+                                                 "tmp": ((count, tables.shape[2]), np.uint64)})
+        np.copyto(columns, codewords.T)
+        acc.fill(0)
+        for i in range(self.n):
+            np.take(tables[i], columns[i], axis=0, out=tmp)
+            np.bitwise_xor(acc, tmp, out=acc)
+        return acc.view(np.uint8)[:, :nsym].copy()
+
+    def decode_batch(self, codewords, nsym, erase_pos=None, only_erasures=False):
+        '''
+        Decode a batch of codewords of shape (count, n) with nsym ecc symbols each, like reedsolo.rs_correct_msg_nofsynd
+        on every codeword. The syndromes, Berlekamp-Massey, the Chien search and Forney are computed for the whole batch
+        at once, one row per codeword. A codeword is repaired when there is a codeword within the errors and erasures
+        that the code corrects, which is then the only one and thus the same as the one of reedsolo, otherwise reedsolo
+        raises and the codeword is left as it was.
+        Parameters
+        ----------
+        codewords numpy.ndarray
+            uint8 array of shape (count, n)
+        nsym int
+            Ecc symbols at the end of each codeword
+        erase_pos list (optional)
+            Positions erased in every codeword, like the lost sectors of a group of the sector layout
+        only_erasures bool (optional)
+            Only correct the erasures
+        Returns
+        -------
+        list
+            The repaired codewords in a new array, and a bool array of the codewords that could be decoded
+        '''
+        gf = self.gf
+        q = gf.field_charac
+        mul = gf.mul_arrays
+        codewords = np.array(codewords, dtype=np.uint8)
+        count = len(codewords)
+        erase_pos = list(erase_pos or [])
+        f = len(erase_pos)
+        if f > nsym: # too many erasures
+            return codewords, np.zeros(count, dtype=bool)
+        if only_erasures and f:
+            return self.decode_erasures(codewords, nsym, erase_pos)
+        # erasures are null bytes for the syndromes, like reedsolo
+        received = codewords.copy()
+        received[:, erase_pos] = 0
+        synd = self.syndromes(received, nsym)
+        ok = ~synd.any(axis=1)
+        codewords[ok] = received[ok]
+        rows = np.flatnonzero(~ok)
+        if not len(rows):
+            return codewords, ok
+        synd = synd[rows]
+        # erasure locator, lowest degree first, the coefficient of degree n-1-i locates the position i
+        gamma = np.array([1], dtype=np.uint8)
+        for pos in erase_pos:
+            gamma = gf.poly_mul(gamma, np.array([1, gf.exp[(self.n - 1 - pos) % q]], dtype=np.uint8))
+        # Berlekamp-Massey started from the erasure locator, lam is the errata locator and old its last shifted copy
+        size = nsym + 1
+        lam = np.zeros((len(rows), size), dtype=np.uint8)
+        lam[:, :f + 1] = gamma
+        if not only_erasures:
+            old = lam.copy()
+            length = np.full(len(rows), f)
+            for K in range(f, nsym):
+                delta = np.bitwise_xor.reduce(mul(lam[:, :K + 1], synd[:, K::-1]), axis=1)
+                # the locators have at most K+1 coefficients at this step
+                top = min(K + 2, size)
+                old[:, 1:top] = old[:, :top - 1].copy()
+                old[:, 0] = 0
+                grow = (delta != 0) & (2 * length <= K + f)
+                delta_inv = gf.exp[(q - gf.log[delta]) % q].astype(np.uint8)
+                scaled_lam = mul(lam[grow, :top], delta_inv[grow, None])
+                lam[:, :top] ^= mul(old[:, :top], delta[:, None])
+                old[grow, :top] = scaled_lam
+                length = np.where(grow, K + 1 + f - length, length)
+        degree = size - 1 - np.argmax(lam[:, ::-1] != 0, axis=1)
+        decodable = (degree - f) * 2 + f <= nsym
+        # Chien search, the root generator^-d locates an error at the position n-1-d
+        d = np.arange(self.n)
+        values = np.zeros((len(rows), self.n), dtype=np.uint8)
+        for j in range(int(degree.max()) + 1):
+            values ^= mul(lam[:, j:j + 1], gf.exp[(-d * j) % q].astype(np.uint8)[None, :])
+        roots = values == 0
+        decodable &= roots.sum(axis=1) == degree
+        # Forney, with the errata evaluator omega = synd * lam mod x^nsym
+        omega = np.zeros((len(rows), nsym), dtype=np.uint8)
+        for j in range(int(degree.max()) + 1):
+            omega[:, j:] ^= mul(lam[:, j:j + 1], synd[:, :nsym - j])
+        root_rows, root_degrees = np.nonzero(roots & decodable[:, None])
+        omega_values = np.zeros(len(root_rows), dtype=np.uint8)
+        for i in range(nsym):
+            omega_values ^= mul(omega[root_rows, i], gf.exp[(-root_degrees * i) % q].astype(np.uint8))
+        # formal derivative of the locator, only its odd terms remain in GF(2^8)
+        derivative_values = np.zeros(len(root_rows), dtype=np.uint8)
+        for j in range(1, int(degree.max()) + 1, 2):
+            derivative_values ^= mul(lam[root_rows, j], gf.exp[(-root_degrees * (j - 1)) % q].astype(np.uint8))
+        decodable[root_rows[derivative_values == 0]] = False
+        logs = (1 - self.fcr) * root_degrees + gf.log[omega_values] - gf.log[derivative_values]
+        magnitudes = np.where((omega_values != 0) & (derivative_values != 0), gf.exp[logs % q], 0).astype(np.uint8)
+        repaired = received[rows]
+        repaired[root_rows, self.n - 1 - root_degrees] ^= magnitudes
+        # the repaired codewords must have null syndromes
+        decodable &= ~self.syndromes(repaired, nsym).any(axis=1)
+        codewords[rows[decodable]] = repaired[decodable]
+        ok[rows[decodable]] = True
+        return codewords, ok
+
+    def _erasure_solver(self, erase_pos):
+        '''
+        Inverse of the Vandermonde matrix of the erased positions in the first len(erase_pos) syndromes, the values of
+        the erasures are this matrix times those syndromes. It only depends on the positions, not on the message size.
+        '''
+        return self.gf.inverse_matrix(self.syndrome_powers(erase_pos, len(erase_pos)).T)
+
+    def decode_erasures(self, codewords, nsym, erase_pos):
+        '''
+        Decode a batch of codewords of shape (count, n) whose errors are all at the positions of erase_pos, like
+        reedsolo.rs_correct_msg_nofsynd with only_erasures. The erased values are solved directly from the syndromes
+        with the inverse matrix of the erasure pattern, memoized in erasure_solvers, then the codewords whose other
+        syndromes are not null after the correction are left as they were, since there were errors elsewhere.
+        Returns
+        -------
+        list
+            The repaired codewords in a new array, and a bool array of the codewords that could be decoded
+        '''
+        mul = self.gf.mul_arrays
+        codewords = np.array(codewords, dtype=np.uint8)
+        erase_pos = list(erase_pos)
+        f = len(erase_pos)
+        if f > nsym: # too many erasures
+            return codewords, np.zeros(len(codewords), dtype=bool)
+        received = codewords.copy()
+        received[:, erase_pos] = 0
+        synd = self.syndromes(received, nsym)
+        solver = self.erasure_solvers(tuple(erase_pos))
+        values = np.zeros((len(codewords), f), dtype=np.uint8)
+        for j in range(f):
+            values ^= mul(synd[:, j:j + 1], solver[:, j][None, :])
+        received[:, erase_pos] = values
+        # the syndromes of the repaired codewords, without computing them again
+        powers = self.syndrome_powers(erase_pos, nsym)
+        for i in range(f):
+            synd ^= mul(values[:, i:i + 1], powers[i][None, :])
+        ok = ~synd.any(axis=1)
+        codewords[ok] = received[ok]
+        return codewords, ok
@@ -0,0 +1,195 @@
+'''
+Verify-only scrub of a disc or of a folder: every file is checked against the ECC databases of its ECC/ directory by
+repair.correct_errors without a repair directory, so that nothing is written. The databases are checked at the same
+time by a pool of threads (config.scrub_concurrent_files) whose reads share a budget of config.scrub_io_budget bytes per
+second, so that the concurrent seeks don't thrash a slow optical drive. The result is a health report in JSON: the bad
+blocks of every file, whether they can all be corrected, and the throughput.
+'''
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter
+from datetime import datetime
+import threading
+import json
+import time
+import os
+import repair
+import config
+
+ecc_dir = "ECC" # directory of the ECC databases on a disc, see iso.IsoWorker.setup_ecc_files
+database_magic = b"**PYSTRUCTADAPTECCv" # start of the header of an ECC database, see ecc.database_header
+# statuses of the files in the report that are not damaged, see repair.correct_errors
+correctable_status = ("healthy", "correctable", "unprotected")
+budget_chunk = 1024 ** 2 # bytes read by a database before they are charged to the I/O budget and counted as checked
+
+class ScrubCanceled(Exception):
+    pass
+
+class IoBudget(object):
+    '''
+    Bytes per second shared by the threads reading the files, 0 is unlimited. A thread that read more than its share
+    waits before reading again.
+    '''
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.lock = threading.Lock()
+        self.available = time.monotonic() # when the budget allows to read again
+
+    def consume(self, size):
+        if not self.rate or size <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.available = max(self.available, now) + size / self.rate
+            wait = self.available - now
+        if wait > 0:
+            time.sleep(wait)
+
+def find_databases(root):
+    '''
+    Paths of the ECC databases in the ECC/ directory of root, the paths of their entries are relative to root. Their
+    index, checkpoints, recovery volumes and other files are left out.
+    '''
+    databases_dir = os.path.join(root, ecc_dir)
+    if not os.path.isdir(databases_dir):
+        return []
+    databases = []
+    for name in sorted(os.listdir(databases_dir)):
+        path = os.path.join(databases_dir, name)
+        if not name.endswith(".txt") or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as file:
+            if file.read(len(database_magic)) == database_magic:
+                databases.append(path)
+    return databases
+
+def disc_files(root):
+    '''
+    Sizes of the files under root by their path relative to it with / separators, like the entries of the databases,
+    except for the ECC/ directory
+    '''
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        if dirpath == root and ecc_dir in dirnames:
+            dirnames.remove(ecc_dir)
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = os.path.getsize(path)
+    return files
+
+def scrub_disc(root, report_path=None, concurrent_files=None, io_budget=None, fast_check=False,
+               progress_function=lambda x,y,z: False):
+    '''
+    Check every block of the files of a disc or of a folder with their ECC databases, without writing anything next
+    to them. The databases are checked concurrently, the files of a database one after the other.
+
+    Parameters
+    ----------
+    root str
+        The path of the mounted disc or of the folder, with its ECC databases in ECC/
+    report_path str (optional)
+        The path of the JSON file to write the report to
+    concurrent_files int (optional)
+        Databases checked at the same time, defaults to config.scrub_concurrent_files
+    io_budget int (optional)
+        Bytes per second read from the files by all the databases, defaults to config.scrub_io_budget. 0 is unlimited.
+    fast_check bool
+        Only check the hash of the blocks, else the blocks with a matching hash are also checked by their ecc
+    progress_function function
+        Called with the bytes checked, the total bytes of the files and the elapsed seconds. The scrub stops when it
+        returns True.
+
+    Returns
+    -------
+    The report as a dictionary, or False if progress_function asked for a shutdown. "files" are the results of
+    repair.correct_errors by path, with their "database", and the files without a database are "unprotected".
+    '''
+    start = time.time()
+    concurrent_files = concurrent_files or config.scrub_concurrent_files
+    budget = IoBudget(config.scrub_io_budget if io_budget is None else io_budget)
+    files = disc_files(root)
+    total = sum(files.values())
+    lock = threading.Lock()
+    checked = 0 # bytes checked by all the databases
+    last_update = 0
+    canceled = threading.Event()
+
+    def count_checked(size):
+        '''Add bytes read by a database, and update the progress at most once per second'''
+        nonlocal checked, last_update
+        with lock:
+            checked += size
+            elapsed = int(time.time() - start)
+            if elapsed != last_update:
+                last_update = elapsed
+                if progress_function(checked, total, elapsed):
+                    canceled.set()
+
+    def scrub_database(database):
+        '''Results of the files of a database, with its own elapsed time'''
+        database_start = time.time()
+        position = 0
+        pending = 0 # bytes read since they were last charged to the budget
+        def callback(curpos, filesize, message):
+            # called for every block, the budget and the progress are only updated by chunks of blocks
+            nonlocal position, pending
+            if canceled.is_set():
+                raise ScrubCanceled()
+            # the blocks are reported in order, the position starts over with the next file of the database
+            pending += curpos - position if curpos >= position else curpos
+            position = curpos
+            if pending >= budget_chunk:
+                budget.consume(pending)
+                count_checked(pending)
+                pending = 0
+        results = []
+        repair.correct_errors(root, None, database, fast_check=fast_check, callback=callback, report=results)
+        budget.consume(pending)
+        count_checked(pending)
+        return results, time.time() - database_start
+
+    report = {"root": os.path.abspath(root), "date": datetime.now().isoformat(timespec="seconds"), "databases": [],
+              "files": {}}
+    with ThreadPoolExecutor(max_workers=concurrent_files) as executor:
+        futures = {executor.submit(scrub_database, database): database for database in find_databases(root)}
+        for future in as_completed(futures):
+            database = os.path.relpath(futures[future], root).replace(os.sep, "/")
+            try:
+                results, elapsed = future.result()
+            except ScrubCanceled:
+                continue
+            except Exception as e:
+                # a database that can't be read doesn't stop the others
+                report["databases"].append({"path": database, "error": f"{type(e).__name__}: {e}"})
+                continue
+            size = sum(result.get("size", 0) for result in results if "blocks" in result)
+            report["databases"].append({"path": database, "files": len(results), "bytes": size,
+                                        "elapsed": round(elapsed, 3),
+                                        "throughput": round(size / elapsed) if elapsed else None})
+            for result in results:
+                path = result.pop("path")
+                report["files"][path] = dict(result, database=database)
+    if canceled.is_set():
+        return False
+    for path, size in files.items():
+        if path not in report["files"]:
+            report["files"][path] = {"status": "unprotected", "size": size}
+    elapsed = time.time() - start
+    checked_bytes = sum(result["size"] for result in report["files"].values() if "blocks" in result)
+    statuses = Counter(result["status"] for result in report["files"].values())
+    report["databases"].sort(key=lambda database: database["path"])
+    report["files"] = dict(sorted(report["files"].items()))
+    report.update({
+        "elapsed": round(elapsed, 3),
+        "bytes_checked": checked_bytes,
+        "throughput": round(checked_bytes / elapsed) if elapsed else None, # bytes per second
+        "statuses": dict(statuses),
+        "bad_blocks": sum(result.get("bad_blocks", 0) for result in report["files"].values()),
+        # every file can be read back, after a repair of those that are correctable
+        "correctable": all(database.get("error") is None for database in report["databases"]) and
+                       all(status in correctable_status for status in statuses)
+    })
+    progress_function(total, total, int(elapsed))
+    if report_path:
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
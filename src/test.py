@@ -35,6 +35,33 @@ class TestCryptoDisco(unittest.TestCase):
         self.base_dir = os.path.abspath(os.path.dirname(__file__))
         self.tests_dir = os.path.join(self.base_dir, 'tests')
 
+    def copy_with_ecc(self, directory, name=None, ecc_dir=None, test_file='test.pdf'):
+        """
+        Copy a test file into directory, as name, and generate its ECC database into ecc_dir, directory by default.
+        Returns the path of the copy and of its database.
+        """
+        import ecc
+        import shutil
+        file_path = os.path.join(directory, name or test_file)
+        shutil.copy2(os.path.join(self.tests_dir, test_file), file_path)
+        ecc_dir = ecc_dir or directory
+        self.assertTrue(ecc.generate_ecc(file_path, ecc_dir))
+        return file_path, os.path.join(ecc_dir, os.path.basename(file_path) + '.txt')
+
+    def archive_tree(self, directory, test_file='test.pdf'):
+        """
+        A tree of 3 directories with a copy of a test file each, in directory/tree, and its ECC database archive.txt
+        generated in directory. Returns the path of the tree and of the database.
+        """
+        import ecc
+        import shutil
+        tree_dir = os.path.join(directory, 'tree')
+        for i in range(3):
+            os.makedirs(os.path.join(tree_dir, f'dir_{i}'))
+            shutil.copy2(os.path.join(self.tests_dir, test_file), os.path.join(tree_dir, f'dir_{i}'))
+        self.assertTrue(ecc.generate_archive_ecc(tree_dir, directory, 'archive'))
+        return tree_dir, os.path.join(directory, 'archive.txt')
+
     def test_basic_imports(self):
         """
         - Simple import check to ensure modules exist and don't create syntax errors
@@ -46,7 +73,9 @@ class TestCryptoDisco(unittest.TestCase):
             import ecc
             import compute_ecc
             import repair
+            import rs_batch
             import compute_repair
+            import scrub
             import gui
             import iso
             import utils
@@ -199,6 +228,868 @@ class TestCryptoDisco(unittest.TestCase):
             print("Wizard test passed successfully.")
             wizard.close()
 
+    def test_ecc_batch_encoder(self):
+        """
+        Tests that the NumPy batch encoder produces the same ecc as reedsolo for every message size
+        """
+        import numpy as np
+        import ecc
+        rng = np.random.default_rng(0)
+        manager = ecc.ECCMan(255, 1, algo=5)
+        for k in [1, 2, 100, 170, 182, 213, 254]:
+            messages = rng.integers(0, 256, (20, k), dtype=np.uint8)
+            eccs = manager.encode_batch(messages, k=k)
+            self.assertEqual(eccs.shape, (20, 255 - k))
+            for message, ecc_batch in zip(messages, eccs):
+                self.assertEqual(ecc_batch.tobytes(), manager.encode(message.tobytes(), k=k))
+                self.assertTrue(manager.check(bytearray(message.tobytes()), bytearray(ecc_batch.tobytes()), k=k))
+
+    def test_ecc_batch_decoder(self):
+        """
+        Tests that the NumPy batch decoder repairs the same blocks as reedsolo, with errors, erasures and beyond capacity
+        """
+        import numpy as np
+        import ecc
+        from creedsolo import ReedSolomonError
+        rng = np.random.default_rng(0)
+        manager = ecc.ECCMan(255, 1, algo=5)
+        reference = ecc.ECCMan(255, 1, algo=3)
+        for k, erase_pos in [(213, None), (170, [0, 5, 100]), (229, list(range(0, 200, 10)))]:
+            messages = rng.integers(0, 256, (30, k), dtype=np.uint8)
+            eccs = manager.encode_batch(messages, k=k)
+            # from no errors up to twice what the ecc corrects
+            for i, errors in enumerate(np.linspace(0, 255 - k, len(messages)).astype(int)):
+                positions = rng.choice(255, errors, replace=False)
+                for pos in positions:
+                    block = messages if pos < k else eccs
+                    block[i, pos % k if pos < k else pos - k] ^= int(rng.integers(1, 256))
+            repaired_messages, repaired_eccs, decoded = manager.decode_batch(messages, eccs, k=k, erase_pos=erase_pos)
+            for i in range(len(messages)):
+                try:
+                    expected = reference.decode(messages[i].tobytes(), eccs[i].tobytes(), k=k,
+                                                erase_pos=erase_pos)
+                except ReedSolomonError:
+                    expected = None
+                self.assertEqual(decoded[i], expected is not None)
+                if expected is not None:
+                    self.assertEqual((repaired_messages[i].tobytes(), repaired_eccs[i].tobytes()), expected)
+            self.assertTrue(decoded.any() and not decoded.all())
+
+    def test_ecc_erasures_solver(self):
+        """
+        Tests that erasures at known positions are solved like reedsolo, with the inverse matrix of a repeated pattern
+        reused, and that an error elsewhere is not miscorrected
+        """
+        import numpy as np
+        import ecc
+        from creedsolo import ReedSolomonError
+        rng = np.random.default_rng(0)
+        k, erase_pos = 200, [3, 50, 51, 120, 199, 210, 254]
+        manager = ecc.ECCMan(255, k, algo=5)
+        reference = ecc.ECCMan(255, k, algo=3)
+        messages = rng.integers(0, 256, (8, k), dtype=np.uint8)
+        codewords = np.hstack((messages, manager.encode_batch(messages)))
+        damaged = codewords.copy()
+        damaged[:, erase_pos] = rng.integers(0, 256, (8, len(erase_pos)), dtype=np.uint8)
+        damaged[-1, 100] ^= 1
+        repaired, _, decoded = manager.decode_batch(damaged[:, :k], damaged[:, k:], erase_pos=erase_pos,
+                                                    only_erasures=True)
+        self.assertEqual(decoded.tolist(), [True] * 7 + [False])
+        self.assertTrue((repaired[:7] == messages[:7]).all())
+        self.assertEqual(manager.batch_codec.erasure_solvers.cache_info().currsize, 1)
+        for codeword in damaged:
+            try:
+                expected = reference.decode(codeword[:k].tobytes(), codeword[k:].tobytes(), erase_pos=erase_pos,
+                                            only_erasures=True)
+            except ReedSolomonError:
+                expected = None
+            try:
+                result = manager.decode(codeword[:k].tobytes(), codeword[k:].tobytes(), erase_pos=erase_pos,
+                                        only_erasures=True)
+            except ReedSolomonError:
+                result = None
+            self.assertEqual(result, expected)
+
+    def test_ecc_check_batch(self):
+        """
+        Tests that the batch check finds the same damaged blocks as the check of each block, for small and large batches
+        """
+        import numpy as np
+        import ecc
+        rng = np.random.default_rng(0)
+        for algo, k in [(5, 213), ("auto", 170), (6, 1800)]:
+            manager = ecc.new_ecc_manager(2046 if algo == 6 else 255, k, algo)
+            for blocks in [10, 300]:
+                messages = rng.integers(0, 256, (blocks, k), dtype=np.uint8)
+                eccs = manager.encode_batch(messages)
+                damaged = rng.random(blocks) < 0.3
+                messages[damaged, rng.integers(0, k, damaged.sum())] ^= 1
+                valid = manager.check_batch(messages, eccs)
+                self.assertEqual(valid.tolist(), (~damaged).tolist())
+                self.assertEqual(valid.tolist(), [bool(manager.check(bytearray(m.tobytes()), bytearray(e.tobytes())))
+                                                  for m, e in zip(messages, eccs)])
+
+    def test_ecc_autotune(self):
+        """
+        Tests that the autotuned manager picks compatible algorithms and gives the codewords of algorithm 3
+        """
+        import ecc
+        choice = ecc.autotune_ecc_algo()
+        self.assertEqual(set(choice), set(ecc.AutoECCMan.operations))
+        self.assertTrue(set(choice.values()) <= set(ecc.AutoECCMan.candidates))
+        manager = ecc.new_ecc_manager(255, 213, "auto")
+        reference = ecc.ECCMan(255, 213, algo=3)
+        message = os.urandom(213)
+        ecc_bytes = manager.encode(message)
+        self.assertEqual(ecc_bytes, reference.encode(message))
+        damaged = bytearray(message)
+        damaged[7] ^= 0xFF
+        self.assertEqual(manager.decode(bytes(damaged), ecc_bytes), (message, ecc_bytes))
+        self.assertEqual(manager.description(), reference.description())
+
+    def test_ecc_long_codewords(self):
+        """
+        Tests that the GF(2^16) codec repairs errors and erasures in long codewords and fails beyond its capacity
+        """
+        import random
+        import ecc
+        from creedsolo import ReedSolomonError
+        manager = ecc.ECCMan(2046, 2, algo=6)
+        message = os.urandom(1463) # odd, the message is padded to whole symbols
+        k = 1462 + 2
+        ecc_bytes = manager.encode(message, k=k)
+        self.assertEqual(len(ecc_bytes), 2046 - k)
+        self.assertTrue(manager.check(message, ecc_bytes, k=k))
+        damaged = bytearray(message)
+        # a burst over 200 bytes, and 40 erased symbols
+        for i in range(200, 400):
+            damaged[i] ^= 0x5A
+        erased = random.sample(range(500, len(message)), 40)
+        for i in erased:
+            damaged[i] = 0
+        repaired, _ = manager.decode(bytes(damaged), ecc_bytes, k=k, enable_erasures=True)
+        self.assertEqual(repaired, message)
+        for i in range(400, 1000):
+            damaged[i] ^= 0x5A
+        with self.assertRaises(ReedSolomonError):
+            manager.decode(bytes(damaged), ecc_bytes, k=k)
+
+    def test_recovery_slices(self, test_file='test.pdf'):
+        """
+        Tests that the recovery volumes rebuild a damaged area and a missing file of a disc, with a volume lost
+        """
+        import recovery
+        import tempfile
+        import shutil
+        with tempfile.TemporaryDirectory() as disc_dir, tempfile.TemporaryDirectory() as ecc_dir, \
+                tempfile.TemporaryDirectory() as output_dir:
+            shutil.copy2(os.path.join(self.tests_dir, test_file), disc_dir)
+            with open(os.path.join(disc_dir, 'small.bin'), 'wb') as f:
+                f.write(os.urandom(3001))
+            files = [os.path.join(disc_dir, name) for name in (test_file, 'small.bin')]
+            originals = {}
+            for file in files:
+                with open(file, 'rb') as f:
+                    originals[os.path.basename(file)] = f.read()
+            volumes = recovery.generate_recovery(files, ecc_dir, percent=40, workers=1)
+            os.remove(volumes[0])
+            # the index of a volume is read from its trailer, not from its name
+            renamed = [os.path.join(ecc_dir, f'renamed{n}.bin') for n in range(len(volumes) - 1)]
+            for volume, path in zip(reversed(volumes[1:]), renamed):
+                os.rename(volume, path)
+            with open(files[0], 'r+b') as f:
+                f.seek(len(originals[test_file]) // 3)
+                f.write(bytes(len(originals[test_file]) // 50))
+            os.remove(files[1])
+            self.assertTrue(recovery.repair_from_recovery(disc_dir, renamed, output_dir, workers=2))
+            for name, data in originals.items():
+                with open(os.path.join(output_dir, name), 'rb') as f:
+                    self.assertEqual(f.read(), data)
+            self.assertEqual(sorted(os.listdir(output_dir)), sorted(originals))
+            # the rebuild of a single stripe at a time gives the same files
+            with patch.object(recovery, 'rebuild_buffer_size', 1):
+                self.assertTrue(recovery.repair_from_recovery(disc_dir, renamed, output_dir, entries=['small.bin'],
+                                                              workers=1))
+            with open(os.path.join(output_dir, 'small.bin'), 'rb') as f:
+                self.assertEqual(f.read(), originals['small.bin'])
+
+    def test_repair_worker_recovery(self, test_file='test.pdf'):
+        """
+        Tests that the repair wizard rebuilds a file from the recovery volumes of its disc when its ECC can't repair it
+        """
+        import compute_repair
+        import recovery
+        import tempfile
+        with tempfile.TemporaryDirectory() as disc_dir, tempfile.TemporaryDirectory() as output_dir:
+            ecc_dir = os.path.join(disc_dir, 'ECC')
+            os.makedirs(ecc_dir)
+            damaged, ecc_file = self.copy_with_ecc(disc_dir, ecc_dir=ecc_dir, test_file=test_file)
+            with open(damaged, 'rb') as f:
+                original = f.read()
+            recovery.generate_recovery([damaged], ecc_dir, percent=30, workers=1)
+            # a damaged area far beyond what the blocks of the ECC can correct
+            with open(damaged, 'r+b') as f:
+                f.seek(len(original) // 4)
+                f.write(bytes(len(original) // 10))
+            progress = []
+            worker = compute_repair.RepairWorker(None, None, {
+                'damaged': damaged, 'repair_dir': output_dir, 'ecc_file': ecc_file, 'only_erasures': False,
+                'enable_erasures': False, 'erasure_symbol': 0, 'fast_check': True,
+                'callback': lambda x, y, z: progress.append((x, y, z))})
+            worker.run()
+            self.assertEqual(progress[-1], (100, 100, "Rebuilt from the recovery volumes"))
+            with open(os.path.join(output_dir, test_file), 'rb') as f:
+                self.assertEqual(f.read(), original)
+
+    def test_ecc_encode_into(self):
+        """
+        Tests that the records encoded into a reused buffer are the same as the records of new buffers
+        """
+        import ecc
+        import numpy as np
+        data = os.urandom(300000)
+        plan = ecc.get_block_plan(len(data), ecc.track_block_size, ecc.parameters["header_size"],
+                                  ecc.parameters["resilience_rates"], ecc.hasher, symbol_size=ecc.symbol_size)
+        ranges = list(plan.ranges(50000))
+        out = bytearray(max(plan.records_size(start, end) for start, end in ranges) + 10)
+        for start, end in ranges:
+            records = ecc.encode_ecc_hash_blocks(data[start:end], start, end, plan, ecc.hasher)
+            self.assertEqual(ecc.encode_ecc_hash_blocks(data[start:end], start, end, plan, ecc.hasher, out=out),
+                             records)
+        # the ecc written into the columns of records, after the hash of each block
+        manager = ecc.ECCMan(255, 1, algo=5)
+        messages = np.frombuffer(data[:160 * 64], dtype=np.uint8).reshape(64, 160)
+        records = np.zeros((64, 8 + 95), dtype=np.uint8)
+        manager.encode_batch(messages, k=160, out=records[:, 8:])
+        self.assertEqual(records[:, 8:].tobytes(), ecc.ECCMan(255, 1, algo=3).encode_batch(messages, k=160).tobytes())
+
+    def test_ecc_range_buffers(self):
+        """
+        Tests that the ranges read into the reused input buffer and encoded into one output buffer give the records of
+        every block encoded one by one
+        """
+        import ecc
+        import random
+        import tempfile
+        data = random.Random(1).randbytes(300001)
+        plan = ecc.get_block_plan(len(data), ecc.track_block_size, ecc.parameters["header_size"],
+                                  ecc.parameters["resilience_rates"], ecc.hasher, symbol_size=ecc.symbol_size)
+        manager = ecc.get_track_manager(plan.max_block_size, plan.symbol_size)
+        expected = bytearray(plan.ecc_size)
+        for offset, run, ecc_offset in plan.blocks():
+            message = data[offset:offset + int(plan.message_sizes[run])]
+            record = ecc.hasher.hash(message) + manager.encode(message, k=int(plan.message_sizes[run]))
+            expected[ecc_offset:ecc_offset + len(record)] = record
+        args = (len(data), ecc.track_block_size, ecc.parameters["header_size"], ecc.parameters["resilience_rates"],
+                ecc.hasher.algo, ecc.symbol_size)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, 'random.bin')
+            with open(src_path, 'wb') as f:
+                f.write(data)
+            ranges = list(plan.ranges(50000))
+            out = bytearray(max(plan.records_size(start, end) for start, end in ranges))
+            # the short last range, then the longer ones, read into the buffer of the previous ranges
+            for start, end in ranges[::-1]:
+                records = ecc.compute_ecc_hash_range(src_path, start, end, *args, out=out)
+                self.assertEqual(bytes(records), bytes(expected[plan.locate(start)[3]:][:len(records)]))
+            self.assertEqual(b''.join(bytes(ecc.compute_ecc_hash_range(src_path, start, end, *args))
+                                      for start, end in ranges), bytes(expected))
+            with self.assertRaises(ValueError):
+                ecc.compute_ecc_hash_range(src_path, *ranges[0], *args, out=bytearray(10))
+
+    def test_ecc_tables_cache(self):
+        """
+        Tests that the generator polynomials are built on first use, loaded back from their cache file equal to the ones
+        of reedsolo, and built again when the cache file is damaged
+        """
+        import ecc
+        import tempfile
+        manager = ecc.ECCMan(255, 1, algo=3)
+        self.assertIsNone(manager._g)
+        ecc.init_reedsolo_tables(manager.gen_nb, manager.prim)
+        expected = ecc.reedsolo.rs_generator_poly_all(manager.n, fcr=manager.fcr, generator=manager.gen_nb)
+        args = (manager.n, manager.fcr, manager.gen_nb, manager.prim)
+        with tempfile.TemporaryDirectory() as tmp_dir, patch.object(ecc, 'tables_cache_dir', tmp_dir):
+            try:
+                ecc.generator_polys.cache_clear()
+                self.assertEqual(ecc.generator_polys(*args), expected)
+                cache_files = os.listdir(tmp_dir)
+                self.assertEqual(len(cache_files), 1)
+                # loaded from the file, without computing them
+                ecc.generator_polys.cache_clear()
+                with patch.object(ecc.reedsolo, 'rs_generator_poly_all', side_effect=AssertionError):
+                    self.assertEqual(ecc.generator_polys(*args), expected)
+                # a damaged file is replaced
+                with open(os.path.join(tmp_dir, cache_files[0]), 'r+b') as f:
+                    f.seek(100)
+                    f.truncate()
+                ecc.generator_polys.cache_clear()
+                self.assertEqual(ecc.generator_polys(*args), expected)
+                ecc.generator_polys.cache_clear()
+                with patch.object(ecc.reedsolo, 'rs_generator_poly_all', side_effect=AssertionError):
+                    self.assertEqual(ecc.generator_polys(*args), expected)
+                self.assertEqual(manager.g, expected)
+            finally:
+                ecc.generator_polys.cache_clear()
+
+    def test_ecc_sector_layout(self):
+        """
+        Tests that the sector-aligned layout repairs sectors lost in every group, as erasures
+        """
+        import ecc
+        import repair
+        import random
+        import tempfile
+        data = os.urandom(800000)
+        with tempfile.TemporaryDirectory() as work_dir, patch.object(ecc, 'sector_size', 2048):
+            src_path = os.path.join(work_dir, 'sectors.bin')
+            with open(src_path, 'wb') as f:
+                f.write(data)
+            ecc_dir = os.path.join(work_dir, 'ecc')
+            os.makedirs(ecc_dir)
+            self.assertTrue(ecc.generate_ecc(input_path=src_path, output_path=ecc_dir, workers=1))
+            # more unreadable sectors than the errors the ecc of any block can correct
+            damaged = bytearray(data)
+            for sector in random.sample(range(len(data) // 2048), len(data) // 2048 // 8):
+                damaged[sector * 2048:(sector + 1) * 2048] = bytes(2048)
+            with open(src_path, 'wb') as f:
+                f.write(damaged)
+            repair_dir = os.path.join(work_dir, 'repaired')
+            self.assertTrue(repair.correct_errors(src_path, repair_dir, os.path.join(ecc_dir, 'sectors.bin.txt'),
+                                                  callback=lambda x, y, z: None))
+            with open(os.path.join(repair_dir, 'sectors.bin'), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_ecc_exact_size(self, test_file='test.pdf'):
+        """
+        Tests that the size computed from the block plan is the size of the generated ECC files
+        """
+        import ecc
+        import tempfile
+        src_path = os.path.join(self.tests_dir, test_file)
+        with tempfile.TemporaryDirectory() as output_dir:
+            self.assertTrue(ecc.generate_ecc(input_path=src_path, output_path=output_dir))
+            ecc_path = os.path.join(output_dir, f'{test_file}.txt')
+            self.assertEqual(ecc.estimate_total_size(src_path),
+                             os.path.getsize(ecc_path) + os.path.getsize(ecc_path + '.idx'))
+
+    def test_ecc_parallel_encoder(self):
+        """
+        Tests that the ECC of a file encoded by ranges on a pool of processes is the same as when encoded serially
+        """
+        import ecc
+        import config
+        import random
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, 'random.bin')
+            with open(src_path, 'wb') as f:
+                f.write(random.Random(1).randbytes(600000))
+            databases = []
+            for workers in [1, 2]:
+                output_dir = os.path.join(tmp_dir, f'workers_{workers}')
+                os.makedirs(output_dir)
+                with patch.object(config, 'ecc_parallel_min_size', 1), \
+                        patch.object(config, 'ecc_range_size', 64 * 1024), \
+                        patch.object(ecc, 'parallel_compute_ecc_hash', wraps=ecc.parallel_compute_ecc_hash) as parallel:
+                    self.assertTrue(ecc.generate_ecc(src_path, output_dir, workers=workers))
+                self.assertEqual(parallel.called, workers > 1)
+                database = []
+                for extension in ['.txt', '.txt.idx']:
+                    with open(os.path.join(output_dir, 'random.bin' + extension), 'rb') as f:
+                        database.append(f.read())
+                databases.append(database)
+            self.assertEqual(databases[0], databases[1])
+
+    def test_ecc_resume(self):
+        """
+        Tests that an interrupted ECC generation resumes to the same database, restarts when its input changed and is
+        skipped once complete
+        """
+        import ecc
+        import config
+        import random
+        import itertools
+        import tempfile
+        from types import SimpleNamespace
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, 'random.bin')
+            reference_dir, output_dir = os.path.join(tmp_dir, 'reference'), os.path.join(tmp_dir, 'output')
+            os.makedirs(reference_dir)
+            os.makedirs(output_dir)
+            def database(directory):
+                with open(os.path.join(directory, 'random.bin.txt'), 'rb') as db, \
+                        open(os.path.join(directory, 'random.bin.txt.idx'), 'rb') as dbidx:
+                    return db.read(), dbidx.read()
+            def generate(directory, **kwargs):
+                with patch.object(config, 'ecc_range_size', 64 * 1024), \
+                        patch.object(ecc, 'write_entry_metadata', wraps=ecc.write_entry_metadata) as metadata:
+                    result = ecc.generate_ecc(src_path, directory, workers=1, **kwargs)
+                return result, metadata.called
+            def interrupted_generate():
+                # a clock that moves a second at every reading, so that the progress is reported after a few ranges
+                clock = itertools.count(1e9)
+                with patch.object(ecc, 'time', SimpleNamespace(time=lambda: next(clock))):
+                    return generate(output_dir, progress_function=lambda x, y, z: True, resume=False)[0]
+            def write_input(seed):
+                with open(src_path, 'wb') as f:
+                    f.write(random.Random(seed).randbytes(600000))
+            checkpoint_path = os.path.join(output_dir, 'random.bin.txt.ckpt')
+            write_input(1)
+            self.assertEqual(generate(reference_dir, resume=False), (True, True))
+            self.assertFalse(interrupted_generate())
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            self.assertFalse(checkpoint["complete"])
+            self.assertTrue(0 < checkpoint["input_offset"] < 600000)
+            # the rerun continues from the checkpoint, after the metadata of the entry
+            self.assertEqual(generate(output_dir), (True, False))
+            self.assertEqual(database(output_dir), database(reference_dir))
+            # the input changed after an interruption: its checkpoint doesn't match and the rerun starts over
+            self.assertFalse(interrupted_generate())
+            write_input(2)
+            self.assertIsNone(ecc.read_checkpoint(checkpoint_path, ecc.input_fingerprint(src_path, 'random.bin'),
+                                                  os.path.join(output_dir, 'random.bin.txt')))
+            self.assertEqual(generate(reference_dir, resume=False), (True, True))
+            self.assertEqual(generate(output_dir), (True, True))
+            self.assertEqual(database(output_dir), database(reference_dir))
+            # the complete checkpoint skips the file
+            with open(checkpoint_path) as f:
+                self.assertTrue(json.load(f)["complete"])
+            with patch.object(ecc, 'compute_ecc_hash_range') as encode:
+                self.assertEqual(generate(output_dir), (True, False))
+                self.assertFalse(encode.called)
+            self.assertEqual(database(output_dir), database(reference_dir))
+
+    def test_ecc_stream_encoder(self):
+        """
+        Tests that the ECC of a stream written in chunks of any size is the database of the complete file, and that
+        nothing is left when the stream doesn't have the announced size
+        """
+        import ecc
+        import io
+        import random
+        import tempfile
+        rng = random.Random(1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reference_dir, stream_dir = os.path.join(tmp_dir, 'reference'), os.path.join(tmp_dir, 'stream')
+            os.makedirs(reference_dir)
+            os.makedirs(stream_dir)
+            def database(directory, name):
+                with open(os.path.join(directory, name + '.txt'), 'rb') as db, \
+                        open(os.path.join(directory, name + '.txt.idx'), 'rb') as dbidx:
+                    return db.read(), dbidx.read()
+            for size in [0, 1, 1000, 3 * (1024 ** 2) + 123]:
+                name = f'random_{size}.bin'
+                data = rng.randbytes(size)
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(data)
+                self.assertTrue(ecc.generate_ecc(os.path.join(tmp_dir, name), reference_dir, workers=1))
+                # chunks of random sizes, across the ranges of blocks
+                chunks, pos = [], 0
+                while pos < size:
+                    chunks.append(data[pos:pos + rng.randint(1, 300000)])
+                    pos += len(chunks[-1])
+                ecc.stream_generate_ecc(chunks, stream_dir, name, size)
+                self.assertEqual(database(stream_dir, name), database(reference_dir, name))
+                # and a readable stream
+                ecc.stream_generate_ecc(io.BytesIO(data), stream_dir, name, size, chunk_size=4096)
+                self.assertEqual(database(stream_dir, name), database(reference_dir, name))
+            # fewer bytes than announced
+            with self.assertRaises(ValueError):
+                ecc.stream_generate_ecc([bytes(999)], stream_dir, 'short.bin', 1000)
+            # more bytes than announced
+            with self.assertRaises(ValueError):
+                ecc.stream_generate_ecc([bytes(600), bytes(600)], stream_dir, 'long.bin', 1000)
+            self.assertEqual(sorted(os.listdir(stream_dir)),
+                             sorted(name for name in os.listdir(reference_dir) if not name.endswith('.ckpt')))
+
+    def test_split_zip_ecc(self):
+        """
+        Tests that the ECC of the parts of a split ZIP is in the ECC cache, the same as if the parts were encoded
+        """
+        import zip as zip_module
+        import ecc_cache
+        import ecc
+        import config
+        import random
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            zip_path = os.path.join(tmp_dir, 'example.zip')
+            with open(zip_path, 'wb') as f:
+                f.write(random.Random(1).randbytes(250000))
+            parts_dir, fetch_dir, reference_dir = [os.path.join(tmp_dir, name)
+                                                   for name in ['parts', 'fetched', 'reference']]
+            for directory in [parts_dir, fetch_dir, reference_dir]:
+                os.makedirs(directory)
+            cache = ecc_cache.EccCache(os.path.join(tmp_dir, 'cache'), max_size=10 * (1024 ** 3))
+            worker = zip_module.SplitZipWorker(None, None)
+            with patch.object(config, 'ecc_stream_split_parts', True), \
+                    patch.object(ecc_cache, 'EccCache', lambda: cache):
+                self.assertTrue(worker.split_zip(100000, zip_path, parts_dir))
+            parts = sorted(os.listdir(parts_dir))
+            self.assertEqual(parts, [f'example.zip.part{i}_of_3' for i in range(1, 4)])
+            for part in parts:
+                part_path = os.path.join(parts_dir, part)
+                self.assertTrue(cache.fetch(part_path, fetch_dir))
+                self.assertTrue(ecc.generate_ecc(part_path, reference_dir, workers=1))
+                for extension in ['.txt', '.txt.idx']:
+                    with open(os.path.join(fetch_dir, part + extension), 'rb') as f, \
+                            open(os.path.join(reference_dir, part + extension), 'rb') as reference:
+                        self.assertEqual(f.read(), reference.read())
+
+    def test_ecc_resumable_run_dir(self):
+        """
+        Tests that the ECC worker only resumes the latest run when a file of its list was interrupted there
+        """
+        import compute_ecc
+        import ecc
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ['listed.bin', 'other.bin']:
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(os.urandom(1000))
+            worker = compute_ecc.EccWorker([{'directory': tmp_dir, 'file_name': 'listed.bin', 'ecc_checked': True}])
+            worker.working_dir = os.path.join(tmp_dir, 'runs')
+            run_dir = os.path.join(worker.working_dir, '20260101_000000')
+            os.makedirs(run_dir)
+            def interrupt(name, complete=False):
+                ecc.write_checkpoint(os.path.join(run_dir, name + '.txt.ckpt'), {
+                    "input_offset": 0, "db_offset": 0, "complete": complete,
+                    "fingerprint": ecc.input_fingerprint(os.path.join(tmp_dir, name), name)})
+            self.assertIsNone(worker.resumable_run_dir())
+            # a file that isn't in the list anymore doesn't hold back the next runs
+            interrupt('other.bin')
+            self.assertIsNone(worker.resumable_run_dir())
+            interrupt('listed.bin', complete=True)
+            self.assertIsNone(worker.resumable_run_dir())
+            interrupt('listed.bin')
+            self.assertEqual(worker.resumable_run_dir(), run_dir)
+            worker.file_list[0]['ecc_checked'] = False
+            self.assertIsNone(worker.resumable_run_dir())
+
+    def test_ecc_cache(self, test_file='test.pdf'):
+        """
+        Tests that the ECC cache gives back the same files, misses when the input changes and evicts over its limit
+        """
+        import ecc
+        import ecc_cache
+        import tempfile
+        import shutil
+        import filecmp
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, test_file)
+            shutil.copy2(os.path.join(self.tests_dir, test_file), src_path)
+            run_dirs = [os.path.join(tmp_dir, run) for run in ["run_1", "run_2"]]
+            for run_dir in run_dirs:
+                os.makedirs(run_dir)
+            cache = ecc_cache.EccCache(os.path.join(tmp_dir, "cache"), max_size=10 * (1024 ** 3))
+            self.assertFalse(cache.fetch(src_path, run_dirs[0]))
+            self.assertTrue(ecc.generate_ecc(input_path=src_path, output_path=run_dirs[0]))
+            cache.store(src_path, run_dirs[0])
+            self.assertTrue(cache.fetch(src_path, run_dirs[1]))
+            for filename in cache.entry_filenames(src_path):
+                self.assertTrue(filecmp.cmp(os.path.join(run_dirs[0], filename), os.path.join(run_dirs[1], filename),
+                                            shallow=False))
+            # a modified file is a different entry
+            with open(src_path, 'ab') as f:
+                f.write(b'crypto-disco')
+            self.assertFalse(cache.fetch(src_path, run_dirs[1]))
+            # nothing fits in a cache of 1 byte
+            cache.max_size = 1
+            with cache.lock:
+                cache.evict()
+            self.assertEqual(os.listdir(cache.entries_dir), [])
+
+    def test_ecc_concurrent_files(self):
+        """
+        Tests that the files encoded at the same time by the ECC worker get the databases of a serial generation, and
+        that a canceled worker stops without finishing
+        """
+        import compute_ecc
+        import ecc_cache
+        import ecc
+        import config
+        import random
+        import itertools
+        import threading
+        import tempfile
+        import time
+        from types import SimpleNamespace
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i in range(3):
+                files.append(os.path.join(tmp_dir, f'random_{i}.bin'))
+                with open(files[-1], 'wb') as f:
+                    f.write(random.Random(i).randbytes(300000 + 1000 * i))
+            reference_dir, run_dir = os.path.join(tmp_dir, 'reference'), os.path.join(tmp_dir, 'run')
+            os.makedirs(reference_dir)
+            os.makedirs(run_dir)
+            for file in files:
+                self.assertTrue(ecc.generate_ecc(file, reference_dir, workers=1))
+            worker = compute_ecc.EccWorker([{'directory': tmp_dir, 'file_name': os.path.basename(file),
+                                             'ecc_checked': True} for file in files])
+            worker.working_dir = os.path.join(tmp_dir, 'runs')
+            worker.cache = ecc_cache.EccCache(os.path.join(tmp_dir, 'cache'), max_size=10 * (1024 ** 3))
+            worker.start = time.time()
+            worker.files_done = 0
+            # every file waits for the others, so that they are all encoded at the same time
+            barrier = threading.Barrier(len(files), timeout=60)
+            generate_ecc = ecc.generate_ecc
+            def concurrent_generate_ecc(*args, **kwargs):
+                barrier.wait()
+                return generate_ecc(*args, **kwargs)
+            with patch.object(config, 'ecc_concurrent_files', len(files)), \
+                    patch.object(config, 'ecc_parallel_min_size', 1), \
+                    patch.object(config, 'ecc_range_size', 64 * 1024), \
+                    patch.object(ecc, 'generate_ecc', concurrent_generate_ecc), \
+                    ecc.ecc_process_pool(2) as executor:
+                self.assertTrue(worker.generate_files_ecc(files, run_dir, 2, executor))
+            for file in files:
+                self.assertTrue(worker.cache.contains(file))
+                for extension in ['.txt', '.txt.idx']:
+                    name = os.path.basename(file) + extension
+                    with open(os.path.join(run_dir, name), 'rb') as f, \
+                            open(os.path.join(reference_dir, name), 'rb') as reference:
+                        self.assertEqual(f.read(), reference.read())
+            # canceled at the first progress of a file, the worker returns without finishing nor an error
+            canceled = compute_ecc.EccWorker(worker.file_list)
+            canceled.working_dir = os.path.join(tmp_dir, 'canceled')
+            canceled.cache = ecc_cache.EccCache(max_size=0)
+            signals = []
+            canceled.signals.finished.connect(lambda: signals.append('finished'))
+            canceled.signals.error.connect(lambda e: signals.append(e))
+            update_progress = canceled.update_progress
+            def cancel_progress(*args):
+                canceled.cancel_task()
+                return update_progress(*args)
+            canceled.update_progress = cancel_progress
+            # a clock that moves a second at every reading, so that the progress is reported after a few ranges
+            clock = itertools.count(1e9)
+            with patch.object(config, 'ecc_workers', 2), \
+                    patch.object(config, 'ecc_concurrent_files', 2), \
+                    patch.object(config, 'ecc_parallel_min_size', 1), \
+                    patch.object(config, 'ecc_range_size', 64 * 1024), \
+                    patch.object(config, 'ecc_archive_name', None), \
+                    patch.object(config, 'ecc_recovery_percent', 0), \
+                    patch.object(ecc, 'time', SimpleNamespace(time=lambda: next(clock),
+                                                              perf_counter=time.perf_counter)):
+                self.assertTrue(canceled.run())
+            self.assertTrue(canceled.shutdown)
+            self.assertEqual(signals, [])
+
+    def test_ecc_speculative(self, test_file='test.pdf'):
+        """
+        Tests that the background ECC of an added file lands in the ECC cache, and that a canceled one doesn't
+        """
+        import compute_ecc
+        import ecc_cache
+        import tempfile
+        from PySide6.QtCore import QThreadPool
+        src_path = os.path.join(self.tests_dir, test_file)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ecc_cache.EccCache(tmp_dir, max_size=10 * (1024 ** 3))
+            canceled = compute_ecc.SpeculativeEccWorker(src_path, cache=cache)
+            canceled.cancel_task()
+            worker = compute_ecc.SpeculativeEccWorker(src_path, cache=cache)
+            pool = QThreadPool()
+            for w in [canceled, worker]:
+                pool.start(w)
+            pool.waitForDone()
+            self.assertFalse(canceled.done)
+            self.assertTrue(worker.done)
+            self.assertTrue(cache.contains(src_path))
+
+    def test_ecc_archive(self, test_file='test.pdf'):
+        """
+        Tests that a single ECC database for a directory tree repairs one of its entries
+        """
+        import repair
+        import utils
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tree_dir, ecc_path = self.archive_tree(tmp_dir, test_file)
+            self.assertEqual(len(repair.read_entry_offsets(ecc_path + '.idx')), 3)
+            entry = f'dir_1/{test_file}'
+            utils.tamper_file(os.path.join(tree_dir, entry))
+            repair_dir = os.path.join(tmp_dir, 'repaired')
+            os.makedirs(repair_dir)
+            self.assertTrue(repair.correct_errors(tree_dir, repair_dir, ecc_path, callback=lambda x, y, z: None,
+                                                  entries=[entry]))
+            self.assertEqual(utils.file_hash(os.path.join(repair_dir, entry)),
+                             utils.file_hash(os.path.join(self.tests_dir, test_file)))
+
+    def test_ecc_database_reader(self, test_file='test.pdf'):
+        """
+        Tests that the entries of a database are found from its index, and by scanning it when the index is missing
+        """
+        import repair
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tree_dir, ecc_path = self.archive_tree(tmp_dir, test_file)
+            with repair.EccDatabase(ecc_path) as database:
+                self.assertTrue(database.indexed)
+                self.assertEqual(len(database), 3)
+                positions = database.positions
+                self.assertEqual(database.fields(2)["relfilepath"], f'dir_2/{test_file}'.encode())
+                self.assertEqual(database.entry_numbers(), {f'dir_{i}/{test_file}': i for i in range(3)})
+            # an entry is repaired without reading the metadata of the others
+            with patch.object(repair, 'ecc_correct_intra_stream', wraps=repair.ecc_correct_intra_stream) as intra:
+                self.assertTrue(repair.correct_errors(tree_dir, os.path.join(tmp_dir, 'repaired'), ecc_path,
+                                                      callback=lambda x, y, z: None, entries=[f'dir_2/{test_file}']))
+                self.assertEqual(intra.call_count, 2) # its path and its size
+            os.remove(ecc_path + '.idx')
+            with repair.EccDatabase(ecc_path) as database:
+                self.assertFalse(database.indexed)
+                self.assertEqual(database.positions, positions)
+                self.assertEqual(database.fields(1)["relfilepath"], f'dir_1/{test_file}'.encode())
+
+    def test_ecc_single_pass_repair(self, test_file='test.pdf'):
+        """
+        Tests that the repair writes the output while checking the file, and leaves nothing when it was healthy
+        """
+        import repair
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path, ecc_path = self.copy_with_ecc(tmp_dir, test_file=test_file)
+            with open(file_path, 'rb') as f:
+                original = f.read()
+            repair_dir = os.path.join(tmp_dir, 'repaired')
+            progress = []
+            self.assertTrue(repair.correct_errors(file_path, repair_dir, ecc_path,
+                                                  callback=lambda x, y, z: progress.append((x, y, z))))
+            self.assertEqual(os.listdir(repair_dir), [])
+            # the healthy blocks are reported as they are checked, before the end of the repair
+            self.assertEqual(progress[-2][1], len(original))
+            with open(file_path, 'r+b') as f:
+                f.seek(len(original) // 2)
+                f.write(bytes(b ^ 0xff for b in original[len(original) // 2:len(original) // 2 + 3]))
+            self.assertTrue(repair.correct_errors(file_path, repair_dir, ecc_path, callback=lambda x, y, z: None))
+            self.assertEqual(os.listdir(repair_dir), [test_file])
+            with open(os.path.join(repair_dir, test_file), 'rb') as f:
+                self.assertEqual(f.read(), original)
+
+    def test_ecc_renamed_file_repair(self, test_file='test.pdf'):
+        """
+        Tests that a file without an entry in the database, renamed or not in the archive, is reported as missing
+        """
+        import repair
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path, ecc_path = self.copy_with_ecc(tmp_dir, 'original.pdf', test_file=test_file)
+            renamed_path = os.path.join(tmp_dir, 'renamed.pdf')
+            os.rename(file_path, renamed_path)
+            with open(renamed_path, 'r+b') as f:
+                f.seek(1000)
+                f.write(bytes(3))
+            repair_dir = os.path.join(tmp_dir, 'repaired')
+            report = []
+            repair.correct_errors(renamed_path, repair_dir, ecc_path, callback=lambda x, y, z: None, report=report)
+            self.assertEqual(report, [{"path": 'original.pdf', "status": "missing"}])
+            self.assertFalse(os.path.exists(os.path.join(repair_dir, 'renamed.pdf')))
+            # an entry asked for that the archive doesn't have
+            tree_dir, archive_path = self.archive_tree(tmp_dir, test_file)
+            report = []
+            repair.correct_errors(tree_dir, repair_dir, archive_path, callback=lambda x, y, z: None,
+                                  entries=[f'dir_1/{test_file}', f'dir_9/{test_file}'], report=report)
+            self.assertEqual([(result["path"], result["status"]) for result in report],
+                             [(f'dir_1/{test_file}', 'healthy'), (f'dir_9/{test_file}', 'missing')])
+
+    def test_ecc_parallel_repair(self, test_file='test.pdf'):
+        """
+        Tests that the corrupted blocks decoded by the processes of a repair are reported like when decoded serially
+        """
+        import repair
+        import config
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path, ecc_path = self.copy_with_ecc(tmp_dir, test_file=test_file)
+            with open(file_path, 'r+b') as f:
+                for offset in range(0, os.path.getsize(file_path), 700):
+                    f.seek(offset)
+                    f.write(bytes(20 if offset % 1400 else 80)) # some blocks can't be repaired
+            reports = []
+            for workers in [1, 2]:
+                progress = []
+                with patch.object(config, 'ecc_repair_workers', workers), \
+                        patch.object(config, 'ecc_repair_parallel_min_blocks', 1):
+                    repair.correct_errors(file_path, os.path.join(tmp_dir, f'repaired_{workers}'), ecc_path,
+                                          enable_erasures=True, callback=lambda x, y, z: progress.append(z))
+                with open(os.path.join(tmp_dir, f'repaired_{workers}', test_file), 'rb') as f:
+                    reports.append((progress, f.read()))
+            self.assertIn("could not repair", "".join(reports[0][0]))
+            self.assertEqual(reports[0], reports[1])
+
+    def test_ecc_scrub(self, test_file='test.pdf'):
+        """
+        Tests that a scrub reports the damaged and unprotected files of a folder without writing into it
+        """
+        import scrub
+        import tempfile
+        import shutil
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            disc_dir = os.path.join(tmp_dir, 'disc')
+            os.makedirs(os.path.join(disc_dir, 'ECC'))
+            for name in ['damaged.pdf', 'healthy.pdf']:
+                self.copy_with_ecc(disc_dir, name, os.path.join(disc_dir, 'ECC'), test_file)
+            shutil.copy2(os.path.join(self.tests_dir, test_file), os.path.join(disc_dir, 'unprotected.pdf'))
+            with open(os.path.join(disc_dir, 'damaged.pdf'), 'r+b') as f:
+                f.seek(1000)
+                f.write(bytes(3))
+            disc_files = sorted(os.listdir(disc_dir)) + sorted(os.listdir(os.path.join(disc_dir, 'ECC')))
+            report_path = os.path.join(tmp_dir, 'report.json')
+            progress = []
+            report = scrub.scrub_disc(disc_dir, report_path, io_budget=0,
+                                      progress_function=lambda x, y, z: progress.append(z))
+            # at most once per second and once at the end, not for every block
+            self.assertLessEqual(len(progress), report["elapsed"] + 2)
+            self.assertEqual(sorted(os.listdir(disc_dir)) + sorted(os.listdir(os.path.join(disc_dir, 'ECC'))),
+                             disc_files)
+            with open(report_path) as f:
+                self.assertEqual(json.load(f), report)
+            self.assertEqual({path: result["status"] for path, result in report["files"].items()},
+                             {'damaged.pdf': 'correctable', 'healthy.pdf': 'healthy',
+                              'unprotected.pdf': 'unprotected'})
+            self.assertEqual(report["files"]["damaged.pdf"]["bad_blocks"], 1)
+            self.assertEqual(report["files"]["damaged.pdf"]["correctable_blocks"], 1)
+            self.assertTrue(report["correctable"])
+
+    def test_iso_ecc_sidecar(self):
+        """
+        Tests that the ECC sidecar of an image is written next to it and repairs the damaged image
+        """
+        import iso
+        import repair
+        import random
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            iso_path = os.path.join(tmp_dir, 'disc.iso')
+            original = random.Random(1).randbytes(500000)
+            with open(iso_path, 'wb') as f:
+                f.write(original)
+            worker = iso.IsoWorker(iso_path, [], tmp_dir, 'M-Disc DVD 4.7 GB')
+            self.assertTrue(worker.generate_iso_ecc())
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ['disc.iso', 'disc.iso.txt', 'disc.iso.txt.idx'])
+            with open(iso_path, 'r+b') as f:
+                for offset in range(1000, len(original), 100000):
+                    f.seek(offset)
+                    f.write(bytes(4))
+            repair_dir = os.path.join(tmp_dir, 'repaired')
+            self.assertTrue(repair.correct_errors(iso_path, repair_dir, iso_path + '.txt',
+                                                  callback=lambda x, y, z: None))
+            with open(os.path.join(repair_dir, 'disc.iso'), 'rb') as f:
+                self.assertEqual(f.read(), original)
+
+    def test_hashers(self):
+        """
+        Tests that every hasher returns digests of its announced length, which determines the layout of ECC databases
+        """
+        import utils
+        for algo in utils.Hasher.known_algo:
+            hasher = utils.Hasher(algo)
+            for message in [b"", b"crypto-disco", bytearray(range(255)), memoryview(bytes(200))]:
+                self.assertEqual(len(hasher.hash(message)), len(hasher), algo)
+
 class SecurityScan(unittest.TestCase):
     def test_security_bandit(self):
         """
@@ -6,6 +6,7 @@ Please note that there may not be a coherent structure to this class and it's me
 from PySide6.QtCore import QObject, Signal, QFile
 from PySide6.QtWidgets import (QVBoxLayout, QPushButton, QLineEdit, QDialog, QMessageBox)
 import hashlib
+import zlib
 from base64 import b64encode
 import codecs
 import os, sys
@@ -39,43 +40,46 @@ class Hasher(object):
     Class to provide a hasher object with various hashing algorithms. What's important is to provide the __len__ so that
     we can easily compute the block size of ecc entries. Must only use fixed size hashers for the rest of the script to\
     work properly.
+    The hash function is chosen once when the hasher is created. md5 is the hexadecimal digest of the ecc databases
+    version 3, blake2b-N (N bytes) and crc32 store binary digests in the databases version 4.
     '''
 
-    known_algo = ["md5", "shortmd5", "shortsha256", "minimd5", "minisha256", "none"]
-    __slots__ = ['algo', 'length']
+    known_algo = ["md5", "shortmd5", "shortsha256", "minimd5", "minisha256", "none", "blake2b-4", "blake2b-8",
+                  "blake2b-16", "blake2b-32", "crc32"]
+    __slots__ = ['algo', 'length', 'hash']
 
     def __init__(self, algo="md5"):
         # Store the selected hashing algo
         self.algo = algo.lower()
-        # Precompute length so that it's very fast to access it later
-        if self.algo == "md5":
-            self.length = 32
-        elif self.algo == "shortmd5" or self.algo == "shortsha256":
-            self.length = 8
-        elif self.algo == "minimd5" or self.algo == "minisha256":
-            self.length = 4
-        elif self.algo == "none":
-            self.length = 0
-        else:
-            raise NameError('Hashing algorithm %s is unknown!' % algo)
-
-    def hash(self, mes):
+        # Select the hash function and precompute length so that it's very fast to access it later
         # use hashlib.algorithms_guaranteed to list algorithms
-        mes = b(mes)
         if self.algo == "md5":
-            return b(hashlib.md5(mes).hexdigest()) # nosec hash used for ECC, not security
+            self.length = 32
+            self.hash = lambda mes: b(hashlib.md5(b(mes)).hexdigest()) # nosec hash used for ECC, not security
         elif self.algo == "shortmd5":  # from: http://www.peterbe.com/plog/best-hashing-function-in-python
-            return b64encode(b(hashlib.md5(mes).hexdigest()))[:8] # nosec hash used for ECC, not security
+            self.length = 8
+            self.hash = lambda mes: b64encode(b(hashlib.md5(b(mes)).hexdigest()))[:8] # nosec hash used for ECC
         elif self.algo == "shortsha256":
-            return b64encode(b(hashlib.sha256(mes).hexdigest()))[:8]
+            self.length = 8
+            self.hash = lambda mes: b64encode(b(hashlib.sha256(b(mes)).hexdigest()))[:8]
         elif self.algo == "minimd5":
-            return b64encode(b(hashlib.md5(mes).hexdigest()))[:4] # nosec hash used for ECC, not security
+            self.length = 4
+            self.hash = lambda mes: b64encode(b(hashlib.md5(b(mes)).hexdigest()))[:4] # nosec hash used for ECC
         elif self.algo == "minisha256":
-            return b64encode(b(hashlib.sha256(mes).hexdigest()))[:4]
+            self.length = 4
+            self.hash = lambda mes: b64encode(b(hashlib.sha256(b(mes)).hexdigest()))[:4]
+        elif self.algo in self.known_algo and self.algo.startswith("blake2b-"):
+            self.length = int(self.algo.split("-")[1])
+            digest_size = self.length
+            self.hash = lambda mes: hashlib.blake2b(b(mes), digest_size=digest_size).digest()
+        elif self.algo == "crc32":
+            self.length = 4
+            self.hash = lambda mes: zlib.crc32(b(mes)).to_bytes(4, 'big')
         elif self.algo == "none":
-            return ''
+            self.length = 0
+            self.hash = lambda mes: b''
         else:
-            raise NameError('Hashing algorithm %s is unknown!' % self.algo)
+            raise NameError('Hashing algorithm %s is unknown!' % algo)
 
     def __len__(self):
         return self.length
@@ -154,6 +158,19 @@ def file_hash(path):
             file_hash.update(chunk)
     return file_hash.hexdigest()
 
+def preallocate_file(file, size):
+    '''
+    Reserve the final size of a file opened for writing, so that the filesystem allocates it at once instead of growing
+    it write after write. Truncate the file at its final position afterwards in case less was written.
+    '''
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(file.fileno(), 0, size)
+        else:
+            file.truncate(size)
+    except OSError:
+        pass # not supported by this filesystem, the file will simply grow
+
 def disc_type_bytes(disc_type):
     '''
     Provides the number of bytes based on the disc type from the list
@@ -2,11 +2,14 @@ from PySide6.QtCore import QRunnable, Slot, Qt, QFileInfo
 from PySide6.QtWidgets import (QWizardPage, QHBoxLayout, QVBoxLayout, QLabel, QPushButton, QFileDialog, QLineEdit,
                                QDialog, QComboBox, QTableWidget, QTableWidgetItem, QMessageBox, QProgressBar,
                                QPlainTextEdit)
+from contextlib import ExitStack
 import pyzipper
 import zipfile
 import traceback
 import config
 import utils
+import ecc
+import ecc_cache
 import pathlib
 import os
 import math
@@ -389,19 +392,36 @@ class SplitZipWorker(QRunnable):
         bytes_per_part = math.ceil(total_zip_bytes / num_splits)
         self.signals.progress_text.emit(f"Max size per part: {utils.total_size_str(bytes_per_part)}")
         chunk_size = 100 * 1024 * 1024 # 100 MB, write each part chunk by chunk
+        # the ECC of each part is computed from the chunks as they are written and kept in the ECC cache, so that the
+        # parts are not read again when they are burned with ECC
+        cache = ecc_cache.EccCache()
+        stream_ecc = config.ecc_stream_split_parts and cache.enabled
         with open(input_path, 'rb') as f:
             for i in range(num_splits):
                 part_file_name = f"{os.path.basename(input_path)}.part{i + 1}_of_{num_splits}"
+                part_path = os.path.join(output_dir, part_file_name)
                 self.signals.progress_text.emit(f"Creating part {part_file_name} . . .")
-                with open(os.path.join(output_dir, part_file_name), 'wb') as part_file:
+                with ExitStack() as stack:
+                    part_file = stack.enter_context(open(part_path, 'wb'))
+                    encoder = None
+                    if stream_ecc:
+                        part_size = min(bytes_per_part, max(0, total_zip_bytes - i * bytes_per_part))
+                        ecc_dir = stack.enter_context(cache.staging())
+                        encoder = stack.enter_context(ecc.StreamEccEncoder(ecc_dir, part_file_name, part_size))
                     bytes_written = 0
                     while bytes_written < bytes_per_part:
                         chunk = f.read(min(chunk_size, bytes_per_part - bytes_written))
                         if not chunk:
                             break
                         part_file.write(chunk)
+                        if encoder:
+                            encoder.write(chunk)
                         bytes_written += len(chunk)
                         self.signals.progress.emit((bytes_written / bytes_per_part) * 100)
+                    if encoder:
+                        part_file.close() # the cache entry is keyed on the final modification time
+                        encoder.close()
+                        cache.store(part_path, ecc_dir)
                 self.signals.progress_text.emit(f"Created part: {part_file_name}")
                 self.signals.progress.emit(((i + 1) / num_splits) * 100)
         self.signals.progress.emit("Done")